@@ -0,0 +1,119 @@
+"""
+Benchmark PersistentSessionMemory throughput against the number of active calls.
+
+Every simulated call records --turns user/assistant message pairs. Meanwhile
+a background thread keeps summarizing finished calls, with an LLM stand-in
+that sleeps for --summary-ms. The 'session' mode is the real per-session
+locking. The 'global' mode wraps every method in one shared lock, which is
+how the class behaved before.
+
+Usage:
+    python scripts/benchmark_session_memory.py --calls 1 2 4 8 16 --turns 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.agent_services as agent_services
+from server.db import Base
+from server.log_writer import ConversationLogWriter
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+class GloballyLockedMemory(agent_services.PersistentSessionMemory):
+    """The previous behavior: one lock around every operation, including DB and LLM work."""
+
+    def __init__(self, writer):
+        super().__init__(writer)
+        self._global = threading.RLock()
+
+    def get_session(self, *args, **kwargs):
+        with self._global:
+            return super().get_session(*args, **kwargs)
+
+    def add_message(self, *args, **kwargs):
+        with self._global:
+            return super().add_message(*args, **kwargs)
+
+    def summarize_and_save(self, *args, **kwargs):
+        with self._global:
+            return super().summarize_and_save(*args, **kwargs)
+
+
+def run(memory, calls: int, turns: int, think_seconds: float) -> dict:
+    stop = threading.Event()
+
+    def summarize_continuously():
+        # Keep one call being summarized at all times, like calls ending back to back
+        while not stop.is_set():
+            memory.summarize_and_save("CA-finished")
+
+    def call(index: int):
+        session_id = f"CA-{calls}-{index}"
+        phone = f"+1555{calls:03d}{index:04d}"
+        for turn in range(turns):
+            memory.add_message(session_id, "User", f"Question {turn}", phone_number=phone)
+            time.sleep(think_seconds)
+            memory.add_message(session_id, "Assistant", f"Answer {turn}", phone_number=phone)
+
+    summarizer = threading.Thread(target=summarize_continuously, daemon=True)
+    summarizer.start()
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(calls)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    summarizer.join()
+    messages = calls * turns * 2
+    return {"calls": calls, "messages": messages, "elapsed_s": round(elapsed, 3), "messages_per_s": round(messages / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PersistentSessionMemory concurrency benchmark")
+    parser.add_argument("--calls", type=int, nargs="*", default=[1, 2, 4, 8, 16], help="Concurrent active calls")
+    parser.add_argument("--turns", type=int, default=20, help="Turns per call")
+    parser.add_argument("--summary-ms", type=float, default=200.0, help="Simulated LLM summarization time")
+    parser.add_argument("--think-ms", type=float, default=5.0, help="Simulated pipeline time between messages of a turn")
+    parser.add_argument("--modes", nargs="*", default=["global", "session"], help="Locking modes to measure")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        agent_services.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        writer = ConversationLogWriter(agent_services.SessionLocal)
+        agent_services.ensure_db_initialized = lambda: None
+
+        def fake_summary(history):
+            time.sleep(args.summary_ms / 1000.0)
+            return f"{len(history)} messages"
+
+        agent_services.summarize_conversation = fake_summary
+
+        report = {}
+        for mode in args.modes:
+            memory = GloballyLockedMemory(writer) if mode == "global" else agent_services.PersistentSessionMemory(writer)
+            memory.add_message("CA-finished", "User", "Done", phone_number="+15550000000")
+            report[mode] = [run(memory, calls, args.turns, args.think_ms / 1000.0) for calls in args.calls]
+        writer.close()
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark the memory taken by cached conversation histories.
+
+Builds --sessions histories of --turns turns each, two ways, and measures
+the allocated memory with tracemalloc:
+  - legacy: dict of lists of (role, content) tuples, with role strings
+    created per row as they are when loaded from the database
+  - store: SessionStore of TurnHistory (one role byte per turn, interned roles)
+Content strings are shared by both and created before measuring, so the
+figures are the overhead on top of the text. It then replays a call
+workload against a capped store with a fake clock, where --abandon-rate of
+the calls never reach clear_session. The report shows how the TTL and the
+size cap bound the store.
+
+Usage:
+    python scripts/benchmark_session_store.py --sessions 10000 --turns 20
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import logging
+import tracemalloc
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.session_store import SESSION_SWEEP_SECONDS, SessionStore
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+WORDS = "please book an appointment for next monday morning with doctor mehta about my knee pain thanks".split()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_turns(sessions: int, turns: int, rng: random.Random):
+    return [[" ".join(rng.choices(WORDS, k=rng.randint(4, 16))) for _ in range(turns)] for _ in range(sessions)]
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del keep
+    return used
+
+
+def build_legacy(contents):
+    def build():
+        sessions = {}
+        for index, session_turns in enumerate(contents):
+            # Role strings read from DB rows are distinct objects
+            sessions[f"CA{index:032d}"] = [("".join(["Us", "er"]) if i % 2 == 0 else "".join(["Assis", "tant"]), text)
+                                           for i, text in enumerate(session_turns)]
+        return sessions
+    return build
+
+
+def build_store(contents):
+    def build():
+        store = SessionStore(ttl_seconds=10**9, max_bytes=10**12)
+        for index, session_turns in enumerate(contents):
+            store.put(f"CA{index:032d}", [("".join(["Us", "er"]) if i % 2 == 0 else "".join(["Assis", "tant"]), text)
+                                          for i, text in enumerate(session_turns)])
+        return store
+    return build
+
+
+def churn(contents, ttl_seconds: float, max_mb: float, abandon_rate: float, rng: random.Random) -> dict:
+    """Calls arrive one per simulated second; a share of them never send /voice/end."""
+    clock = FakeClock()
+    store = SessionStore(ttl_seconds=ttl_seconds, max_bytes=int(max_mb * 1024 * 1024), clock=clock)
+    peak = 0
+    for index, session_turns in enumerate(contents):
+        session_id = f"CA{index:032d}"
+        for i, text in enumerate(session_turns):
+            store.append(session_id, "User" if i % 2 == 0 else "Assistant", text, create=True)
+        if rng.random() >= abandon_rate:
+            store.pop(session_id)
+        clock.now += 1.0
+        peak = max(peak, store.stats()["bytes"])
+    stats = store.stats()
+    stats["peak_bytes"] = peak
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session history memory benchmark")
+    parser.add_argument("--sessions", type=int, default=10_000, help="Cached sessions")
+    parser.add_argument("--turns", type=int, default=20, help="Turns per session")
+    parser.add_argument("--ttl", type=float, default=1800.0, help="Idle TTL for the churn run (simulated seconds)")
+    parser.add_argument("--max-mb", type=float, default=8.0, help="Size cap for the churn run")
+    parser.add_argument("--abandon-rate", type=float, default=0.3, help="Share of calls that never clear their session")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    contents = make_turns(args.sessions, args.turns, rng)
+    content = sum(sys.getsizeof(text) for session_turns in contents for text in session_turns)
+    legacy = measure(build_legacy(contents))
+    stored = measure(build_store(contents))
+    churned = churn(make_turns(args.sessions * 5, args.turns, rng), args.ttl, args.max_mb, args.abandon_rate, rng)
+    print(json.dumps({
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "content_mb": round(content / 2**20, 2),
+        "legacy_overhead_mb": round(legacy / 2**20, 2),
+        "store_overhead_mb": round(stored / 2**20, 2),
+        "saved_pct_of_total": round(100.0 * (legacy - stored) / (legacy + content), 1),
+        "churn": {"calls": args.sessions * 5, "ttl_s": args.ttl, "sweep_s": SESSION_SWEEP_SECONDS, **churned},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark the import cost of the server modules.
+
+Each module is imported in a fresh interpreter several times and the median
+wall time is reported. With --max-seconds the script exits non-zero when any
+import exceeds the budget, so it can guard against a model creeping back into
+import time.
+
+Usage:
+    python scripts/benchmark_startup.py --runs 5 --max-seconds 2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["server.agent_services", "server.main"]
+
+
+def time_import(module: str) -> float:
+    """Import a module in a fresh interpreter and return the wall time in seconds."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=PROJECT_ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server import-time benchmark")
+    parser.add_argument("--modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail if a median import exceeds this")
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_import("sys") for _ in range(args.runs))
+    results = []
+    for module in args.modules:
+        timings = [time_import(module) for _ in range(args.runs)]
+        results.append({
+            "module": module,
+            "median_s": round(statistics.median(timings), 3),
+            "max_s": round(max(timings), 3),
+        })
+    print(json.dumps({"interpreter_s": round(baseline, 3), "results": results}, indent=2))
+
+    if args.max_seconds is not None:
+        slow = [r["module"] for r in results if r["median_s"] > args.max_seconds]
+        if slow:
+            print(f"Import budget of {args.max_seconds}s exceeded by: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
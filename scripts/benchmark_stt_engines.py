@@ -0,0 +1,135 @@
+"""
+Compare speech-to-text engines on the test clips.
+
+Loads each engine from server/stt_engines.py, warms it up and transcribes
+every clip --repeat times. Reports the load time, the real-time factor
+(processing seconds per second of audio, lower is better; below 1 is faster
+than real time) and the word error rate against the reference text. By
+default the references are the sentences that scripts/generate_test_audio.py
+speaks into test1.wav to test3.wav. Other clips need a JSON file mapping file
+name to text (--references).
+
+Usage:
+    python scripts/generate_test_audio.py
+    python scripts/benchmark_stt_engines.py --engines whisper faster-whisper --model base
+    python scripts/benchmark_stt_engines.py --engines faster-whisper --compute-type int8_float32 --clips a.wav --references refs.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_test_audio import TEST_SENTENCES
+from server.audio_codec import WHISPER_SAMPLE_RATE, decode_audio
+from server.stt_engines import STT_ENGINES, FasterWhisperEngine, load_stt_engine
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> list:
+    """Lowercase words without punctuation, so 'Dr. Mehta,' matches 'dr mehta'."""
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def edit_distance(reference: list, hypothesis: list) -> int:
+    """Word-level Levenshtein distance (substitutions + deletions + insertions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def load_references(path: str) -> dict:
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return {filename: text for text, filename in TEST_SENTENCES}
+
+
+def load_engine(name: str, model: str, compute_type: str):
+    if name == "faster-whisper" and compute_type:
+        return FasterWhisperEngine(model, compute_type=compute_type)
+    return load_stt_engine(name, model)
+
+
+def run_engine(name: str, model: str, compute_type: str, clips: dict, references: dict, repeat: int) -> dict:
+    started = time.perf_counter()
+    engine = load_engine(name, model, compute_type)
+    load_seconds = time.perf_counter() - started
+    try:
+        engine.transcribe(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32))
+        results = []
+        errors = words = 0
+        total_audio = total_busy = 0.0
+        for clip, audio in clips.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                text = engine.transcribe(audio)
+                timings.append(time.perf_counter() - started)
+            audio_seconds = audio.size / WHISPER_SAMPLE_RATE
+            busy = float(np.median(timings))
+            total_audio += audio_seconds
+            total_busy += busy
+            result = {"clip": clip, "audio_s": round(audio_seconds, 2), "transcribe_s": round(busy, 3),
+                      "rtf": round(busy / audio_seconds, 3), "text": text}
+            reference = references.get(os.path.basename(clip))
+            if reference is not None:
+                ref_words = normalize(reference)
+                distance = edit_distance(ref_words, normalize(text))
+                result["wer"] = round(distance / max(1, len(ref_words)), 3)
+                errors += distance
+                words += len(ref_words)
+            results.append(result)
+    finally:
+        engine.close()
+    return {
+        "engine": name,
+        "model": model,
+        "compute_type": compute_type if name == "faster-whisper" else None,
+        "load_s": round(load_seconds, 2),
+        "rtf": round(total_busy / total_audio, 3) if total_audio else None,
+        "wer": round(errors / words, 3) if words else None,
+        "clips": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speech-to-text engine benchmark")
+    parser.add_argument("--engines", nargs="*", default=list(STT_ENGINES), choices=STT_ENGINES, help="Engines to compare")
+    parser.add_argument("--model", default="base", help="Whisper model size or path")
+    parser.add_argument("--compute-type", default=None, help="faster-whisper compute type (default: CLINICGUARD_FASTER_WHISPER_COMPUTE_TYPE)")
+    parser.add_argument("--clips", nargs="*", default=[filename for _, filename in TEST_SENTENCES], help="Audio clips to transcribe")
+    parser.add_argument("--references", default=None, help="JSON file mapping clip file name to reference text")
+    parser.add_argument("--repeat", type=int, default=3, help="Transcriptions per clip (median time is reported)")
+    args = parser.parse_args()
+
+    clips = {}
+    for path in args.clips:
+        if not os.path.exists(path):
+            logger.warning(f"Skipping missing clip {path}")
+            continue
+        with open(path, "rb") as f:
+            clips[path] = decode_audio(f.read())
+    if not clips:
+        sys.exit("No clips found; run scripts/generate_test_audio.py first")
+
+    references = load_references(args.references)
+    results = [run_engine(name, args.model, args.compute_type, clips, references, args.repeat) for name in args.engines]
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Load test for the Twilio voice webhooks.
+
+Simulates N concurrent callers. Each caller places calls the way Twilio
+drives the record mode: POST /twilio/voice/answer, then --turns recorded
+turns to /twilio/voice, each followed by fetching the <Play> reply audio,
+then POST /twilio/voice/end. A local HTTP server
+stands in for Twilio's recording storage and serves the same WAV for
+every RecordingUrl.
+
+By default the app runs in-process under uvicorn from a scratch directory,
+so its database, job queue and TTS cache are throwaway. The
+models are replaced by stubs with configurable latencies (--backend stub)
+or loaded for real (--backend real). Prompt building, memory, the context
+window, the stage pools and the TTS cache all still run. With --url the
+requests go to a server that is already running instead; that server must
+be able to fetch the recordings from --recording-base.
+
+Each concurrency level reports turn throughput, latency percentiles and
+errors. webhook_ms is the time until /twilio/voice answers, which is when
+the first reply sentence is ready. turn_ms also includes downloading the
+whole reply. The saturation point is the first level where throughput grows
+by less than --min-gain over the previous level, or where the p95 webhook
+latency breaks --slo-ms (Twilio gives up on a webhook after 15 s).
+
+Usage:
+    python scripts/benchmark_twilio_load.py --concurrency 1 2 4 8 16 32 --turns 3
+    python scripts/benchmark_twilio_load.py --backend real --clip test1.wav --concurrency 1 2 4
+    python scripts/benchmark_twilio_load.py --url http://localhost:8000 --recording-base https://recordings.example.com
+"""
+import os
+import sys
+import json
+import time
+import re
+import uuid
+import asyncio
+import argparse
+import logging
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Only modules without import-time configuration; the app is imported after the environment is set up
+from server.audio_codec import TWILIO_SAMPLE_RATE, read_wav, resample, write_wav
+from server.metrics import quantile
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+STUB_REPLIES = [
+    "Sure, I can help with that. Which day works best for you? I have openings on Monday and Thursday.",
+    "Thanks for calling. Could you tell me your date of birth so I can find your records?",
+    "Your appointment is confirmed for Monday at nine. Is there anything else I can help with?",
+]
+
+
+def make_recording(clip: str, seconds: float) -> bytes:
+    """8 kHz mono WAV like Twilio's recordings, from a clip or synthesized as voiced bursts."""
+    if clip:
+        with open(clip, "rb") as f:
+            audio, sample_rate = read_wav(f.read())
+        return write_wav(resample(audio, sample_rate, TWILIO_SAMPLE_RATE), TWILIO_SAMPLE_RATE)
+    t = np.arange(int(seconds * TWILIO_SAMPLE_RATE)) / TWILIO_SAMPLE_RATE
+    envelope = (np.sin(2 * np.pi * 2.5 * t) > 0).astype(np.float32)
+    audio = 0.3 * envelope * np.sin(2 * np.pi * 180 * t) + np.random.default_rng(0).normal(0, 0.005, t.size)
+    return write_wav(audio.astype(np.float32), TWILIO_SAMPLE_RATE)
+
+
+def start_recording_server(recording: bytes, latency_ms: float):
+    """Serve the recording for every path, like api.twilio.com/.../Recordings/RE..."""
+
+    class RecordingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/x-wav")
+            self.send_header("Content-Length", str(len(recording)))
+            self.end_headers()
+            self.wfile.write(recording)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class LocalRecordingTransport(httpx.AsyncHTTPTransport):
+    """The webhook forces recording URLs to HTTPS; send the local stand-in's requests over plain HTTP."""
+
+    def __init__(self, host: str, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.scheme == "https" and request.url.netloc.decode() == self.host:
+            request.url = request.url.copy_with(scheme="http")
+        return await super().handle_async_request(request)
+
+
+class StubWhisper:
+    """Stands in for the STT engine with a fixed latency plus a cost per second of audio."""
+
+    name = "stub"
+
+    def __init__(self, base_ms: float, per_audio_second_ms: float):
+        self.base_ms = base_ms
+        self.per_audio_second_ms = per_audio_second_ms
+        self.requests = 0
+
+    def transcribe(self, audio) -> str:
+        self.requests += 1
+        seconds = len(audio) / 16000 if hasattr(audio, "__len__") else 0.0
+        time.sleep((self.base_ms + self.per_audio_second_ms * seconds) / 1000)
+        return "I would like to book an appointment for next week please"
+
+    def queue_depth(self) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        return {"batches": self.requests, "requests": self.requests, "avg_batch_size": 1.0, "queued": 0}
+
+
+class StubLlamaService:
+    """Stands in for the llama_server client: a time to first token plus a per-token decode time."""
+
+    def __init__(self, first_token_ms: float, token_ms: float):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.priority = 0
+        self._turn = 0
+
+    def health(self) -> dict:
+        return {"model_loaded": True}
+
+    def count_tokens(self, text: str) -> int:
+        return len(text) // 4 + 1
+
+    def stream(self, prompt, max_tokens, temperature, stop):
+        self._turn += 1
+        time.sleep(self.first_token_ms / 1000)
+        for index, word in enumerate(STUB_REPLIES[self._turn % len(STUB_REPLIES)].split()):
+            if index:
+                time.sleep(self.token_ms / 1000)
+            yield (" " if index else "") + word
+
+    def complete(self, prompt, max_tokens, temperature, stop) -> str:
+        return "".join(self.stream(prompt, max_tokens, temperature, stop))
+
+    def close(self):
+        pass
+
+
+def install_stub_backends(args):
+    """Swap the models for stubs, keeping everything between them real."""
+    import server.agent_services as agent_services
+    from server.model_registry import model_registry
+
+    whisper = StubWhisper(args.stub_stt_ms, args.stub_stt_per_second_ms)
+    llama = StubLlamaService(args.stub_llm_first_token_ms, args.stub_llm_token_ms)
+    model_registry.register("whisper", lambda: whisper)
+    model_registry.register("llama", lambda: llama, warmup=agent_services._check_llama_server)
+    agent_services.LLM_BACKEND = "server"
+
+    def say_to_file(text: str, output_path: str) -> bytes:
+        time.sleep((args.stub_tts_ms + args.stub_tts_per_char_ms * len(text)) / 1000)
+        audio = write_wav(np.zeros(int(0.06 * len(text) * 16000), dtype=np.float32), 16000)
+        with open(output_path, "wb") as f:
+            f.write(audio)
+        return audio
+
+    agent_services._say_to_file = say_to_file
+
+
+def start_app_server(args, recording_host: str):
+    """Run server.main:app under uvicorn on a background thread and return its base URL."""
+    import uvicorn
+
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "AC" + "0" * 32)
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "load-test")
+    os.environ.setdefault("CLINICGUARD_JOB_WORKERS", "0")
+    os.environ["TWILIO_VOICE_MODE"] = "record"
+    os.environ["CLINICGUARD_MEMORY_BACKEND"] = args.memory
+    if args.backend == "stub":
+        os.environ.setdefault("CLINICGUARD_WARMUP_MODELS", "whisper,llama")
+        install_stub_backends(args)
+
+    import server.twilio_router as twilio_router
+    from server.http_client import SharedHTTPClient
+    from server.main import app
+
+    twilio_router.http_client = SharedHTTPClient(transport=LocalRecordingTransport(recording_host))
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + args.startup_timeout
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("App server did not start")
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def place_call(client: httpx.AsyncClient, recording_base: str, turns: int, think_ms: float, results: dict):
+    """One caller's call: answer, recorded turns, hang up."""
+    call_sid = "CA" + uuid.uuid4().hex
+    caller = f"+1555{uuid.uuid4().int % 10**7:07d}"
+    try:
+        started = time.perf_counter()
+        response = await client.post("/twilio/voice/answer", data={"CallSid": call_sid, "From": caller})
+        results["answer_ms"].append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        for _ in range(turns):
+            recording_sid = "RE" + uuid.uuid4().hex
+            form = {"CallSid": call_sid, "From": caller, "RecordingSid": recording_sid,
+                    "RecordingUrl": f"{recording_base}/Recordings/{recording_sid}"}
+            started = time.perf_counter()
+            response = await client.post("/twilio/voice", data=form)
+            webhook_ms = (time.perf_counter() - started) * 1000
+            plays = re.findall(r"<Play>[^<]*?(/audio/[^<]+)</Play>", response.text)
+            if response.status_code != 200 or not plays:
+                results["errors"].append(f"voice HTTP {response.status_code}: {response.text[:120]}")
+                continue
+            # Fetch the reply like Twilio's <Play>; it streams while the later sentences are synthesized
+            for path in plays:
+                async with client.stream("GET", path) as audio:
+                    audio.raise_for_status()
+                    async for _ in audio.aiter_bytes():
+                        pass
+            results["webhook_ms"].append(webhook_ms)
+            results["turn_ms"].append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(think_ms / 1000)
+        started = time.perf_counter()
+        response = await client.post("/twilio/voice/end", data={"CallSid": call_sid})
+        results["end_ms"].append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        results["calls"] += 1
+    except httpx.HTTPError as e:
+        results["errors"].append(f"{type(e).__name__}: {e}")
+
+
+async def run_level(base_url: str, recording_base: str, concurrency: int, calls_per_caller: int, turns: int,
+                    think_ms: float, timeout: float) -> dict:
+    results = {"calls": 0, "answer_ms": [], "webhook_ms": [], "turn_ms": [], "end_ms": [], "errors": []}
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def caller():
+            for _ in range(calls_per_caller):
+                await place_call(client, recording_base, turns, think_ms, results)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(caller() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    def summary(values: list) -> dict:
+        values = sorted(values)
+        return {
+            "p50": round(quantile(values, 0.5), 1),
+            "p95": round(quantile(values, 0.95), 1),
+            "p99": round(quantile(values, 0.99), 1),
+            "max": round(values[-1], 1),
+        } if values else {}
+
+    attempted = concurrency * calls_per_caller * turns
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "calls": results["calls"],
+        "turns": len(results["turn_ms"]),
+        "turns_per_s": round(len(results["turn_ms"]) / elapsed, 2),
+        "calls_per_s": round(results["calls"] / elapsed, 2),
+        "error_rate": round(1 - len(results["turn_ms"]) / attempted, 4) if attempted else 0.0,
+        "webhook_ms": summary(results["webhook_ms"]),
+        "turn_ms": summary(results["turn_ms"]),
+        "answer_ms": summary(results["answer_ms"]),
+        "end_ms": summary(results["end_ms"]),
+        "errors": results["errors"][:5],
+    }
+
+
+def find_saturation(levels: list, min_gain: float, slo_ms: float) -> dict:
+    """First level past which adding callers stops paying off."""
+    best = None
+    for previous, level in zip([None] + levels, levels):
+        if level["error_rate"] > 0:
+            return {"concurrency": level["concurrency"], "reason": "errors", "max_sustainable_concurrency": best}
+        if level["webhook_ms"] and level["webhook_ms"]["p95"] > slo_ms:
+            return {"concurrency": level["concurrency"], "reason": f"p95 webhook latency above {slo_ms:.0f} ms",
+                    "max_sustainable_concurrency": best}
+        if previous is not None and level["turns_per_s"] < previous["turns_per_s"] * (1 + min_gain):
+            return {"concurrency": level["concurrency"], "reason": f"throughput gain below {min_gain:.0%}",
+                    "max_sustainable_concurrency": best}
+        best = level["concurrency"]
+    return {"concurrency": None, "reason": "not reached", "max_sustainable_concurrency": best}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Twilio webhook load test")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 2, 4, 8, 16], help="Concurrent callers per level")
+    parser.add_argument("--calls-per-caller", type=int, default=2, help="Calls each caller places per level")
+    parser.add_argument("--turns", type=int, default=3, help="Recorded turns per call")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between a reply and the next turn")
+    parser.add_argument("--clip", default=None, help="WAV to serve as every recording (default: synthetic)")
+    parser.add_argument("--clip-seconds", type=float, default=4.0, help="Length of the synthetic recording")
+    parser.add_argument("--recording-latency-ms", type=float, default=20.0, help="Delay of the recording stand-in")
+    parser.add_argument("--backend", choices=["stub", "real"], default="stub", help="Model backends of the in-process app")
+    parser.add_argument("--memory", choices=["ephemeral", "persistent"], default="persistent", help="Memory backend of the in-process app")
+    parser.add_argument("--url", default=None, help="Drive an already running server instead of an in-process one")
+    parser.add_argument("--recording-base", default=None, help="Recording host reachable by --url (default: local stand-in)")
+    parser.add_argument("--stub-stt-ms", type=float, default=150.0)
+    parser.add_argument("--stub-stt-per-second-ms", type=float, default=40.0)
+    parser.add_argument("--stub-llm-first-token-ms", type=float, default=120.0)
+    parser.add_argument("--stub-llm-token-ms", type=float, default=25.0)
+    parser.add_argument("--stub-tts-ms", type=float, default=80.0)
+    parser.add_argument("--stub-tts-per-char-ms", type=float, default=1.0)
+    parser.add_argument("--min-gain", type=float, default=0.1, help="Smallest throughput gain that still counts as scaling")
+    parser.add_argument("--slo-ms", type=float, default=5000.0, help="p95 webhook latency budget")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per webhook")
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="Wait for model warmup")
+    args = parser.parse_args()
+
+    clip = os.path.abspath(args.clip) if args.clip else None
+    recording_server, recording_base = start_recording_server(make_recording(clip, args.clip_seconds), args.recording_latency_ms)
+    app_server = None
+    workdir = tempfile.TemporaryDirectory(prefix="clinicguard-load-")
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+            recording_base = args.recording_base or recording_base
+        else:
+            # Relative paths of the app (database, job queue, TTS cache, reply audio) land in the scratch directory
+            os.chdir(workdir.name)
+            app_server, app_thread, base_url = start_app_server(args, recording_base.split("://", 1)[1])
+        levels = []
+        for concurrency in args.concurrency:
+            level = asyncio.run(run_level(base_url, recording_base, concurrency, args.calls_per_caller, args.turns,
+                                          args.think_ms, args.timeout))
+            levels.append(level)
+            logger.warning(f"{concurrency} caller(s): {level['turns_per_s']} turns/s, p95 {level['turn_ms'].get('p95')} ms")
+    finally:
+        if app_server is not None:
+            app_server.should_exit = True
+            app_thread.join(30)
+        recording_server.shutdown()
+        os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        workdir.cleanup()
+
+    print(json.dumps({
+        "target": args.url or "in-process",
+        "backend": "external" if args.url else args.backend,
+        "turns_per_call": args.turns,
+        "calls_per_caller": args.calls_per_caller,
+        "levels": levels,
+        "saturation": find_saturation(levels, args.min_gain, args.slo_ms),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
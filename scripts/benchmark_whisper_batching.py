@@ -0,0 +1,83 @@
+"""
+Benchmark Whisper throughput against micro-batch size.
+
+Submits N concurrent utterances to a WhisperBatcher for each batch size and
+reports utterances per second and seconds of audio transcribed per second.
+
+Usage:
+    python scripts/benchmark_whisper_batching.py --clips test1.wav test2.wav test3.wav --requests 32
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+import whisper
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.audio_codec import WHISPER_SAMPLE_RATE
+from server.whisper_batcher import WhisperBatcher
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def load_clips(paths: list, synthetic_seconds: float) -> list:
+    """Load benchmark clips, or fall back to synthetic noise bursts of the given length."""
+    clips = [whisper.load_audio(path) for path in paths if os.path.exists(path)]
+    if clips:
+        return clips
+    logger.warning("No clips found, using synthetic audio")
+    rng = np.random.default_rng(0)
+    return [rng.normal(0, 0.05, int(synthetic_seconds * WHISPER_SAMPLE_RATE)).astype(np.float32)]
+
+
+def run_batch_size(model, clips: list, batch_size: int, requests: int, max_wait_ms: float) -> dict:
+    batcher = WhisperBatcher(model, max_batch=batch_size, max_wait_ms=max_wait_ms)
+    try:
+        # Warm up so model initialization does not count against the first batch size
+        batcher.transcribe(clips[0])
+        inputs = [clips[i % len(clips)] for i in range(requests)]
+        started = time.perf_counter()
+        futures = [batcher.submit(audio) for audio in inputs]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+        stats = batcher.stats()
+    finally:
+        batcher.close()
+    audio_seconds = sum(audio.size for audio in inputs) / WHISPER_SAMPLE_RATE
+    return {
+        "batch_size": batch_size,
+        "requests": requests,
+        "elapsed_s": round(elapsed, 3),
+        "utterances_per_s": round(requests / elapsed, 2),
+        "audio_s_per_s": round(audio_seconds / elapsed, 2),
+        "avg_batch_size": round(stats["avg_batch_size"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whisper micro-batching benchmark")
+    parser.add_argument("--model", default="base", help="Whisper model name")
+    parser.add_argument("--clips", nargs="*", default=["test1.wav", "test2.wav", "test3.wav"], help="Audio clips to transcribe")
+    parser.add_argument("--requests", type=int, default=32, help="Concurrent utterances per batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="*", default=[1, 2, 4, 8, 16], help="Batch sizes to measure")
+    parser.add_argument("--max-wait-ms", type=float, default=30.0, help="Batching window")
+    parser.add_argument("--synthetic-seconds", type=float, default=3.0, help="Length of synthetic clips if none are found")
+    args = parser.parse_args()
+
+    model = whisper.load_model(args.model)
+    clips = load_clips(args.clips, args.synthetic_seconds)
+    results = [run_batch_size(model, clips, size, args.requests, args.max_wait_ms) for size in args.batch_sizes]
+    print(json.dumps({"model": args.model, "device": str(model.device), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
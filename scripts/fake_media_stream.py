@@ -0,0 +1,110 @@
+"""
+Fake Twilio Media Streams client for local testing of /twilio/stream.
+
+Plays a WAV file into the WebSocket the way Twilio would (connected, start,
+20 ms mu-law media frames, trailing silence, stop), collects the reply audio
+the server streams back and writes it to a WAV file.
+
+Usage:
+    python scripts/fake_media_stream.py test1.wav --url ws://localhost:8000/twilio/stream
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+import logging
+
+import numpy as np
+import websockets
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.audio_codec import TWILIO_SAMPLE_RATE, mulaw_decode, mulaw_encode, read_wav, resample, write_wav
+from server.media_stream import MEDIA_FRAME_BYTES, MEDIA_FRAME_MS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def play_call(url: str, wav_path: str, output_path: str, from_number: str, silence_seconds: float, reply_timeout: float):
+    """Stream one utterance to the server and save the audio it replies with."""
+    with open(wav_path, "rb") as f:
+        audio, sample_rate = read_wav(f.read())
+    payload = mulaw_encode(resample(audio, sample_rate, TWILIO_SAMPLE_RATE))
+    payload += mulaw_encode(np.zeros(int(silence_seconds * TWILIO_SAMPLE_RATE), dtype=np.float32))
+
+    stream_sid = "MZ" + uuid.uuid4().hex
+    call_sid = "CA" + uuid.uuid4().hex
+    reply = bytearray()
+    marks = []
+
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        await ws.send(json.dumps({
+            "event": "start",
+            "sequenceNumber": "1",
+            "start": {
+                "streamSid": stream_sid,
+                "callSid": call_sid,
+                "tracks": ["inbound"],
+                "customParameters": {"From": from_number},
+                "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": TWILIO_SAMPLE_RATE, "channels": 1},
+            },
+            "streamSid": stream_sid,
+        }))
+
+        started = time.monotonic()
+        for sequence, offset in enumerate(range(0, len(payload), MEDIA_FRAME_BYTES), start=2):
+            frame = payload[offset:offset + MEDIA_FRAME_BYTES]
+            await ws.send(json.dumps({
+                "event": "media",
+                "sequenceNumber": str(sequence),
+                "media": {"track": "inbound", "timestamp": str(offset // 8), "payload": base64.b64encode(frame).decode("ascii")},
+                "streamSid": stream_sid,
+            }))
+            await asyncio.sleep(MEDIA_FRAME_MS / 1000)
+        end_of_speech = time.monotonic()
+        logger.info(f"Sent {len(payload) / TWILIO_SAMPLE_RATE:.2f}s of audio in {end_of_speech - started:.2f}s")
+
+        first_audio_at = None
+        try:
+            while True:
+                message = json.loads(await asyncio.wait_for(ws.recv(), timeout=reply_timeout))
+                if message["event"] == "media":
+                    if first_audio_at is None:
+                        first_audio_at = time.monotonic()
+                        logger.info(f"First reply audio {first_audio_at - end_of_speech:.2f}s after the caller stopped")
+                    reply.extend(base64.b64decode(message["media"]["payload"]))
+                elif message["event"] == "mark":
+                    marks.append(message["mark"]["name"])
+                    logger.info(f"Received mark {message['mark']['name']}")
+        except asyncio.TimeoutError:
+            logger.info(f"No more reply audio after {reply_timeout}s")
+
+        await ws.send(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": call_sid}}))
+
+    with open(output_path, "wb") as f:
+        f.write(write_wav(mulaw_decode(bytes(reply)), TWILIO_SAMPLE_RATE))
+    logger.info(f"Saved {len(reply) / TWILIO_SAMPLE_RATE:.2f}s of reply audio ({len(marks)} sentence(s)) to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Twilio Media Streams client")
+    parser.add_argument("wav", help="WAV file with the caller's utterance")
+    parser.add_argument("--url", default="ws://localhost:8000/twilio/stream", help="WebSocket URL of the server")
+    parser.add_argument("--output", default="stream_reply.wav", help="Where to write the reply audio")
+    parser.add_argument("--from-number", default="+15555550123", help="Caller phone number")
+    parser.add_argument("--silence", type=float, default=1.5, help="Seconds of silence sent after the utterance")
+    parser.add_argument("--reply-timeout", type=float, default=15.0, help="Seconds to wait for further reply audio")
+    args = parser.parse_args()
+    asyncio.run(play_call(args.url, args.wav, args.output, args.from_number, args.silence, args.reply_timeout))
+
+
+if __name__ == "__main__":
+    main()
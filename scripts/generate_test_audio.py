@@ -69,20 +69,21 @@ def generate_audio(text, filename):
     
     return False
 
+# Test clips and what is said in them (also the references for the STT benchmark)
+TEST_SENTENCES = [
+    ("Hi, I'd like to book an appointment.", "test1.wav"),
+    ("Can you do tomorrow at 5 PM?", "test2.wav"),
+    ("Will Dr. Mehta be available then?", "test3.wav")
+]
+
 def main():
-    test_sentences = [
-        ("Hi, I'd like to book an appointment.", "test1.wav"),
-        ("Can you do tomorrow at 5 PM?", "test2.wav"),
-        ("Will Dr. Mehta be available then?", "test3.wav")
-    ]
-    
-    for text, filename in test_sentences:
+    for text, filename in TEST_SENTENCES:
         if not generate_audio(text, filename):
             print(f"Failed to generate {filename} with all available methods")
             return False
     
     # Verify files exist
-    for _, filename in test_sentences:
+    for _, filename in TEST_SENTENCES:
         if not os.path.exists(filename):
             print(f"Error: {filename} was not created")
             return False
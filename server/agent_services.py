@@ -1,20 +1,31 @@
 import os
 import logging
-import torch
-import whisper
-from transformers import pipeline
-import pyttsx3
-from typing import Optional, List, Tuple, Dict
-import io
-import requests
-import time
+import functools
+from contextlib import contextmanager
+from typing import Optional, List, Tuple, Dict, Iterator, AsyncIterator, Union
+import tempfile
+import numpy as np
 from dotenv import load_dotenv
-from llama_cpp import Llama
-from server.db import SessionLocal, Patient, Call, ConversationLog, Summary, init_db
+from server.db import SessionLocal, Patient, Call, ConversationLog, Summary, ensure_db_initialized
+from server.utils import pop_complete_sentences
+from server.prompt_cache import PromptPrefixCache
+from server.audio_codec import WHISPER_SAMPLE_RATE, decode_audio
+from server.audio_frontend import prepare_speech
+from server.stage_executor import stage_executor
+from server.stt_engines import load_stt_engine
+from server.model_registry import model_registry
+from server.llama_client import LlamaServerClient, llama_client
+from server.tts_cache import tts_cache
+from server.context_window import CONTEXT_HISTORY_TOKENS, ContextWindow
+from server.log_writer import ConversationLogWriter, log_writer
+from server.session_store import SessionStore, TurnHistory
+from server.metrics import record_generation
 
 import threading
+import time
 MEMORY_BACKEND = os.getenv("CLINICGUARD_MEMORY_BACKEND", "ephemeral")  # 'ephemeral' or 'persistent'
 SUMMARIZER_BACKEND = os.getenv("CLINICGUARD_SUMMARIZER_BACKEND", "llama")  # 'llama' or 'openai'
+LLM_BACKEND = os.getenv("CLINICGUARD_LLM_BACKEND", "local")  # 'local' (in-process GGUF) or 'server' (llama_server)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Model configuration constants
@@ -22,6 +33,12 @@ DEFAULT_LLAMA_MAX_TOKENS = 200
 DEFAULT_LLAMA_TEMPERATURE = 0.7
 DEFAULT_SUMMARY_MAX_TOKENS = 150
 DEFAULT_SUMMARY_TEMPERATURE = 0.5
+LLAMA_N_CTX = 2048
+LLAMA_STOP_SEQUENCES = ["\n", "User:", "Assistant:"]
+PREFIX_CACHE_MAX_MB = int(os.getenv("CLINICGUARD_PREFIX_CACHE_MB", "1024"))
+SAY_VOICE = os.getenv("CLINICGUARD_SAY_VOICE", "default")
+SAY_DATA_FORMAT = "LEF32@22050"
+LLAMA_GGUF_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models", "llama-3-8b-q4_0.gguf"))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,145 +48,341 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Centralized session memory management
+def _discard_session_state(session_id: str, reason: str = None):
+    """Drop the per-session model state kept outside the session store."""
+    prompt_cache.discard(session_id)
+    context_window.discard(session_id)
+
 class SessionMemory:
-    """Ephemeral in-memory session storage for conversation history."""
+    """Ephemeral in-memory session storage for conversation history, bounded by idle TTL and total size."""
     
-    def __init__(self):
-        self._sessions: Dict[str, List[Tuple[str, str]]] = {}
+    def __init__(self, store: SessionStore = None):
+        self._sessions = store if store is not None else SessionStore(on_evict=_discard_session_state)
     
-    def get_session(self, session_id: str) -> List[Tuple[str, str]]:
+    def get_session(self, session_id: str) -> TurnHistory:
         """Get conversation history for a session, creating if doesn't exist."""
-        if session_id not in self._sessions:
-            self._sessions[session_id] = []
-        return self._sessions[session_id]
+        history = self._sessions.get(session_id)
+        if history is None:
+            history = self._sessions.put(session_id)
+        return history
     
     def add_message(self, session_id: str, role: str, content: str):
         """Add a message to the session history."""
-        self.get_session(session_id).append((role, content))
+        self._sessions.append(session_id, role, content, create=True)
         logger.info(f"Added message to session {session_id}: {role}: {content[:50]}...")
     
     def clear_session(self, session_id: str):
         """Clear a session's history."""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        if self._sessions.pop(session_id) is not None:
             logger.info(f"Cleared session {session_id}")
+        _discard_session_state(session_id)
     
     def get_all_sessions(self) -> Dict[str, List[Tuple[str, str]]]:
         """Get all active sessions (for debugging)."""
-        return self._sessions.copy()
+        return self._sessions.snapshot()
+    
+    def stats(self) -> dict:
+        """Cached session count, size and eviction counters."""
+        return self._sessions.stats()
 
 # Global session memory instance
 session_memory = SessionMemory()
 
-# Initialize Whisper model
-try:
-    whisper_model = whisper.load_model("base")
-    logger.info("Whisper model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load Whisper model: {e}")
-    whisper_model = None
-
-# Initialize LLaMA model (llama-cpp-python)
-llama_gguf_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models", "llama-3-8b-q4_0.gguf"))
-try:
-    if os.path.exists(llama_gguf_path):
-        llama_generator = Llama(model_path=llama_gguf_path, n_ctx=2048)
-        logger.info(f"Llama GGUF model loaded from {llama_gguf_path}")
-    else:
-        logger.warning(f"GGUF model not found at {llama_gguf_path}")
-        llama_generator = None
-except Exception as e:
-    logger.error(f"Failed to load Llama GGUF model: {e}")
-    llama_generator = None
-
-class ElevenLabsTTS:
-    """Text-to-speech handler using ElevenLabs API."""
-    
-    def __init__(self):
-        self.api_key = os.getenv('ELEVENLABS_API_KEY')
-        self.voice_id = os.getenv('ELEVENLABS_VOICE_ID')  
-        self.base_url = "https://api.elevenlabs.io/v1"
-
-        if not self.api_key:
-            raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
-        if not self.voice_id:
-            raise ValueError("ELEVENLABS_VOICE_ID not found in environment variables")
-        
-        self.headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": self.api_key
-        }
+# Models are loaded on first use (or by model_registry.warmup() at startup), not at import time
+def _load_whisper():
+    """Load the speech-to-text engine selected by CLINICGUARD_STT_ENGINE."""
+    return load_stt_engine()
+
+def _load_llama():
+    """Load the LLaMA GGUF model, or None if the file is missing."""
+    if not os.path.exists(LLAMA_GGUF_PATH):
+        logger.warning(f"GGUF model not found at {LLAMA_GGUF_PATH}")
+        return None
+    from llama_cpp import Llama
     
-    def _generate_chunk(self, text: str, voice_id: Optional[str] = None, retry_count: int = 0) -> Optional[bytes]:
-        try:
-            voice = voice_id or self.voice_id
-            payload = {
-                "text": text,
-                "model_id": "eleven_monolingual_v1",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.75
-                }
-            }
-            response = requests.post(
-                f"{self.base_url}/text-to-speech/{voice}",
-                json=payload,
-                headers=self.headers
-            )
-            
-            if response.status_code == 200:
-                return response.content
-            elif response.status_code == 429 and retry_count < 3:
-                wait_time = (2 ** retry_count) * 1
-                logger.warning(f"Rate limited, retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                return self._generate_chunk(text, voice_id, retry_count + 1)
-            else:
-                logger.error(f"ElevenLabs API error: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"Error in _generate_chunk: {str(e)}")
-            return None
+    return Llama(model_path=LLAMA_GGUF_PATH, n_ctx=LLAMA_N_CTX)
+
+def _warm_up_whisper(engine):
+    """Run one second of silence through the STT engine to initialize its kernels."""
+    engine.transcribe(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32))
 
-def transcribe_audio(file_path: str) -> str:
+def _warm_up_llama(llm):
+    """Evaluate the shared system preamble so the first call starts from a cached prefix."""
+    with llama_lock:
+        _restore_prefix_state(llm)
+
+def _check_llama_server(client: LlamaServerClient):
+    """Make sure the shared LLaMA service is reachable and has its model loaded."""
+    status = client.health()
+    if not status.get("model_loaded"):
+        raise Exception(f"LLaMA service at {client.base_url} has no model loaded")
+
+model_registry.register("whisper", _load_whisper, warmup=_warm_up_whisper)
+if LLM_BACKEND == "server":
+    # Weights live in llama_server, shared by every API worker
+    model_registry.register("llama", lambda: llama_client, warmup=_check_llama_server)
+else:
+    model_registry.register("llama", _load_llama, warmup=_warm_up_llama)
+
+def get_stt_engine():
+    """Return the speech-to-text engine, loading the model on first use."""
+    return model_registry.get("whisper")
+
+def get_llama():
+    """Return the LLaMA model (or the LLaMA service client), loading it on first use."""
+    return model_registry.get("llama")
+
+# Evaluated llama.cpp states per session, so each turn only evaluates the new user line.
+# The model holds a single KV cache, so every use of it is serialized by llama_lock.
+prompt_cache = PromptPrefixCache(PREFIX_CACHE_MAX_MB * 1024 * 1024)
+llama_lock = threading.Lock()
+
+def transcribe_audio(audio: Union[str, bytes, np.ndarray], sample_rate: int = None, encoding: str = None) -> str:
     """
-    Transcribe audio file using Whisper model.
+    Transcribe audio with the configured STT engine (see stt_engines).
+    
+    In-memory input (WAV/PCM/mu-law bytes or a NumPy buffer) is decoded in
+    process and handed to the engine directly, without temp files or an ffmpeg
+    subprocess per turn. With the 'whisper' engine concurrent calls are
+    micro-batched by whisper_batcher.
+    
+    Silence is trimmed first (see audio_frontend); when no speech is left the
+    engine is not called and an empty string is returned.
     
     Args:
-        file_path: Path to the audio file
+        audio: Path to an audio file, audio bytes, or a float32 NumPy buffer
+        sample_rate: Sample rate of headerless bytes or of a NumPy buffer
+        encoding: 'pcm16' or 'mulaw' for headerless bytes
         
     Returns:
         Transcribed text as a string
         
     Raises:
         FileNotFoundError: If audio file doesn't exist
-        Exception: If Whisper model is not loaded or transcription fails
+        Exception: If the STT model is not loaded or transcription fails
     """
     try:
-        if whisper_model is None:
+        stt_engine = get_stt_engine()
+        if stt_engine is None:
             raise Exception("Whisper model not loaded")
         
-        # Validate file exists
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Audio file not found: {file_path}")
+        if isinstance(audio, str):
+            # Validate file exists
+            if not os.path.exists(audio):
+                raise FileNotFoundError(f"Audio file not found: {audio}")
+            logger.info(f"Transcribing audio file: {audio}")
+            with open(audio, "rb") as f:
+                source = decode_audio(f.read())
+        else:
+            source = decode_audio(audio, sample_rate=sample_rate, encoding=encoding)
+            logger.info(f"Transcribing in-memory audio: {source.size / WHISPER_SAMPLE_RATE:.2f}s")
+        
+        speech = prepare_speech(source)
+        if speech.size == 0:
+            return ""
         
-        logger.info(f"Transcribing audio file: {file_path}")
-        result = whisper_model.transcribe(file_path)
-        transcribed_text = result.get("text", "").strip()
+        transcribed_text = stt_engine.transcribe(speech)
         
         if not transcribed_text:
-            logger.warning(f"Transcription returned empty text for file: {file_path}")
+            logger.warning("Transcription returned empty text")
         
         logger.info(f"Transcription completed: {len(transcribed_text)} characters")
         return transcribed_text
     except FileNotFoundError:
-        logger.error(f"Audio file not found: {file_path}")
+        logger.error(f"Audio file not found: {audio}")
         raise
     except Exception as e:
         logger.error(f"Transcription error: {e}", exc_info=True)
         raise
 
+SYSTEM_PREAMBLE = """You are a helpful medical appointment booking assistant. Your role is to help patients schedule appointments.\nYou should:\n1. Ask for appointment details (date, time, reason)\n2. Confirm patient information\n3. Provide clear next steps\n4. Be professional but friendly\n5. Maintain context from previous messages\n\nPrevious conversation:\n"""
+
+def _build_prompt(prompt: str, session_id: str = None, conversation_history: List[Tuple[str, str]] = None, phone_number: str = None) -> str:
+    """
+    Record the user turn in the memory backend and build the full LLaMA prompt.
+    
+    Args:
+        prompt (str): Current user input
+        session_id (str): Optional session ID for memory management
+        conversation_history (List[Tuple[str, str]]): Optional explicit conversation history
+        phone_number (str): Optional phone number for persistent memory
+        
+    Returns:
+        str: Prompt ending with the assistant cue
+    """
+    # Get conversation history from memory backend if session_id provided
+    if session_id:
+        # Snapshot before recording the user turn, which is added to the prompt separately
+        if MEMORY_BACKEND == "persistent":
+            conversation_history = list(memory_backend.get_session(session_id, phone_number))
+            memory_backend.add_message(session_id, "User", prompt, phone_number)
+        else:
+            conversation_history = list(memory_backend.get_session(session_id))
+            memory_backend.add_message(session_id, "User", prompt)
+    else:
+        # Use explicit conversation_history if provided, otherwise empty
+        conversation_history = conversation_history or []
+    
+    # Keep the newest turns within the token budget; older turns live on in the call summary
+    user_line = _render_turn(("User", prompt))
+    call_summary, window = context_window.fit(session_id, conversation_history, reserve_tokens=count_tokens(user_line))
+    
+    # The preamble and pinned turns come first, unchanged for the whole call, so they match the
+    # prefix warm_up_call() cached; the call summary changes with every fold and follows them
+    pinned = len(_pinned_turns(window))
+    full_prompt = SYSTEM_PREAMBLE
+    for turn in window[:pinned]:
+        full_prompt += _render_turn(turn)
+    if call_summary:
+        full_prompt += context_window.render_summary(call_summary)
+    for turn in window[pinned:]:
+        full_prompt += _render_turn(turn)
+    
+    full_prompt += f"{user_line}Assistant:"
+    return full_prompt
+
+def _pinned_turns(history: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """The leading System turns of a history (the patient summary), which every prompt keeps."""
+    pinned = []
+    for turn in history:
+        if turn[0] != "System":
+            break
+        pinned.append(turn)
+    return pinned
+
+def _render_turn(turn: Tuple[str, str]) -> str:
+    """Format a (speaker, text) turn as a prompt line."""
+    speaker, text = turn
+    prefix = "User: " if speaker == "User" else ("Assistant: " if speaker == "Assistant" else "System: ")
+    return f"{prefix}{text}\n"
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens with the model's own tokenizer."""
+    llm = get_llama()
+    if llm is None:
+        raise Exception("Llama model not loaded")
+    if LLM_BACKEND == "server":
+        return llm.count_tokens(text)
+    return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+def _remember_reply(session_id: str, generated_text: str, phone_number: str = None):
+    """Add the assistant reply to the memory backend if session_id provided."""
+    if session_id:
+        if MEMORY_BACKEND == "persistent":
+            memory_backend.add_message(session_id, "Assistant", generated_text, phone_number)
+        else:
+            memory_backend.add_message(session_id, "Assistant", generated_text)
+
+def _restore_prefix_state(llm, session_id: str = None):
+    """
+    Load the cached model state of a session into llama.cpp.
+    
+    Falls back to the shared system-preamble state for new sessions, evaluating
+    it once on first use. Must be called with llama_lock held.
+    """
+    state = prompt_cache.lookup(session_id) if session_id else None
+    if state is None:
+        if prompt_cache.preamble is None:
+            llm.reset()
+            llm.eval(llm.tokenize(SYSTEM_PREAMBLE.encode("utf-8")))
+            prompt_cache.set_preamble(llm.save_state())
+            logger.info("Cached evaluated system preamble")
+        state = prompt_cache.preamble
+    llm.load_state(state)
+
+def _eval_prefix(llm, tokens: List[int]):
+    """
+    Evaluate tokens on top of the loaded model state, reusing its longest
+    common token prefix the same way llama-cpp-python's generate() does.
+    Must be called with llama_lock held.
+    """
+    common = 0
+    for cached, token in zip(llm.input_ids[:llm.n_tokens], tokens):
+        if cached != token:
+            break
+        common += 1
+    llm.n_tokens = common
+    if common < len(tokens):
+        llm.eval(tokens[common:])
+
+def warm_up_call(session_id: str, phone_number: str = None):
+    """
+    Prepare a call before its first turn, while the caller is still speaking.
+    
+    Resolves the patient, creates the Call row and loads the latest summary
+    (persistent memory), caches the token counts of those turns, and with the
+    local model evaluates the prompt prefix (system preamble plus the pinned
+    summary) into the session's prefix cache, so the first turn only has to
+    evaluate the caller's own words.
+    
+    Args:
+        session_id (str): Twilio CallSid
+        phone_number (str): Caller number, needed to resolve the patient
+    """
+    if MEMORY_BACKEND == "persistent":
+        history = list(memory_backend.get_session(session_id, phone_number))
+    else:
+        history = list(memory_backend.get_session(session_id))
+    pinned = _pinned_turns(history)
+    llm = get_llama()
+    if llm is None:
+        return
+    for turn in pinned:
+        context_window.count_turn(turn)
+    if LLM_BACKEND == "server":
+        # The shared service has no per-session prefix state to prepare
+        return
+    prefix = SYSTEM_PREAMBLE + "".join(_render_turn(turn) for turn in pinned)
+    with llama_lock:
+        _restore_prefix_state(llm, session_id)
+        _eval_prefix(llm, llm.tokenize(prefix.encode("utf-8")))
+        prompt_cache.store(session_id, llm.save_state())
+    logger.info(f"Warmed up call {session_id} ({len(pinned)} pinned turn(s))")
+
+def _complete_prompt(full_prompt: str, session_id: str = None) -> str:
+    """Run a completion on top of the session's cached prefix and cache the new state."""
+    llm = get_llama()
+    if LLM_BACKEND == "server":
+        return llm.complete(full_prompt, DEFAULT_LLAMA_MAX_TOKENS, DEFAULT_LLAMA_TEMPERATURE, LLAMA_STOP_SEQUENCES)
+    with llama_lock:
+        _restore_prefix_state(llm, session_id)
+        started = time.perf_counter()
+        response = llm(
+            full_prompt,
+            max_tokens=DEFAULT_LLAMA_MAX_TOKENS,
+            temperature=DEFAULT_LLAMA_TEMPERATURE,
+            stop=LLAMA_STOP_SEQUENCES
+        )
+        record_generation("local", response.get("usage", {}).get("completion_tokens", 0), time.perf_counter() - started)
+        if session_id:
+            prompt_cache.store(session_id, llm.save_state())
+    return response["choices"][0]["text"]
+
+def _stream_prompt(full_prompt: str, session_id: str = None) -> Iterator[str]:
+    """Streaming variant of _complete_prompt, yielding text pieces as they are decoded."""
+    llm = get_llama()
+    if LLM_BACKEND == "server":
+        yield from llm.stream(full_prompt, DEFAULT_LLAMA_MAX_TOKENS, DEFAULT_LLAMA_TEMPERATURE, LLAMA_STOP_SEQUENCES)
+        return
+    with llama_lock:
+        _restore_prefix_state(llm, session_id)
+        started = time.perf_counter()
+        stream = llm(
+            full_prompt,
+            max_tokens=DEFAULT_LLAMA_MAX_TOKENS,
+            temperature=DEFAULT_LLAMA_TEMPERATURE,
+            stop=LLAMA_STOP_SEQUENCES,
+            stream=True
+        )
+        # llama-cpp streams one chunk per generated token
+        tokens = 0
+        for chunk in stream:
+            tokens += 1
+            yield chunk["choices"][0]["text"]
+        record_generation("local", tokens, time.perf_counter() - started)
+        if session_id:
+            prompt_cache.store(session_id, llm.save_state())
+
 def generate_response(prompt: str, session_id: str = None, conversation_history: List[Tuple[str, str]] = None, phone_number: str = None) -> str:
     """
     Generate text response using LLaMA model (llama-cpp-python).
@@ -184,46 +397,15 @@ def generate_response(prompt: str, session_id: str = None, conversation_history:
         str: Generated response
     """
     try:
-        if llama_generator is None:
+        if get_llama() is None:
             raise Exception("Llama model not loaded")
         
-        # Get conversation history from memory backend if session_id provided
-        if session_id:
-            if MEMORY_BACKEND == "persistent":
-                conversation_history = memory_backend.get_session(session_id, phone_number)
-                memory_backend.add_message(session_id, "User", prompt, phone_number)
-            else:
-                conversation_history = memory_backend.get_session(session_id)
-                memory_backend.add_message(session_id, "User", prompt)
-        else:
-            # Use explicit conversation_history if provided, otherwise empty
-            conversation_history = conversation_history or []
-        
-        # Build the full prompt with conversation history
-        full_prompt = """You are a helpful medical appointment booking assistant. Your role is to help patients schedule appointments.\nYou should:\n1. Ask for appointment details (date, time, reason)\n2. Confirm patient information\n3. Provide clear next steps\n4. Be professional but friendly\n5. Maintain context from previous messages\n\nPrevious conversation:\n"""
-        if conversation_history:
-            for speaker, text in conversation_history:
-                prefix = "User: " if speaker == "User" else ("Assistant: " if speaker == "Assistant" else "System: ")
-                full_prompt += f"{prefix}{text}\n"
-        
-        # Always add the current user input (it's already in history if session_id exists, but we need it in the prompt)
-        full_prompt += f"User: {prompt}\nAssistant:"
+        full_prompt = _build_prompt(prompt, session_id, conversation_history, phone_number)
         
         logger.info(f"Generating response for prompt: {full_prompt[:200]}...")
-        response = llama_generator(
-            full_prompt,
-            max_tokens=DEFAULT_LLAMA_MAX_TOKENS,
-            temperature=DEFAULT_LLAMA_TEMPERATURE,
-            stop=["\n", "User:", "Assistant:"]
-        )
-        generated_text = response["choices"][0]["text"].strip()
+        generated_text = _complete_prompt(full_prompt, session_id).strip()
         
-        # Add response to memory backend if session_id provided
-        if session_id:
-            if MEMORY_BACKEND == "persistent":
-                memory_backend.add_message(session_id, "Assistant", generated_text, phone_number)
-            else:
-                memory_backend.add_message(session_id, "Assistant", generated_text)
+        _remember_reply(session_id, generated_text, phone_number)
         
         logger.info("Response generated successfully")
         return generated_text
@@ -231,10 +413,115 @@ def generate_response(prompt: str, session_id: str = None, conversation_history:
         logger.error(f"Generation error: {e}")
         raise
 
+def generate_response_stream(prompt: str, session_id: str = None, conversation_history: List[Tuple[str, str]] = None, phone_number: str = None) -> Iterator[str]:
+    """
+    Generate a response with llama-cpp streaming and yield it sentence by sentence.
+    
+    Each sentence is yielded as soon as the model has decoded its terminator,
+    so callers can start synthesizing it while the rest is still generated.
+    The complete reply is stored in the memory backend once the stream ends.
+    
+    Args:
+        prompt (str): Current user input
+        session_id (str): Optional session ID for memory management
+        conversation_history (List[Tuple[str, str]]): Optional explicit conversation history
+        phone_number (str): Optional phone number for persistent memory
+        
+    Yields:
+        str: Complete sentences of the generated response
+    """
+    if get_llama() is None:
+        raise Exception("Llama model not loaded")
+    
+    full_prompt = _build_prompt(prompt, session_id, conversation_history, phone_number)
+    logger.info(f"Streaming response for prompt: {full_prompt[:200]}...")
+    
+    sentences = []
+    buffer = ""
+    try:
+        for piece in _stream_prompt(full_prompt, session_id):
+            buffer += piece
+            complete, buffer = pop_complete_sentences(buffer)
+            for sentence in complete:
+                sentences.append(sentence)
+                yield sentence
+        tail = buffer.strip()
+        if tail:
+            sentences.append(tail)
+            yield tail
+    except Exception as e:
+        logger.error(f"Streaming generation error: {e}")
+        raise
+    
+    _remember_reply(session_id, " ".join(sentences), phone_number)
+    logger.info(f"Streamed response in {len(sentences)} sentence(s)")
+
+async def astream_speech(prompt: str, output_dir: str, basename: str, session_id: str = None, phone_number: str = None) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Generate a response and synthesize it sentence by sentence for the request handlers.
+    
+    Decoding runs ahead on the 'llm' stage pool and each finished sentence is
+    synthesized on the 'tts' pool, so the event loop is never blocked.
+    
+    Args:
+        prompt (str): Current user input
+        output_dir (str): Directory for the per-sentence WAV files
+        basename (str): File name prefix, files are named '{basename}_{index}.wav'
+        session_id (str): Optional session ID for memory management
+        phone_number (str): Optional phone number for persistent memory
+        
+    Yields:
+        Tuple[str, str]: (sentence, path of its WAV file) in speaking order
+    """
+    sentences = generate_response_stream(prompt, session_id=session_id, phone_number=phone_number)
+    index = 0
+    async for sentence in stage_executor.iterate("llm", sentences):
+        output_path = os.path.join(output_dir, f"{basename}_{index}.wav")
+        await stage_executor.run("tts", text_to_speech, sentence, output_path)
+        index += 1
+        yield sentence, output_path
+
+async def astream_reply_audio(prompt: str, session_id: str = None, phone_number: str = None) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Like astream_speech, but yields each sentence's WAV bytes instead of writing a file.
+    
+    Args:
+        prompt (str): Current user input
+        session_id (str): Optional session ID for memory management
+        phone_number (str): Optional phone number for persistent memory
+        
+    Yields:
+        Tuple[str, bytes]: (sentence, its WAV audio) in speaking order
+    """
+    sentences = generate_response_stream(prompt, session_id=session_id, phone_number=phone_number)
+    async for sentence in stage_executor.iterate("llm", sentences):
+        audio = await stage_executor.run("tts", synthesize_speech, sentence)
+        yield sentence, audio
+
+def _say_to_file(text: str, output_path: str) -> bytes:
+    """Run the macOS 'say' command and return the WAV bytes it wrote."""
+    # Escape quotes in text to prevent command injection
+    escaped_text = text.replace('"', '\\"')
+    voice_arg = f'-v "{SAY_VOICE}" ' if SAY_VOICE != "default" else ""
+    cmd = f'say {voice_arg}-o "{output_path}" --data-format={SAY_DATA_FORMAT} "{escaped_text}"'
+    exit_code = os.system(cmd)
+    
+    if exit_code != 0:
+        raise Exception(f"'say' command failed with exit code {exit_code}")
+    
+    # Verify file was created
+    if not os.path.exists(output_path):
+        raise Exception(f"TTS output file was not created: {output_path}")
+    
+    with open(output_path, "rb") as f:
+        return f.read()
+
 def text_to_speech(text: str, output_path: str) -> None:
     """
     Convert text to speech and save as WAV file using macOS 'say' command.
     
+    Repeated phrases are served from tts_cache instead of being synthesized again.
+    
     Args:
         text: Text to convert to speech
         output_path: Path where the WAV file will be saved
@@ -255,21 +542,19 @@ def text_to_speech(text: str, output_path: str) -> None:
         
         logger.info(f"Converting text to speech: {text[:50]}... (total length: {len(text)} chars)")
         
-        # Use macOS 'say' command to generate WAV
-        # Escape quotes in text to prevent command injection
-        escaped_text = text.replace('"', '\\"')
-        cmd = f'say -o "{output_path}" --data-format=LEF32@22050 "{escaped_text}"'
-        exit_code = os.system(cmd)
+        synthesized_here = []
         
-        if exit_code != 0:
-            raise Exception(f"'say' command failed with exit code {exit_code}")
+        def synthesize() -> bytes:
+            synthesized_here.append(True)
+            return _say_to_file(text, output_path)
         
-        # Verify file was created
-        if not os.path.exists(output_path):
-            raise Exception(f"TTS output file was not created: {output_path}")
+        audio = tts_cache.get_or_create(text, SAY_VOICE, "say", SAY_DATA_FORMAT, synthesize)
+        if not synthesized_here:
+            # Cache hit or shared with a concurrent identical request
+            with open(output_path, "wb") as f:
+                f.write(audio)
         
-        file_size = os.path.getsize(output_path)
-        logger.info(f"Speech saved to {output_path} (size: {file_size / 1024:.2f}KB)")
+        logger.info(f"Speech saved to {output_path} (size: {len(audio) / 1024:.2f}KB)")
     except ValueError as e:
         logger.error(f"TTS validation error: {e}")
         raise
@@ -277,81 +562,165 @@ def text_to_speech(text: str, output_path: str) -> None:
         logger.error(f"TTS error: {e}", exc_info=True)
         raise
 
+def synthesize_speech(text: str) -> bytes:
+    """
+    Convert text to speech and return the WAV bytes.
+    
+    Repeated phrases are served from tts_cache. 'say' can only write to a
+    file, so a fresh synthesis goes through a temporary file that is removed
+    right away.
+    
+    Args:
+        text: Text to convert to speech
+        
+    Returns:
+        WAV file bytes
+        
+    Raises:
+        ValueError: If text is empty
+        Exception: If the 'say' command fails
+    """
+    if not text or not text.strip():
+        raise ValueError("Text cannot be empty for TTS conversion")
+    
+    def synthesize() -> bytes:
+        with tempfile.TemporaryDirectory() as tmp:
+            return _say_to_file(text, os.path.join(tmp, "speech.wav"))
+    
+    try:
+        return tts_cache.get_or_create(text, SAY_VOICE, "say", SAY_DATA_FORMAT, synthesize)
+    except Exception as e:
+        logger.error(f"TTS error: {e}", exc_info=True)
+        raise
+
 # Persistent session memory manager
 class PersistentSessionMemory:
-    """Persistent session storage using database backend."""
+    """
+    Persistent session storage using database backend.
+    
+    Each session has its own lock, so loading, writing and summarizing one
+    call never waits on another call. The shared lock only guards the
+    lock table and is never held during DB or LLM work. A session's lock
+    stays in the table while anyone holds or waits for it, and is dropped
+    by the last user, so clearing a session never splits its lock in two.
+    Log rows are written behind by a ConversationLogWriter, keyed by the
+    call id cached with the session. The cache is a bounded SessionStore:
+    an evicted session is simply reloaded from the database on next use.
+    """
     
-    def __init__(self):
+    def __init__(self, writer: ConversationLogWriter = None, store: SessionStore = None):
         self._lock = threading.Lock()
-        self._sessions = {}  # in-memory cache for active calls
+        # In-memory cache for active calls; the tag of each history is its call id
+        self._sessions = store if store is not None else SessionStore()
+        self._sessions.on_evict = _discard_session_state
+        # session id -> [lock, number of threads holding or waiting for it]
+        self._session_locks: Dict[str, list] = {}
+        self._writer = writer or log_writer
 
-    def get_session(self, session_id: str, phone_number: str = None) -> list:
+    @contextmanager
+    def _session_lock(self, session_id: str):
+        """Hold a session's lock, creating it on first use and dropping it after the last."""
         with self._lock:
-            if session_id in self._sessions:
-                return self._sessions[session_id]
-            db = SessionLocal()
+            entry = self._session_locks.get(session_id)
+            if entry is None:
+                entry = self._session_locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._session_locks[session_id]
+
+    def _cached(self, session_id: str, phone_number: str = None) -> Tuple[TurnHistory, Optional[int]]:
+        """The cached history and call id of a session, loading them on a miss."""
+        history, call_id = self._sessions.get_with_tag(session_id)
+        if history is not None:
+            return history, call_id
+        with self._session_lock(session_id):
+            # Another thread may have loaded the session while we waited
+            history, call_id = self._sessions.get_with_tag(session_id)
+            if history is None:
+                turns, call_id = self._load_session(session_id, phone_number)
+                history = self._sessions.put(session_id, turns, tag=call_id)
+            return history, call_id
+
+    def get_session(self, session_id: str, phone_number: str = None) -> TurnHistory:
+        return self._cached(session_id, phone_number)[0]
+
+    def _load_session(self, session_id: str, phone_number: str = None) -> Tuple[list, Optional[int]]:
+        """Read a call's history from the database, creating the call record for new calls."""
+        ensure_db_initialized()
+        db = SessionLocal()
+        try:
             call = db.query(Call).filter_by(call_sid=session_id).first()
             if call:
-                logs = db.query(ConversationLog).filter_by(call_id=call.id).order_by(ConversationLog.timestamp).all()
+                # A known call is being reloaded (after eviction or a restart); commit its queued rows first
+                self._writer.flush()
+                logs = db.query(ConversationLog).filter_by(call_id=call.id).order_by(ConversationLog.timestamp, ConversationLog.id).all()
                 history = [(log.role, log.content) for log in logs]
-                # Inject summaries as system prompt/context if available
-                if call.patient_id:
-                    summaries = get_patient_summaries(call.patient_id)
-                    if summaries:
-                        # Add the most recent summary as a system message at the start
-                        history = [("System", summaries[0])] + history
-                self._sessions[session_id] = history
-                db.close()
-                return history
-            else:
-                if phone_number:
-                    patient = db.query(Patient).filter_by(phone_number=phone_number).first()
-                    if not patient:
-                        patient = Patient(phone_number=phone_number)
-                        db.add(patient)
-                        db.commit()
-                        db.refresh(patient)
-                    call = Call(call_sid=session_id, patient_id=patient.id)
-                    db.add(call)
+                return _with_latest_summary(call.patient_id, history), call.id
+            if phone_number:
+                patient = db.query(Patient).filter_by(phone_number=phone_number).first()
+                if not patient:
+                    patient = Patient(phone_number=phone_number)
+                    db.add(patient)
                     db.commit()
-                self._sessions[session_id] = []
-                db.close()
-                return self._sessions[session_id]
-
-    def add_message(self, session_id: str, role: str, content: str, phone_number: str = None):
-        with self._lock:
-            history = self.get_session(session_id, phone_number)
-            history.append((role, content))
-            db = SessionLocal()
-            call = db.query(Call).filter_by(call_sid=session_id).first()
-            if call:
-                log = ConversationLog(call_id=call.id, role=role, content=content)
-                db.add(log)
+                    db.refresh(patient)
+                call = Call(call_sid=session_id, patient_id=patient.id)
+                db.add(call)
                 db.commit()
+                # A returning patient starts the new call with the summary of their last one
+                return _with_latest_summary(patient.id, []), call.id
+            return [], None
+        finally:
             db.close()
-            logger.info(f"[Persistent] Added message to session {session_id}: {role}: {content[:50]}...")
+
+    def add_message(self, session_id: str, role: str, content: str, phone_number: str = None):
+        _, call_id = self._cached(session_id, phone_number)
+        # Serialized per call only, so the log order matches the in-memory history
+        with self._session_lock(session_id):
+            # If the session was evicted meanwhile the cache skips the turn; the log row below still records it
+            self._sessions.append(session_id, role, content)
+            if call_id is not None:
+                self._writer.append(call_id, role, content)
+        logger.info(f"[Persistent] Added message to session {session_id}: {role}: {content[:50]}...")
 
     def clear_session(self, session_id: str):
-        with self._lock:
-            if session_id in self._sessions:
-                del self._sessions[session_id]
-                logger.info(f"[Persistent] Cleared session {session_id}")
+        if self._sessions.pop(session_id) is not None:
+            logger.info(f"[Persistent] Cleared session {session_id}")
+        _discard_session_state(session_id)
 
     def get_all_sessions(self):
-        with self._lock:
-            return self._sessions.copy()
+        return self._sessions.snapshot()
+
+    def stats(self) -> dict:
+        """Cached session count, size and eviction counters."""
+        return self._sessions.stats()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Commit every queued log row; returns False if the timeout expired first."""
+        return self._writer.flush(timeout)
 
     def summarize_and_save(self, session_id: str):
-        with self._lock:
-            db = SessionLocal()
+        # Reads committed logs only, so no lock is held during the DB reads or the LLM call
+        self.flush()
+        ensure_db_initialized()
+        db = SessionLocal()
+        try:
             call = db.query(Call).filter_by(call_sid=session_id).first()
-            if call and call.patient_id:
-                logs = db.query(ConversationLog).filter_by(call_id=call.id).order_by(ConversationLog.timestamp).all()
-                history = [(log.role, log.content) for log in logs]
-                summary = summarize_conversation(history)
-                save_summary(call.patient_id, summary)
-                logger.info(f"Saved summary for patient {call.patient_id}: {summary}")
+            if not call or not call.patient_id:
+                return
+            patient_id = call.patient_id
+            logs = db.query(ConversationLog).filter_by(call_id=call.id).order_by(ConversationLog.timestamp, ConversationLog.id).all()
+            history = [(log.role, log.content) for log in logs]
+        finally:
             db.close()
+        summary = summarize_conversation(history)
+        save_summary(patient_id, summary)
+        logger.info(f"Saved summary for patient {patient_id}: {summary}")
 
 # Choose memory backend
 if MEMORY_BACKEND == "persistent":
@@ -359,6 +728,15 @@ if MEMORY_BACKEND == "persistent":
 else:
     memory_backend = session_memory  # Ephemeral
 
+def run_summarize_call_job(payload: dict):
+    """
+    Job handler for 'summarize_call', run in a job worker process.
+    Args:
+        payload (dict): {"call_sid": ...} of a call whose logs are already committed
+    """
+    memory = memory_backend if isinstance(memory_backend, PersistentSessionMemory) else PersistentSessionMemory()
+    memory.summarize_and_save(payload["call_sid"])
+
 # Summarization function
 def summarize_conversation(conversation: list) -> str:
     """
@@ -386,24 +764,58 @@ def summarize_conversation(conversation: list) -> str:
         except Exception as e:
             logger.error(f"OpenAI summarization error: {e}, falling back to LLaMA")
             # Fall through to LLaMA if OpenAI fails
-            if llama_generator is None:
+            if get_llama() is None:
                 raise Exception("Both OpenAI and LLaMA summarization failed")
     
     # Use LLaMA for summarization
-    if llama_generator is None:
+    llm = get_llama()
+    if llm is None:
         raise Exception("LLaMA model not loaded and OpenAI summarization not available")
     
     summary_prompt = f"Summarize the following medical appointment conversation for future context. Be concise and focus on patient preferences, patterns, and important details.\n\n{text}\n\nSummary:"
-    response = llama_generator(
-        summary_prompt,
-        max_tokens=150,
-        temperature=0.5,
-        stop=["\n"]
-    )
+    return _complete_text(summary_prompt, DEFAULT_SUMMARY_MAX_TOKENS, DEFAULT_SUMMARY_TEMPERATURE, ["\n"])
+
+def summarize_call_turns(previous_summary: str, turns: list) -> str:
+    """
+    Fold turns that left the context window into the running summary of the current call.
+    
+    Args:
+        previous_summary (str): Summary of the turns folded so far, may be empty
+        turns (list): Newly evicted (role, text) tuples, oldest first
+    Returns:
+        str: Updated summary
+    """
+    text = "\n".join([f"{role}: {msg}" for role, msg in turns])
+    fold_prompt = "Update the summary of this medical appointment call with the new lines. Keep every detail needed to continue the call (names, dates, times, reasons, what was already confirmed). Be concise.\n\n"
+    if previous_summary:
+        fold_prompt += f"Summary so far: {previous_summary}\n\n"
+    fold_prompt += f"New lines:\n{text}\n\nUpdated summary:"
+    return _complete_text(fold_prompt, DEFAULT_SUMMARY_MAX_TOKENS, DEFAULT_SUMMARY_TEMPERATURE, ["\n"])
+
+def _complete_text(prompt: str, max_tokens: int, temperature: float, stop: List[str]) -> str:
+    """One-off LLaMA completion outside of any session (no prefix caching)."""
+    llm = get_llama()
+    if llm is None:
+        raise Exception("Llama model not loaded")
+    if LLM_BACKEND == "server":
+        return llm.complete(prompt, max_tokens, temperature, stop).strip()
+    with llama_lock:
+        response = llm(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop
+        )
     return response["choices"][0]["text"].strip()
 
+# Sliding prompt window per session; evicted turns are folded into summarize_call_turns()
+# as jobs on the 'llm' stage, next to the live generations
+context_window = ContextWindow(CONTEXT_HISTORY_TOKENS, count_tokens, _render_turn, summarize_call_turns,
+                               submit=functools.partial(stage_executor.submit, "llm"))
+
 # Save summary to DB
 def save_summary(patient_id: int, summary_text: str):
+    ensure_db_initialized()
     db = SessionLocal()
     summary = Summary(patient_id=patient_id, summary_text=summary_text)
     db.add(summary)
@@ -411,10 +823,20 @@ def save_summary(patient_id: int, summary_text: str):
     db.close()
 
 # Fetch summaries for patient
-def get_patient_summaries(patient_id: int) -> list:
+def get_patient_summaries(patient_id: int, limit: int = None) -> list:
+    ensure_db_initialized()
     db = SessionLocal()
-    summaries = db.query(Summary).filter_by(patient_id=patient_id).order_by(Summary.created_at.desc()).all()
+    query = db.query(Summary.summary_text).filter_by(patient_id=patient_id).order_by(Summary.created_at.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    summaries = query.all()
     db.close()
     return [s.summary_text for s in summaries]
 
-init_db()
\ No newline at end of file
+def _with_latest_summary(patient_id: Optional[int], history: list) -> list:
+    """Prepend the patient's most recent call summary, if any, as a System turn."""
+    if not patient_id:
+        return history
+    # Only the newest row is read (patient_id, created_at index)
+    summaries = get_patient_summaries(patient_id, limit=1)
+    return [("System", summaries[0])] + history if summaries else history
@@ -0,0 +1,426 @@
+"""
+In-process audio encoding helpers.
+
+Vectorized NumPy implementations of the conversions the voice pipeline
+needs: G.711 mu-law (Twilio Media Streams use 8 kHz mu-law), WAV parsing and
+writing, sample-rate conversion, and incremental decoding of downloads.
+Audio is passed around as mono float32 arrays in [-1.0, 1.0].
+"""
+import struct
+import logging
+import subprocess
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TWILIO_SAMPLE_RATE = 8000
+WHISPER_SAMPLE_RATE = 16000
+
+_MULAW_BIAS = 0x84
+_MULAW_CLIP = 32635
+
+# WAVE format tags
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_MULAW = 0x0007
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _build_mulaw_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _MULAW_BIAS) << exponent) - _MULAW_BIAS
+    return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+
+_MULAW_DECODE_TABLE = _build_mulaw_decode_table()
+
+
+def mulaw_decode(data: bytes) -> np.ndarray:
+    """
+    Decode G.711 mu-law bytes.
+
+    Args:
+        data: mu-law encoded bytes, one sample per byte
+
+    Returns:
+        float32 samples in [-1.0, 1.0]
+    """
+    codes = np.frombuffer(data, dtype=np.uint8)
+    return _MULAW_DECODE_TABLE[codes].astype(np.float32) / 32768.0
+
+
+def mulaw_encode(audio: np.ndarray) -> bytes:
+    """
+    Encode float samples as G.711 mu-law.
+
+    Args:
+        audio: float samples in [-1.0, 1.0]
+
+    Returns:
+        mu-law encoded bytes, one per sample
+    """
+    pcm = np.clip(np.asarray(audio, dtype=np.float32) * 32768.0, -32768, 32767).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0x00)
+    magnitude = np.minimum(np.abs(pcm), _MULAW_CLIP) + _MULAW_BIAS
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+def pcm16_decode(data: bytes) -> np.ndarray:
+    """Decode little-endian signed 16-bit PCM bytes to float32 samples."""
+    usable = len(data) - (len(data) % 2)
+    return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def pcm16_encode(audio: np.ndarray) -> bytes:
+    """Encode float samples in [-1.0, 1.0] as little-endian signed 16-bit PCM bytes."""
+    return np.clip(np.asarray(audio, dtype=np.float32) * 32768.0, -32768, 32767).astype("<i2").tobytes()
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Convert audio to another sample rate by linear interpolation.
+
+    Args:
+        audio: Mono float samples
+        src_rate: Sample rate of the input
+        dst_rate: Wanted sample rate
+
+    Returns:
+        float32 samples at dst_rate
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if src_rate == dst_rate or audio.size == 0:
+        return audio
+    duration = audio.size / src_rate
+    target_size = max(1, int(round(duration * dst_rate)))
+    src_times = np.arange(audio.size, dtype=np.float64) / src_rate
+    dst_times = np.arange(target_size, dtype=np.float64) / dst_rate
+    return np.interp(dst_times, src_times, audio).astype(np.float32)
+
+
+def parse_wav_header(data: bytes) -> Tuple[int, int, int, int, int, int]:
+    """
+    Locate the sample data of a RIFF/WAVE file.
+
+    Args:
+        data: WAV file bytes (at least the header)
+
+    Returns:
+        Tuple of (format_tag, channels, sample_rate, bits_per_sample, data_offset, data_size)
+
+    Raises:
+        ValueError: If the bytes are not a supported WAV file
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack("<I", data[offset + 4:offset + 8])[0]
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate = struct.unpack("<HHI", data[body:body + 8])
+            bits_per_sample = struct.unpack("<H", data[body + 14:body + 16])[0]
+            if format_tag == _WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                format_tag = struct.unpack("<H", data[body + 24:body + 26])[0]
+            fmt = (format_tag, channels, sample_rate, bits_per_sample)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            return fmt + (body, chunk_size)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV header incomplete or missing data chunk")
+
+
+def decode_samples(data: bytes, format_tag: int, bits_per_sample: int) -> np.ndarray:
+    """
+    Decode interleaved WAV sample bytes to float32.
+
+    Args:
+        data: Raw sample bytes
+        format_tag: WAVE format tag
+        bits_per_sample: Sample width in bits
+
+    Returns:
+        float32 samples in [-1.0, 1.0], still interleaved
+    """
+    if format_tag == _WAVE_FORMAT_MULAW and bits_per_sample == 8:
+        return mulaw_decode(data)
+    if format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits_per_sample == 32:
+        usable = len(data) - (len(data) % 4)
+        return np.frombuffer(data[:usable], dtype="<f4").astype(np.float32)
+    if format_tag == _WAVE_FORMAT_PCM:
+        if bits_per_sample == 16:
+            return pcm16_decode(data)
+        if bits_per_sample == 8:
+            return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        if bits_per_sample == 32:
+            usable = len(data) - (len(data) % 4)
+            return np.frombuffer(data[:usable], dtype="<i4").astype(np.float32) / 2147483648.0
+    raise ValueError(f"Unsupported WAV encoding: format={format_tag}, bits={bits_per_sample}")
+
+
+def downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    """Average interleaved channels into mono."""
+    if channels <= 1:
+        return samples
+    usable = samples.size - (samples.size % channels)
+    return samples[:usable].reshape(-1, channels).mean(axis=1).astype(np.float32)
+
+
+def read_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Decode a WAV file held in memory.
+
+    Supports 8/16/32-bit PCM, 32-bit float and mu-law, any channel count.
+
+    Args:
+        data: WAV file bytes
+
+    Returns:
+        Tuple of (mono float32 samples, sample rate)
+    """
+    format_tag, channels, sample_rate, bits_per_sample, offset, size = parse_wav_header(data)
+    samples = decode_samples(data[offset:offset + size], format_tag, bits_per_sample)
+    return downmix(samples, channels), sample_rate
+
+
+def write_wav(audio: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Encode mono float samples as a 16-bit PCM WAV file.
+
+    Args:
+        audio: float samples in [-1.0, 1.0]
+        sample_rate: Sample rate of the audio
+
+    Returns:
+        WAV file bytes
+    """
+    pcm = pcm16_encode(audio)
+    return wav_header(sample_rate, len(pcm)) + pcm
+
+
+def wav_header(sample_rate: int, data_bytes: Optional[int] = None) -> bytes:
+    """
+    Build the 44-byte header of a mono 16-bit PCM WAV file.
+
+    Args:
+        sample_rate: Sample rate of the audio
+        data_bytes: Size of the PCM data, or None for a stream whose length is
+            not known yet (the size fields are set to their maximum)
+
+    Returns:
+        Header bytes
+    """
+    riff_size = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    data_size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    return (b"RIFF" + struct.pack("<I", riff_size) + b"WAVEfmt "
+            + struct.pack("<IHHIIHH", 16, _WAVE_FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b"data" + struct.pack("<I", data_size))
+
+
+def ffmpeg_decode(data: bytes, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode compressed audio (MP3, M4A, OGG, FLAC) through an ffmpeg pipe.
+
+    Only used for formats that cannot be decoded in-process; the audio is
+    piped through stdin/stdout, nothing is written to disk.
+
+    Args:
+        data: Encoded audio file bytes
+        sample_rate: Output sample rate
+
+    Returns:
+        Mono float32 samples at sample_rate
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1",
+    ]
+    result = subprocess.run(cmd, input=data, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise ValueError(f"ffmpeg could not decode audio: {result.stderr.decode(errors='ignore').strip()}")
+    return pcm16_decode(result.stdout)
+
+
+def decode_audio(data, sample_rate: int = None, encoding: str = None) -> np.ndarray:
+    """
+    Turn network audio into Whisper input without touching the disk.
+
+    Args:
+        data: WAV or compressed file bytes, raw PCM/mu-law bytes, or a NumPy buffer
+        sample_rate: Sample rate of raw bytes or of a NumPy buffer
+        encoding: 'pcm16' or 'mulaw' for headerless bytes; detected for files
+
+    Returns:
+        Mono float32 samples at 16 kHz
+    """
+    if isinstance(data, np.ndarray):
+        audio = data.astype(np.float32, copy=False)
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        return resample(audio, sample_rate or WHISPER_SAMPLE_RATE, WHISPER_SAMPLE_RATE)
+    if encoding == "mulaw":
+        return resample(mulaw_decode(data), sample_rate or TWILIO_SAMPLE_RATE, WHISPER_SAMPLE_RATE)
+    if encoding == "pcm16":
+        return resample(pcm16_decode(data), sample_rate or WHISPER_SAMPLE_RATE, WHISPER_SAMPLE_RATE)
+    if encoding is not None:
+        raise ValueError(f"Unsupported raw audio encoding: {encoding}")
+    if data[:4] == b"RIFF":
+        audio, wav_rate = read_wav(data)
+        return resample(audio, wav_rate, WHISPER_SAMPLE_RATE)
+    return ffmpeg_decode(data, WHISPER_SAMPLE_RATE)
+
+
+class AudioTooLargeError(ValueError):
+    """Raised when streamed audio exceeds the allowed number of bytes."""
+
+
+class _LinearResampler:
+    """
+    Chunk-by-chunk version of resample(): the output is the same linear
+    interpolation, produced as input arrives, carrying one sample across
+    chunk boundaries.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self._step = src_rate / dst_rate
+        self._prev: Optional[np.ndarray] = None
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.src_rate == self.dst_rate or samples.size == 0:
+            self.n_in += samples.size
+            self.n_out += samples.size
+            return samples
+        window = samples if self._prev is None else np.concatenate([self._prev, samples])
+        base = self.n_in - (0 if self._prev is None else 1)
+        last = self.n_in + samples.size - 1
+        # Every output whose source position is already covered
+        end = int(np.floor(last / self._step)) + 1
+        positions = np.arange(self.n_out, end, dtype=np.float64) * self._step - base
+        out = np.interp(positions, np.arange(window.size, dtype=np.float64), window).astype(np.float32)
+        self.n_in += samples.size
+        self.n_out = max(self.n_out, end)
+        self._prev = samples[-1:]
+        return out
+
+    def finish(self) -> np.ndarray:
+        """Pad to the length resample() would produce, holding the last sample."""
+        if self.src_rate == self.dst_rate or self.n_in == 0:
+            return np.zeros(0, dtype=np.float32)
+        target = max(1, int(round(self.n_in / self.src_rate * self.dst_rate)))
+        return np.full(max(0, target - self.n_out), self._prev[0], dtype=np.float32)
+
+
+class StreamingAudioDecoder:
+    """
+    Decode an audio file as it downloads into 16 kHz Whisper input.
+
+    WAV bodies are decoded and resampled chunk by chunk, so only the decoded
+    samples and one partial frame are ever held, never the file bytes.
+    Compressed formats cannot be decoded in-process. They are kept
+    (compressed, so small) until finish() pipes them through ffmpeg. Either
+    way more than max_bytes of input raises AudioTooLargeError while
+    reading.
+    """
+
+    def __init__(self, max_bytes: int, sample_rate: int = WHISPER_SAMPLE_RATE):
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.bytes_read = 0
+        self._pending = bytearray()
+        self._format: Optional[Tuple[int, int, int, int]] = None
+        self._data_left: Optional[int] = None
+        self._compressed: Optional[bytearray] = None
+        self._resampler: Optional[_LinearResampler] = None
+        self._chunks = []
+
+    def feed(self, chunk: bytes):
+        """
+        Consume the next piece of the file.
+
+        Raises:
+            AudioTooLargeError: If the total input exceeds max_bytes
+            ValueError: If the WAV header is invalid or unsupported
+        """
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_bytes:
+            raise AudioTooLargeError(f"Audio exceeds {self.max_bytes} bytes")
+        if self._compressed is not None:
+            self._compressed += chunk
+            return
+        self._pending += chunk
+        if self._format is None and not self._read_header():
+            return
+        if self._format is not None:
+            self._decode_pending()
+
+    def _read_header(self) -> bool:
+        """Parse the header once enough bytes are in; switch to compressed mode for non-WAV input."""
+        if len(self._pending) >= 4 and self._pending[:4] != b"RIFF":
+            self._compressed, self._pending = self._pending, bytearray()
+            return False
+        try:
+            format_tag, channels, sample_rate, bits_per_sample, offset, size = parse_wav_header(bytes(self._pending))
+        except struct.error:
+            # fmt chunk cut off mid-way
+            return False
+        except ValueError as e:
+            # Wait for more bytes unless the header is plainly broken
+            if "incomplete" in str(e) or len(self._pending) < 12:
+                return False
+            raise
+        self._format = (format_tag, max(1, channels), sample_rate, bits_per_sample)
+        # Streaming writers leave the size at 0 or 0xFFFFFFFF; read to the end then
+        self._data_left = size if 0 < size < 0xFFFFFFFF else None
+        self._resampler = _LinearResampler(sample_rate, self.sample_rate)
+        del self._pending[:offset]
+        return True
+
+    def _decode_pending(self):
+        format_tag, channels, _, bits_per_sample = self._format
+        if self._data_left is not None and len(self._pending) > self._data_left:
+            # Trailing chunks after the sample data
+            del self._pending[self._data_left:]
+        frame = channels * max(1, bits_per_sample // 8)
+        usable = len(self._pending) - (len(self._pending) % frame)
+        if usable == 0:
+            return
+        samples = decode_samples(bytes(self._pending[:usable]), format_tag, bits_per_sample)
+        del self._pending[:usable]
+        if self._data_left is not None:
+            self._data_left -= usable
+        out = self._resampler.process(downmix(samples, channels))
+        if out.size:
+            self._chunks.append(out)
+
+    def finish(self) -> np.ndarray:
+        """
+        Return the decoded audio.
+
+        Returns:
+            Mono float32 samples at the decoder's sample rate
+        """
+        if self._format is None and self._compressed is None:
+            if self._pending[:4] == b"RIFF":
+                raise ValueError("WAV header incomplete or missing data chunk")
+            # Input shorter than a RIFF tag
+            self._compressed = self._pending
+        if self._compressed is not None:
+            return ffmpeg_decode(bytes(self._compressed), self.sample_rate)
+        self._chunks.append(self._resampler.finish())
+        audio = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+        self._chunks = []
+        return audio
@@ -0,0 +1,156 @@
+"""
+Speech front-end ahead of the STT engine.
+
+A recorded turn can be up to a minute long. It often starts with the
+caller's pause after the beep and ends with the silence before Twilio's
+timeout, and Whisper pays for every 30 s window whether anyone is talking
+or not. decode_audio() already delivers 16 kHz mono float32. trim_silence()
+then keeps only the voiced regions of that signal:
+
+  - frame the audio and measure each frame's energy;
+  - gate frames against the clip's own noise floor;
+  - bridge short pauses between words, pad each region and join them.
+
+Clips without speech come back empty, and transcribe_audio() skips the
+engine for them. Every step runs on whole arrays; there is no per-frame
+Python loop. The seconds in and out are counted in /metrics so the saved
+compute is visible.
+"""
+import logging
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from server.audio_codec import WHISPER_SAMPLE_RATE
+from server.media_stream import VAD_MARGIN_DB, VAD_MIN_SPEECH_DB, VAD_MIN_UTTERANCE_MS, frame_energy_db
+from server.metrics import stt_audio_seconds, stt_skipped_turns
+
+logger = logging.getLogger(__name__)
+
+# 'trim' removes silence before transcription, 'off' sends the audio as decoded
+STT_FRONTEND = os.getenv("CLINICGUARD_STT_FRONTEND", "trim")
+# Pauses shorter than this stay in (they are between words); longer ones are cut
+TRIM_MIN_GAP_MS = int(os.getenv("CLINICGUARD_TRIM_MIN_GAP_MS", "500"))
+# Audio kept on either side of each voiced region so word edges are not clipped
+TRIM_PAD_MS = int(os.getenv("CLINICGUARD_TRIM_PAD_MS", "200"))
+TRIM_FRAME_MS = 20
+# Voiced runs shorter than this are clicks and line noise, not speech
+TRIM_MIN_RUN_MS = 60
+# Percentile of frame energies taken as the clip's noise floor
+NOISE_FLOOR_PERCENTILE = 10
+
+
+class TrimResult(NamedTuple):
+    """Output of trim_silence()."""
+    audio: np.ndarray
+    input_seconds: float
+    speech_seconds: float
+
+    @property
+    def removed_seconds(self) -> float:
+        return self.input_seconds - self.speech_seconds
+
+
+def _runs(mask: np.ndarray):
+    """Start and end (exclusive) indices of the True runs in a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return edges[::2], edges[1::2]
+
+
+def speech_regions(audio: np.ndarray, sample_rate: int = WHISPER_SAMPLE_RATE,
+                   min_gap_ms: int = TRIM_MIN_GAP_MS, pad_ms: int = TRIM_PAD_MS) -> np.ndarray:
+    """
+    Find the voiced regions of a clip.
+
+    Frames are voiced when their energy is margin_db above the noise floor,
+    i.e. a low percentile of the clip's frame energies. The threshold never
+    drops below VAD_MIN_SPEECH_DB, so a clip of line hiss counts as silent.
+    It is also capped at margin_db below the loudest frame, so a clip with
+    no pauses at all is still kept.
+
+    Args:
+        audio: Mono float32 samples
+        sample_rate: Sample rate of audio
+        min_gap_ms: Pauses shorter than this do not split a region
+        pad_ms: Audio kept before and after each region
+
+    Returns:
+        Array of shape (n_regions, 2) with start and end sample offsets
+    """
+    frame_length = sample_rate * TRIM_FRAME_MS // 1000
+    n_frames = audio.size // frame_length
+    if n_frames == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    energies = frame_energy_db(audio[:n_frames * frame_length].reshape(n_frames, frame_length))
+    noise_floor = np.percentile(energies, NOISE_FLOOR_PERCENTILE)
+    threshold = max(min(noise_floor + VAD_MARGIN_DB, energies.max() - VAD_MARGIN_DB), VAD_MIN_SPEECH_DB)
+
+    starts, ends = _runs(energies > threshold)
+    keep = ends - starts >= max(1, TRIM_MIN_RUN_MS // TRIM_FRAME_MS)
+    starts, ends = starts[keep], ends[keep]
+    if starts.size == 0 or (ends - starts).sum() * TRIM_FRAME_MS < VAD_MIN_UTTERANCE_MS:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # Merge runs separated by pauses shorter than min_gap_ms
+    split = np.flatnonzero(starts[1:] - ends[:-1] >= max(1, min_gap_ms // TRIM_FRAME_MS))
+    starts = np.concatenate((starts[:1], starts[1:][split]))
+    ends = np.concatenate((ends[:-1][split], ends[-1:]))
+
+    pad = pad_ms // TRIM_FRAME_MS
+    starts = np.maximum(starts - pad, 0)
+    ends = np.minimum(ends + pad, n_frames)
+    # Keep padded regions from overlapping when pad_ms * 2 > min_gap_ms
+    starts[1:] = np.maximum(starts[1:], ends[:-1])
+    regions = np.stack([starts, ends], axis=1) * frame_length
+    # The partial frame at the end belongs to the last region if it reaches it
+    if ends[-1] == n_frames:
+        regions[-1, 1] = audio.size
+    return regions
+
+
+def trim_silence(audio: np.ndarray, sample_rate: int = WHISPER_SAMPLE_RATE) -> TrimResult:
+    """
+    Cut leading, trailing and long interior silence out of a clip.
+
+    Args:
+        audio: Mono float32 samples
+        sample_rate: Sample rate of audio
+
+    Returns:
+        TrimResult with the joined voiced regions (empty if no speech was found)
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    input_seconds = audio.size / sample_rate
+    regions = speech_regions(audio, sample_rate)
+    if len(regions):
+        speech = np.concatenate([audio[start:end] for start, end in regions])
+    else:
+        speech = audio[:0]
+    return TrimResult(speech, input_seconds, speech.size / sample_rate)
+
+
+def prepare_speech(audio: np.ndarray) -> np.ndarray:
+    """
+    Apply the configured front-end to decoded 16 kHz audio and record the savings.
+
+    Args:
+        audio: Mono float32 samples at 16 kHz
+
+    Returns:
+        The audio to transcribe; empty when the clip holds no speech
+    """
+    if STT_FRONTEND == "off":
+        seconds = audio.size / WHISPER_SAMPLE_RATE
+        stt_audio_seconds.inc(seconds, stage="input")
+        stt_audio_seconds.inc(seconds, stage="transcribed")
+        return audio
+    result = trim_silence(audio)
+    stt_audio_seconds.inc(result.input_seconds, stage="input")
+    stt_audio_seconds.inc(result.speech_seconds, stage="transcribed")
+    if result.audio.size == 0:
+        stt_skipped_turns.inc()
+        logger.info(f"No speech in {result.input_seconds:.2f}s of audio, skipping transcription")
+    else:
+        logger.info(f"Trimmed {result.removed_seconds:.2f}s of silence ({result.input_seconds:.2f}s -> {result.speech_seconds:.2f}s)")
+    return result.audio
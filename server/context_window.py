@@ -0,0 +1,180 @@
+"""
+Token-budgeted conversation window with a rolling in-call summary.
+
+Without a limit every past turn goes into the prompt, so long calls get
+slower each turn and finally overflow the model context. ContextWindow
+keeps the newest turns that fit a token budget (counted with the model's own
+tokenizer) and folds the turns that fall out of the window into a running
+summary of the call.
+
+Folding is incremental (each fold only summarizes turns evicted since the
+last one, on top of the previous summary) and runs in the background: the
+window evicts down to a low-water mark in one go, so a fold happens once
+every few turns, and the turn that triggers it does not wait for it. Until
+a fold lands the evicted turns are simply left out of the prompt.
+
+A fold is itself an LLM generation. The application submits it to the
+'llm' stage, so it queues with the live turns, shows up in the stage's
+queue depth, and a turn that arrives while it runs waits for it like for
+any other generation.
+"""
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the summary plus history section of the prompt
+CONTEXT_HISTORY_TOKENS = int(os.getenv("CLINICGUARD_CONTEXT_TOKENS", "1400"))
+# After an eviction the window is shrunk to this fraction of the budget
+CONTEXT_LOW_WATER = 0.75
+
+Turn = Tuple[str, str]
+
+
+class _SessionWindow:
+    __slots__ = ("summary", "folded", "pending", "pending_upto")
+
+    def __init__(self):
+        self.summary = ""
+        self.folded = 0
+        self.pending: Optional[Future] = None
+        self.pending_upto = 0
+
+
+class ContextWindow:
+    """Per-session sliding window over conversation turns with background summarization."""
+
+    def __init__(self, budget_tokens: int, count_tokens: Callable[[str], int],
+                 render_turn: Callable[[Turn], str], summarize: Callable[[str, List[Turn]], str],
+                 low_water: float = CONTEXT_LOW_WATER, submit: Optional[Callable[..., Future]] = None):
+        """
+        Args:
+            budget_tokens: Tokens available for the summary and history lines
+            count_tokens: Tokenizer-based counter for a piece of prompt text
+            render_turn: Formats a (speaker, text) turn as its prompt line
+            summarize: Folds turns into a summary: summarize(previous_summary, turns) -> summary
+            low_water: Fraction of the budget the window is shrunk to on eviction
+            submit: Runs a fold in the background: submit(fn, *args) -> Future; defaults to
+                a private single-thread pool
+        """
+        self.budget_tokens = budget_tokens
+        self.low_water_tokens = int(budget_tokens * low_water)
+        self.render_turn = render_turn
+        self.summarize = summarize
+        self._count = functools.lru_cache(maxsize=8192)(count_tokens)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _SessionWindow] = {}
+        self._folder: Optional[ThreadPoolExecutor] = None
+        if submit is None:
+            self._folder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+            submit = self._folder.submit
+        self._submit = submit
+        self.folds = 0
+
+    def count_turn(self, turn: Turn) -> int:
+        """Tokens taken by one turn in the prompt."""
+        return self._count(self.render_turn(turn))
+
+    def render_summary(self, summary: str) -> str:
+        """The prompt line carrying the in-call summary."""
+        return self.render_turn(("System", f"Earlier in this call: {summary}"))
+
+    def fit(self, session_id: Optional[str], history: List[Turn], reserve_tokens: int = 0) -> Tuple[str, List[Turn]]:
+        """
+        Select what of a conversation goes into the next prompt.
+
+        Leading System turns (e.g. the patient summary from earlier calls) are
+        always kept; the remaining turns are kept newest first within the budget.
+
+        Args:
+            session_id: Session the history belongs to; None disables summarization
+            history: All turns of the conversation, oldest first
+            reserve_tokens: Budget already taken by the current user turn
+
+        Returns:
+            Tuple of (in-call summary, possibly empty; turns to include in order)
+        """
+        pinned_count = 0
+        while pinned_count < len(history) and history[pinned_count][0] == "System":
+            pinned_count += 1
+        pinned, turns = history[:pinned_count], history[pinned_count:]
+        budget = self.budget_tokens - reserve_tokens - sum(self.count_turn(t) for t in pinned)
+
+        if session_id is None:
+            return "", pinned + self._newest_within(turns, 0, budget)
+
+        with self._lock:
+            window = self._sessions.setdefault(session_id, _SessionWindow())
+            self._collect_fold(window)
+            # Turns were removed from the history (session cleared or reloaded): start over
+            if window.folded > len(turns):
+                window.summary, window.folded = "", 0
+            summary = window.summary
+            start = window.folded
+            folding = window.pending is not None
+
+        # Counting may load the model or call the LLaMA service, so it is done without the lock
+        summary_tokens = self._count(self.render_summary(summary)) if summary else 0
+        used = summary_tokens + sum(self.count_turn(t) for t in turns[start:])
+        if used > budget and not folding:
+            keep = self._newest_within(turns, start, self.low_water_tokens - reserve_tokens - summary_tokens)
+            cut = max(start + 1, len(turns) - len(keep))
+            with self._lock:
+                # Another turn of this session may have started or applied a fold in the meantime
+                if window.pending is None and window.folded == start:
+                    window.pending = self._submit(self.summarize, summary, list(turns[start:cut]))
+                    window.pending_upto = cut
+                    logger.info(f"Folding {cut - start} turn(s) of session {session_id} into the call summary")
+
+        return summary, pinned + self._newest_within(turns, start, budget - summary_tokens)
+
+    def _newest_within(self, turns: List[Turn], start: int, budget: int) -> List[Turn]:
+        """The longest suffix of turns[start:] that fits the budget (at least the last turn)."""
+        total = 0
+        first = len(turns)
+        while first > start:
+            cost = self.count_turn(turns[first - 1])
+            if total + cost > budget and first < len(turns):
+                break
+            total += cost
+            first -= 1
+        return turns[first:]
+
+    def _collect_fold(self, window: _SessionWindow):
+        """Apply a finished background fold. Must be called with the lock held."""
+        if window.pending is None or not window.pending.done():
+            return
+        future, window.pending = window.pending, None
+        try:
+            window.summary = future.result().strip()
+            window.folded = window.pending_upto
+            self.folds += 1
+        except Exception as e:
+            # The turns stay unfolded and are retried on the next eviction
+            logger.error(f"Call summary update failed: {e}")
+
+    def summary(self, session_id: str) -> str:
+        """The current in-call summary of a session."""
+        with self._lock:
+            window = self._sessions.get(session_id)
+            return window.summary if window else ""
+
+    def discard(self, session_id: str):
+        """Forget the window state of a finished session."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def wait_for_folds(self):
+        """Block until queued folds are done (used by tests and benchmarks)."""
+        with self._lock:
+            pending = [window.pending for window in self._sessions.values() if window.pending is not None]
+        wait(pending)
+
+    def shutdown(self):
+        """Stop the private summarization thread, if there is one."""
+        if self._folder is not None:
+            self._folder.shutdown(wait=False, cancel_futures=True)
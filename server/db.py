@@ -1,16 +1,70 @@
 import os
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text
+import threading
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, ForeignKey, Text, Index
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-DB_PATH = os.getenv("CLINICGUARD_DB_PATH", "sqlite:///clinicguard.db")
-engine = create_engine(DB_PATH, connect_args={"check_same_thread": False})
+DB_PATH = os.getenv("CLINICGUARD_DB_PATH") or os.getenv("DATABASE_URL") or "sqlite:///clinicguard.db"
+
+# SQLite tuning: WAL lets readers run during a write, NORMAL sync only fsyncs at checkpoints
+SQLITE_SYNCHRONOUS = os.getenv("CLINICGUARD_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("CLINICGUARD_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_MB = int(os.getenv("CLINICGUARD_SQLITE_CACHE_MB", "64"))
+
+# Connection pool for server databases (PostgreSQL)
+DB_POOL_SIZE = int(os.getenv("CLINICGUARD_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("CLINICGUARD_DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("CLINICGUARD_DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("CLINICGUARD_DB_POOL_RECYCLE", "1800"))
+
+def _tune_sqlite_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def create_db_engine(url: str) -> Engine:
+    """
+    Create an engine tuned for the database behind the URL.
+    
+    SQLite files get WAL journaling, relaxed fsyncs and a busy timeout on every
+    connection; server databases get a sized, pre-pinged, recycled pool.
+    
+    Args:
+        url: SQLAlchemy database URL
+        
+    Returns:
+        Engine
+    """
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        sqlite_engine = create_engine(url, connect_args={"check_same_thread": False})
+        if make_url(url).database not in (None, "", ":memory:"):
+            event.listen(sqlite_engine, "connect", _tune_sqlite_connection)
+        return sqlite_engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+
+engine = create_db_engine(DB_PATH)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+_init_lock = threading.Lock()
+_initialized = False
+
 class Patient(Base):
     __tablename__ = "patients"
     id = Column(Integer, primary_key=True, index=True)
@@ -38,6 +92,8 @@ class ConversationLog(Base):
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
     call = relationship("Call", back_populates="conversation_logs")
+    # History of a call is read by call_id in (timestamp, id) order
+    __table_args__ = (Index("ix_conversation_logs_call_id_timestamp", "call_id", "timestamp", "id"),)
 
 class Summary(Base):
     __tablename__ = "summaries"
@@ -46,15 +102,32 @@ class Summary(Base):
     summary_text = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     patient = relationship("Patient", back_populates="summaries")
+    # Summaries of a patient are read newest first
+    __table_args__ = (Index("ix_summaries_patient_id_created_at", "patient_id", "created_at"),)
 
 def init_db():
     """
-    Initialize the database by creating all tables.
+    Initialize the database by applying all pending migrations.
     This should be called once at application startup.
     """
+    from server.db_migrate import migrate
+    
     try:
-        Base.metadata.create_all(bind=engine)
-        logger.info(f"Database initialized successfully at {DB_PATH}")
+        applied = migrate(engine)
+        logger.info(f"Database initialized successfully at {engine.url.render_as_string(hide_password=True)} ({len(applied)} migration(s) applied)")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}", exc_info=True)
-        raise 
\ No newline at end of file
+        raise 
+
+def ensure_db_initialized():
+    """
+    Create the tables on first use instead of at import time.
+    Safe to call from any thread, any number of times.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            init_db()
+            _initialized = True
@@ -1 +1,193 @@
- 
\ No newline at end of file
+"""
+Schema migrations for the ClinicGuard database.
+
+Each migration is a numbered step, applied once, in order. The applied
+versions are recorded in the schema_migrations table. Databases that were
+created with the old create_all() call simply run the baseline (a no-op for
+existing tables) and then pick up the later steps. Every step must be safe to
+run against such a database.
+
+The baseline is frozen DDL for the schema as it was first shipped, not the
+current models in server/db.py, so a fresh database goes through the same
+steps as an old one. A change to the models needs a new migration; never
+edit the baseline.
+
+Several app processes may start against one database at once, so migrate()
+takes an exclusive lock before it reads the applied versions: BEGIN
+IMMEDIATE on SQLite, a transaction-scoped advisory lock on PostgreSQL. The
+others wait for it, then find nothing left to apply.
+
+Usage:
+    python -m server.db_migrate            # apply pending migrations
+    python -m server.db_migrate --status   # list applied and pending migrations
+"""
+import argparse
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator, List, Tuple
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, select, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL advisory lock key held while migrating
+MIGRATION_LOCK_KEY = 0x436C6E47
+
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+# The tables the old Base.metadata.create_all() created
+_baseline_metadata = MetaData()
+Table(
+    "patients",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("phone_number", String, unique=True, index=True),
+    Column("name", String, nullable=True),
+)
+Table(
+    "calls",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("call_sid", String, unique=True, index=True),
+    Column("patient_id", Integer, ForeignKey("patients.id")),
+    Column("started_at", DateTime),
+    Column("ended_at", DateTime, nullable=True),
+    Column("outcome", String, nullable=True),
+)
+Table(
+    "conversation_logs",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("call_id", Integer, ForeignKey("calls.id")),
+    Column("role", String),
+    Column("content", Text),
+    Column("timestamp", DateTime),
+)
+Table(
+    "summaries",
+    _baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("patient_id", Integer, ForeignKey("patients.id")),
+    Column("summary_text", Text),
+    Column("created_at", DateTime),
+)
+
+
+def _baseline(connection: Connection):
+    _baseline_metadata.create_all(bind=connection)
+
+
+def _hot_query_indexes(connection: Connection):
+    # Call history (call_id, ordered by timestamp, id) and patient summaries (patient_id, newest first)
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversation_logs_call_id_timestamp "
+        "ON conversation_logs (call_id, timestamp, id)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_summaries_patient_id_created_at "
+        "ON summaries (patient_id, created_at)"
+    ))
+    if connection.dialect.name == "sqlite":
+        # Give the planner row counts so it picks the new indexes on existing data
+        connection.execute(text("ANALYZE"))
+
+
+# (version, description, step); append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline schema", _baseline),
+    (2, "composite indexes for call history and patient summaries", _hot_query_indexes),
+]
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """
+    List the migration versions already applied to a database.
+
+    Args:
+        engine: Database engine
+
+    Returns:
+        Sorted list of versions
+    """
+    _migration_metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        return sorted(row[0] for row in connection.execute(select(schema_migrations.c.version)))
+
+
+@contextmanager
+def _exclusive_transaction(engine: Engine) -> Iterator[Connection]:
+    """A transaction that no other migrate() call can run alongside."""
+    if engine.dialect.name == "sqlite":
+        # pysqlite would open a deferred transaction on its own; issue BEGIN IMMEDIATE
+        # instead, which takes the write lock up front (waiting out the busy timeout)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            connection.exec_driver_sql("COMMIT")
+        return
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            # Released when the transaction ends
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        yield connection
+
+
+def migrate(engine: Engine) -> List[int]:
+    """
+    Apply all pending migrations in one transaction, under an exclusive lock.
+
+    Args:
+        engine: Database engine
+
+    Returns:
+        Versions applied by this call
+    """
+    applied = []
+    with _exclusive_transaction(engine) as connection:
+        _migration_metadata.create_all(bind=connection)
+        done = {row[0] for row in connection.execute(select(schema_migrations.c.version))}
+        for version, description, step in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            step(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+            applied.append(version)
+    return applied
+
+
+def main():
+    from server.db import engine
+
+    parser = argparse.ArgumentParser(description="ClinicGuard database migrations")
+    parser.add_argument("--status", action="store_true", help="List migrations without applying them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        done = set(applied_versions(engine))
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8}{description}")
+        return
+    applied = migrate(engine)
+    print(f"Applied {len(applied)} migration(s)" if applied else "Database is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Shared outbound HTTP client for ClinicGuard-AI.
+
+Recording downloads from Twilio and synthesis requests to ElevenLabs go
+through one pooled httpx.AsyncClient per process, so TCP connections and TLS
+sessions are kept alive between turns instead of being re-established for
+every request. A per-host semaphore caps concurrent requests to any single
+upstream on top of the global connection limits.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool configuration
+HTTP_MAX_CONNECTIONS = int(os.getenv("CLINICGUARD_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("CLINICGUARD_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("CLINICGUARD_HTTP_MAX_PER_HOST", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("CLINICGUARD_HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+class SharedHTTPClient:
+    """Lazily created, process-wide httpx.AsyncClient with per-host limits."""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        max_per_host: int = HTTP_MAX_PER_HOST,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_per_host = max_per_host
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The underlying pooled client, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=HTTP_DEFAULT_TIMEOUT_SECONDS,
+                # Twilio answers recording URLs with a redirect to the media host
+                follow_redirects=True,
+                transport=self._transport,
+            )
+            logger.info(
+                f"Created shared HTTP client (max_connections={self.limits.max_connections}, "
+                f"keepalive={self.limits.max_keepalive_connections}, per_host={self.max_per_host})"
+            )
+        return self._client
+
+    def clone(self) -> "SharedHTTPClient":
+        """A new client with the same limits and transport, e.g. for a short-lived event loop."""
+        return SharedHTTPClient(
+            max_connections=self.limits.max_connections,
+            max_keepalive_connections=self.limits.max_keepalive_connections,
+            max_per_host=self.max_per_host,
+            keepalive_expiry=self.limits.keepalive_expiry,
+            transport=self._transport,
+        )
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request over the shared connection pool.
+
+        Args:
+            method: HTTP method
+            url: Absolute request URL
+            **kwargs: Passed through to httpx.AsyncClient.request
+
+        Returns:
+            The fully read response
+        """
+        async with self._host_limit(url):
+            return await self.client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """Send a GET request over the shared connection pool."""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """Send a POST request over the shared connection pool."""
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Send a request and expose the response body as a stream.
+
+        The per-host slot is held until the body has been consumed.
+        """
+        async with self._host_limit(url):
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+
+    async def aclose(self):
+        """Close all pooled connections."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Closed shared HTTP client")
+        self._client = None
+        self._host_limits.clear()
+
+
+# Global shared client instance
+http_client = SharedHTTPClient()
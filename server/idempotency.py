@@ -0,0 +1,126 @@
+"""
+Idempotency cache for Twilio webhooks.
+
+Twilio retries a webhook when the response is slow, resending the same
+RecordingSid while the first request is still running. Each retry would
+transcribe, generate and synthesize again and append duplicate turns to the
+session. Results are keyed by a request identifier: a duplicate that arrives
+while the first request is still running joins it, and one that arrives
+after it finished gets the stored response. Entries expire after a TTL and
+the cache holds at most max_entries responses. Failures are not stored, so a
+retry after an error runs again.
+
+The cache is per process. With several server workers a retry may land on a
+worker that has not seen the recording.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("CLINICGUARD_IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("CLINICGUARD_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+
+class IdempotencyCache:
+    """Bounded, time-limited response cache with in-flight request coalescing."""
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._done: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: dict = {}
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the stored response for key, if it has not expired."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str) -> Optional[str]:
+        entry = self._done.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if self.clock() - stored_at > self.ttl_seconds:
+            del self._done[key]
+            return None
+        return response
+
+    def _put_locked(self, key: str, response: str):
+        self._done.pop(key, None)
+        self._done[key] = (self.clock(), response)
+        # Entries are in insertion order, so expired ones are at the front
+        cutoff = self.clock() - self.ttl_seconds
+        while self._done:
+            oldest_key, (stored_at, _) = next(iter(self._done.items()))
+            if stored_at >= cutoff and len(self._done) <= self.max_entries:
+                break
+            del self._done[oldest_key]
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return the response for key, computing it at most once.
+
+        The computation runs as its own task, so it finishes (and is stored
+        for retries) even if the request that started it is cancelled.
+
+        Args:
+            key: Request identifier, e.g. the Twilio RecordingSid
+            compute: Coroutine function producing the response
+
+        Returns:
+            The response body
+        """
+        with self._lock:
+            response = self._get_locked(key)
+            if response is not None:
+                self.hits += 1
+                logger.info(f"Serving stored response for duplicate request {key}")
+                return response
+            task = self._inflight.get(key)
+            if task is not None:
+                self.joined += 1
+                logger.info(f"Joining in-flight request {key}")
+            else:
+                self.misses += 1
+                task = asyncio.ensure_future(self._compute(key, compute))
+                # Mark the error as seen when every waiter has gone away
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        try:
+            response = await compute()
+            with self._lock:
+                self._put_locked(key, response)
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Cache counters for monitoring."""
+        with self._lock:
+            return {
+                "entries": len(self._done),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "joined": self.joined,
+                "misses": self.misses,
+            }
+
+
+# Global webhook response cache
+webhook_cache = IdempotencyCache()
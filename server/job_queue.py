@@ -0,0 +1,460 @@
+"""
+Durable background jobs on a local SQLite queue.
+
+Work that must not run inside a Twilio webhook, such as the end-of-call LLM
+summary, is recorded as a job row and the webhook returns right away.
+Jobs are claimed one at a time under a lease. How they run depends on
+where the model lives:
+
+  - CLINICGUARD_LLM_BACKEND=server: worker processes run them at a lowered
+    CPU priority (os.nice) and send their generations to the shared LLaMA
+    service at background priority, so live-call requests are admitted first.
+    With CLINICGUARD_JOB_WORKERS=0 they are run by a separate
+    `python -m server.job_queue` instead.
+  - CLINICGUARD_LLM_BACKEND=local: a worker process would load its own copy
+    of the GGUF and compete with live calls for memory and cores, so no
+    worker processes are started. InProcessJobRunner runs the jobs inside
+    the API process on the 'llm' stage, starting one only while no live
+    generation is running or waiting. A live turn that arrives during a
+    job still waits for that one job to finish. This does not depend on
+    CLINICGUARD_JOB_WORKERS, since nothing else may run them.
+
+A failed job is retried
+with exponential backoff until max_attempts. If a worker dies, its lease
+expires and the job is claimed again. The queue lives in its own SQLite
+file, so it works the same whichever database the application uses.
+
+Usage:
+    python -m server.job_queue --workers 2   # run workers outside the API process (server backend only)
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("CLINICGUARD_JOB_DB_PATH", "clinicguard_jobs.db")
+JOB_WORKERS = int(os.getenv("CLINICGUARD_JOB_WORKERS", "1"))
+JOB_WORKER_NICE = int(os.getenv("CLINICGUARD_JOB_WORKER_NICE", "10"))
+JOB_MAX_ATTEMPTS = int(os.getenv("CLINICGUARD_JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_SECONDS = float(os.getenv("CLINICGUARD_JOB_RETRY_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.getenv("CLINICGUARD_JOB_LEASE_SECONDS", "600"))
+# Same setting as agent_services.LLM_BACKEND, read here so workers and the CLI stay light
+JOB_LLM_BACKEND = os.getenv("CLINICGUARD_LLM_BACKEND", "local")
+# Finished jobs are kept this long for the status endpoint, then deleted
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+JOB_POLL_SECONDS = 0.5
+
+# Job kind -> "module:function" called with the payload dict; imported inside the worker
+JOB_HANDLERS = {
+    "summarize_call": "server.agent_services:run_summarize_call_job",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_expires REAL,
+    worker TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs (status, run_after);
+"""
+
+
+class JobQueue:
+    """SQLite-backed job table with leased claims, retries and status counters."""
+
+    def __init__(self, path: str = JOB_DB_PATH, handlers: Optional[Dict[str, str]] = None,
+                 lease_seconds: float = JOB_LEASE_SECONDS, retry_seconds: float = JOB_RETRY_SECONDS):
+        self.path = path
+        self.handlers = dict(JOB_HANDLERS if handlers is None else handlers)
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self._resolved: Dict[str, Callable[[dict], None]] = {}
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @contextmanager
+    def _connection(self):
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        connection.executescript(_SCHEMA)
+                        self._schema_ready = True
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, kind: str, payload: dict, dedupe_key: Optional[str] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """
+        Record a job for the workers.
+
+        Args:
+            kind: Job kind, a key of the handler table
+            payload: JSON-serializable handler arguments
+            dedupe_key: Jobs with the same key are only recorded once (e.g. Twilio retrying a webhook)
+            max_attempts: Runs before the job is marked failed
+
+        Returns:
+            Id of the new job, or of the existing one with the same dedupe_key
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = time.time()
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO jobs (kind, payload, dedupe_key, max_attempts, run_after, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), dedupe_key, max(1, max_attempts), now, now),
+            )
+            if cursor.rowcount:
+                logger.info(f"Queued {kind} job {cursor.lastrowid}")
+                return cursor.lastrowid
+            row = connection.execute("SELECT id FROM jobs WHERE dedupe_key = ?", (dedupe_key,)).fetchone()
+            logger.info(f"{kind} job {row[0]} already queued for {dedupe_key}")
+            return row[0]
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """
+        Take the next due job and lease it to a worker.
+
+        Jobs whose lease ran out (their worker died) are put back first, or
+        failed if they used up their attempts.
+
+        Args:
+            worker: Worker name recorded on the job
+
+        Returns:
+            Dict with id, kind, payload and attempts, or None if nothing is due
+        """
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                    "last_error = 'lease expired', finished_at = CASE WHEN attempts >= max_attempts THEN ? END "
+                    "WHERE status = 'running' AND lease_expires < ?",
+                    (now, now),
+                )
+                row = connection.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'queued' AND run_after <= ? "
+                    "ORDER BY run_after, id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ? WHERE id = ?",
+                        (worker, now + self.lease_seconds, row[0]),
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1}
+
+    def complete(self, job_id: int):
+        """Mark a job done and drop finished jobs past the retention period."""
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'done', lease_expires = NULL, finished_at = ? WHERE id = ?", (now, job_id)
+            )
+            connection.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (now - JOB_RETENTION_SECONDS,)
+            )
+
+    def fail(self, job_id: int, error: str):
+        """Schedule a retry with exponential backoff, or mark the job failed after its last attempt."""
+        now = time.time()
+        with self._connection() as connection:
+            attempts, max_attempts = connection.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if attempts >= max_attempts:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', lease_expires = NULL, last_error = ?, finished_at = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+                logger.error(f"Job {job_id} failed after {attempts} attempt(s): {error}")
+                return
+            delay = self.retry_seconds * (2 ** (attempts - 1))
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', lease_expires = NULL, last_error = ?, run_after = ? WHERE id = ?",
+                (error, now + delay, job_id),
+            )
+            logger.warning(f"Job {job_id} attempt {attempts} failed, retrying in {delay:.0f}s: {error}")
+
+    def _handler(self, kind: str) -> Callable[[dict], None]:
+        if kind not in self._resolved:
+            module_name, function_name = self.handlers[kind].split(":")
+            self._resolved[kind] = getattr(importlib.import_module(module_name), function_name)
+        return self._resolved[kind]
+
+    def run_next(self, worker: str) -> bool:
+        """
+        Claim and run one job.
+
+        Args:
+            worker: Worker name recorded on the job
+
+        Returns:
+            True if a job was run (successfully or not), False if none was due
+        """
+        job = self.claim(worker)
+        if job is None:
+            return False
+        started = time.perf_counter()
+        try:
+            self._handler(job["kind"])(job["payload"])
+        except Exception as e:
+            self.fail(job["id"], f"{type(e).__name__}: {e}")
+            return True
+        self.complete(job["id"])
+        logger.info(f"Job {job['id']} ({job['kind']}) done in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def stats(self) -> dict:
+        """Job counts by status, age of the oldest due job and the latest failures."""
+        now = time.time()
+        with self._connection() as connection:
+            counts = dict(connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = connection.execute(
+                "SELECT MIN(run_after) FROM jobs WHERE status = 'queued' AND run_after <= ?", (now,)
+            ).fetchone()[0]
+            failures = connection.execute(
+                "SELECT id, kind, attempts, last_error FROM jobs WHERE status = 'failed' ORDER BY finished_at DESC LIMIT 5"
+            ).fetchall()
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_due_age_s": round(now - oldest, 1) if oldest is not None else 0.0,
+            "recent_failures": [
+                {"id": job_id, "kind": kind, "attempts": attempts, "error": error}
+                for job_id, kind, attempts, error in failures
+            ],
+        }
+
+
+def _worker_main(path: str, handlers: Dict[str, str], niceness: int, stop, name: str):
+    """Entry point of a worker process."""
+    logging.basicConfig(level=logging.INFO)
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Could not lower priority of {name}: {e}")
+    # Generations from this process queue behind live calls on the LLaMA service
+    from server.llama_client import llama_client
+    from server.llm_batcher import PRIORITY_BACKGROUND
+    llama_client.priority = PRIORITY_BACKGROUND
+
+    worker_queue = JobQueue(path, handlers)
+    logger.info(f"{name} started (pid {os.getpid()}, nice +{niceness})")
+    while not stop.is_set():
+        try:
+            if not worker_queue.run_next(name):
+                stop.wait(JOB_POLL_SECONDS)
+        except Exception as e:
+            # Queue database trouble; back off instead of spinning
+            logger.error(f"{name} could not reach the job queue: {e}")
+            stop.wait(JOB_POLL_SECONDS * 10)
+
+
+class JobWorkerPool:
+    """Worker processes draining a JobQueue at lowered priority."""
+
+    def __init__(self, path: str = JOB_DB_PATH, processes: int = JOB_WORKERS, niceness: int = JOB_WORKER_NICE,
+                 handlers: Optional[Dict[str, str]] = None, llm_backend: str = JOB_LLM_BACKEND):
+        self.path = path
+        self.processes = max(0, processes)
+        self.llm_backend = llm_backend
+        self.niceness = niceness
+        self.handlers = dict(JOB_HANDLERS if handlers is None else handlers)
+        # Spawned, not forked: the API process holds threads, sockets and possibly model weights
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = None
+        self._workers: List[multiprocessing.Process] = []
+
+    def start(self) -> bool:
+        """
+        Start the worker processes.
+
+        Returns:
+            True if workers are running. False if processes is 0 or the LLM
+            backend is 'local', where each worker would load its own model
+            (use InProcessJobRunner instead)
+        """
+        if self._workers:
+            return True
+        if not self.processes:
+            return False
+        if self.llm_backend != "server":
+            logger.warning("Not starting job worker processes with the local LLM backend; "
+                           "each would load its own copy of the model")
+            return False
+        self._stop = self._context.Event()
+        for index in range(self.processes):
+            name = f"job-worker-{index}"
+            worker = self._context.Process(
+                target=_worker_main, args=(self.path, self.handlers, self.niceness, self._stop, name),
+                name=name, daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started {self.processes} job worker(s) on {self.path}")
+        return True
+
+    def alive(self) -> int:
+        """Number of worker processes still running."""
+        return sum(1 for worker in self._workers if worker.is_alive())
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Ask the workers to stop after their current job.
+
+        Workers still busy after the timeout are terminated; their job is
+        claimed again once its lease expires.
+        """
+        if not self._workers:
+            return
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+            if worker.is_alive():
+                logger.warning(f"Terminating {worker.name} mid-job")
+                worker.terminate()
+                worker.join()
+        self._workers = []
+
+
+class InProcessJobRunner:
+    """Runs jobs in the API process on a pipeline stage, only while the stage is idle."""
+
+    def __init__(self, queue: JobQueue, stage: str = "llm", poll_seconds: float = JOB_POLL_SECONDS,
+                 name: str = "in-process", executor=None):
+        self.queue = queue
+        self.stage = stage
+        # Defaults to the global stage_executor, imported when the runner starts
+        self.executor = executor
+        self.poll_seconds = poll_seconds
+        self.name = name
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start draining the queue on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Running jobs in process on the idle '{self.stage}' stage")
+
+    def alive(self) -> int:
+        """1 while the runner is running, else 0."""
+        return int(self._task is not None and not self._task.done())
+
+    async def stop(self):
+        """Stop taking jobs; a job already running finishes on its stage thread."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        executor = self.executor
+        if executor is None:
+            from server.stage_executor import stage_executor as executor
+
+        while True:
+            depth = executor.queue_depths()[self.stage]
+            if depth["active"] or depth["queued"]:
+                # Live turns first
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            try:
+                ran = await executor.run(self.stage, self.queue.run_next, self.name)
+            except Exception as e:
+                logger.error(f"{self.name} job runner could not reach the job queue: {e}")
+                ran = False
+                await asyncio.sleep(self.poll_seconds * 9)
+            if not ran:
+                await asyncio.sleep(self.poll_seconds)
+
+
+def start_job_execution(workers: JobWorkerPool, runner: InProcessJobRunner) -> str:
+    """
+    Start whatever runs queued jobs for the configured LLM backend; called at API startup.
+
+    Returns:
+        'workers', 'external' (server backend with 0 workers; run python -m server.job_queue)
+        or 'in-process'
+    """
+    if workers.llm_backend == "server":
+        return "workers" if workers.start() else "external"
+    runner.start()
+    return "in-process"
+
+
+# Global job queue, worker pool and in-process runner instances
+job_queue = JobQueue()
+job_workers = JobWorkerPool()
+job_runner = InProcessJobRunner(job_queue)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ClinicGuard background job workers")
+    parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS), help="Worker processes")
+    parser.add_argument("--status", action="store_true", help="Print queue status and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        print(json.dumps(job_queue.stats(), indent=2))
+        return
+    pool = JobWorkerPool(processes=args.workers)
+    if not pool.start():
+        raise SystemExit("Job worker processes need CLINICGUARD_LLM_BACKEND=server; "
+                         "with the local backend the API runs jobs itself")
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    try:
+        while not stopping.is_set() and pool.alive():
+            stopping.wait(1.0)
+    except KeyboardInterrupt:
+        pass
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Client for the shared LLaMA inference service (server/llama_server.py).
+
+With CLINICGUARD_LLM_BACKEND=server the API workers do not load the GGUF
+weights themselves; generation requests go to one llama_server process that
+batches all of them on a single copy of the model. Calls are made from the
+'llm' stage threads, so the client is synchronous and keeps a pooled
+keep-alive httpx.Client.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterator, List, Optional
+
+import httpx
+
+from server.http_client import HTTP_KEEPALIVE_EXPIRY_SECONDS, HTTP_MAX_PER_HOST
+from server.llm_batcher import DEFAULT_REPEAT_PENALTY, DEFAULT_TOP_K, DEFAULT_TOP_P, PRIORITY_LIVE
+from server.metrics import record_generation
+
+logger = logging.getLogger(__name__)
+
+LLAMA_SERVER_URL = os.getenv("CLINICGUARD_LLAMA_SERVER_URL", "http://localhost:8002")
+LLAMA_SERVER_TIMEOUT_SECONDS = float(os.getenv("CLINICGUARD_LLAMA_SERVER_TIMEOUT", "120"))
+
+
+class LlamaServerClient:
+    """Blocking client for /generate on the LLaMA service, with a lazily created pooled connection."""
+
+    def __init__(self, base_url: str = LLAMA_SERVER_URL, timeout: float = LLAMA_SERVER_TIMEOUT_SECONDS,
+                 transport: Optional[httpx.BaseTransport] = None, priority: int = PRIORITY_LIVE):
+        self.base_url = base_url.rstrip("/")
+        # Admission priority sent with every generation; job workers lower theirs
+        self.priority = priority
+        self.timeout = timeout
+        self._transport = transport
+        self._client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        """The underlying pooled client, created on first use."""
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(
+                    base_url=self.base_url,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_PER_HOST,
+                        max_keepalive_connections=HTTP_MAX_PER_HOST,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                    ),
+                    timeout=httpx.Timeout(self.timeout, connect=5.0),
+                    transport=self._transport,
+                )
+            return self._client
+
+    def health(self) -> dict:
+        """Fetch the service health report."""
+        response = self.client.get("/health")
+        response.raise_for_status()
+        return response.json()
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens of prompt text with the service's tokenizer."""
+        response = self.client.post("/tokenize", json={"text": text})
+        response.raise_for_status()
+        return response.json()["count"]
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float, stop: List[str],
+                 top_k: int = DEFAULT_TOP_K, top_p: float = DEFAULT_TOP_P,
+                 repeat_penalty: float = DEFAULT_REPEAT_PENALTY) -> str:
+        """
+        Generate a completion.
+
+        Args:
+            prompt: Full prompt text
+            max_tokens: Maximum number of tokens to generate
+            temperature: Sampling temperature
+            stop: Strings that end the generation
+            top_k, top_p, repeat_penalty: Sampler settings, defaulting to the local backend's
+
+        Returns:
+            Generated text
+        """
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "stop": stop,
+                   "top_k": top_k, "top_p": top_p, "repeat_penalty": repeat_penalty, "priority": self.priority}
+        started = time.perf_counter()
+        response = self.client.post("/generate", json=payload)
+        response.raise_for_status()
+        result = response.json()
+        record_generation("server", result.get("tokens", 0), time.perf_counter() - started)
+        return result["response"]
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float, stop: List[str],
+               top_k: int = DEFAULT_TOP_K, top_p: float = DEFAULT_TOP_P,
+               repeat_penalty: float = DEFAULT_REPEAT_PENALTY) -> Iterator[str]:
+        """
+        Generate a completion and yield text pieces as the service produces them.
+
+        Closing the iterator early closes the connection, which cancels the
+        generation on the service.
+        """
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "stop": stop, "stream": True,
+                   "top_k": top_k, "top_p": top_p, "repeat_penalty": repeat_penalty, "priority": self.priority}
+        started = time.perf_counter()
+        with self.client.stream("POST", "/generate", json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(f"LLaMA service error: {event['error']}")
+                if event.get("done"):
+                    record_generation("server", event.get("tokens", 0), time.perf_counter() - started)
+                    return
+                yield event["text"]
+
+    def close(self):
+        """Close pooled connections."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+# Global LLaMA service client instance
+llama_client = LlamaServerClient()
@@ -1,67 +1,128 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import torch
-from transformers import pipeline
+from typing import List
+import asyncio
+import json
 import os
 import logging
 
+from server.llm_batcher import (
+    DEFAULT_REPEAT_PENALTY, DEFAULT_TOP_K, DEFAULT_TOP_P, LLM_MAX_SEQUENCES, PRIORITY_LIVE, ContinuousBatcher,
+    LlamaBatchEngine
+)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Llama Service")
+# One GGUF copy shared by every API worker; the KV cache is split between sequences
+LLAMA_MODEL_PATH = os.getenv("LLAMA_MODEL_PATH", "models/llama-3-8b-q4_0.gguf")
+LLAMA_SERVER_CTX = int(os.getenv("CLINICGUARD_LLAMA_SERVER_CTX", "8192"))
+LLAMA_SERVER_BATCH = int(os.getenv("CLINICGUARD_LLAMA_SERVER_BATCH", "512"))
 
-# Load the LLaMA model
-model_path = "/app/models/llama-3-8b"
-try:
-    if os.path.exists(model_path):
-        generator = pipeline(
-            "text-generation",
-            model=model_path,
-            torch_dtype=torch.float16,
-            device_map="auto"
-        )
-        logger.info(f"Llama model loaded from {model_path}")
-    else:
-        logger.warning(f"Model not found at {model_path}")
-        generator = None
-except Exception as e:
-    logger.error(f"Failed to load Llama model: {e}")
-    generator = None
+batcher = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the model once and run the continuous-batching scheduler."""
+    global batcher
+    try:
+        if os.path.exists(LLAMA_MODEL_PATH):
+            engine = await asyncio.to_thread(
+                LlamaBatchEngine, LLAMA_MODEL_PATH, LLAMA_SERVER_CTX, LLAMA_SERVER_BATCH, LLM_MAX_SEQUENCES
+            )
+            batcher = ContinuousBatcher(engine, max_sequences=LLM_MAX_SEQUENCES)
+            logger.info(f"Llama GGUF model loaded from {LLAMA_MODEL_PATH}")
+        else:
+            logger.warning(f"Model not found at {LLAMA_MODEL_PATH}")
+    except Exception as e:
+        logger.error(f"Failed to load Llama model: {e}")
+    yield
+    if batcher is not None:
+        await asyncio.to_thread(batcher.close)
+        batcher.engine.close()
+
+app = FastAPI(title="Llama Service", lifespan=lifespan)
 
 class GenerateRequest(BaseModel):
     prompt: str
+    max_tokens: int = 200
+    temperature: float = 0.7
+    top_k: int = DEFAULT_TOP_K
+    top_p: float = DEFAULT_TOP_P
+    repeat_penalty: float = DEFAULT_REPEAT_PENALTY
+    stop: List[str] = []
+    stream: bool = False
+    priority: int = PRIORITY_LIVE
 
 @app.post("/generate")
 async def generate_response(request: GenerateRequest):
     """
     Generate text response using LLaMA model.
-    Accepts JSON body with prompt.
+    Accepts JSON body with prompt, sampling options and an admission priority
+    (lower first; background jobs send a higher value). With stream=true the
+    response is newline-delimited JSON: {"text": ...} per piece, then
+    {"done": true, "finish_reason": ..., "tokens": ...}.
     """
+    if batcher is None:
+        raise HTTPException(status_code=500, detail="Llama model not loaded")
     try:
-        if generator is None:
-            raise HTTPException(status_code=500, detail="Llama model not loaded")
-        
-        logger.info(f"Generating response for prompt: {request.prompt[:100]}...")
-        response = generator(
+        generation = batcher.submit(
             request.prompt,
-            max_new_tokens=200,
-            do_sample=True,
-            temperature=0.7
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            stop=request.stop,
+            loop=asyncio.get_running_loop(),
+            priority=request.priority,
+            top_k=request.top_k,
+            top_p=request.top_p,
+            repeat_penalty=request.repeat_penalty
         )
-        
-        generated_text = response[0]["generated_text"]
-        logger.info("Response generated successfully")
-        return {"response": generated_text}
-    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Queued generation of {len(generation.prompt_tokens)} prompt tokens")
+    if request.stream:
+        async def events():
+            try:
+                async for piece in generation:
+                    yield json.dumps({"text": piece}) + "\n"
+                yield json.dumps({"done": True, "finish_reason": generation.finish_reason, "tokens": generation.n_tokens}) + "\n"
+            except Exception as e:
+                logger.error(f"Generation error: {e}")
+                yield json.dumps({"error": str(e)}) + "\n"
+            finally:
+                # Client went away or generation ended; free the sequence slot either way
+                generation.cancel()
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    try:
+        generated_text = "".join([piece async for piece in generation])
     except Exception as e:
         logger.error(f"Generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        generation.cancel()
+    logger.info("Response generated successfully")
+    return {"response": generated_text, "finish_reason": generation.finish_reason, "tokens": generation.n_tokens}
+
+class TokenizeRequest(BaseModel):
+    text: str
+
+@app.post("/tokenize")
+async def tokenize(request: TokenizeRequest):
+    """Count the tokens of a piece of prompt text with the model's tokenizer."""
+    if batcher is None:
+        raise HTTPException(status_code=500, detail="Llama model not loaded")
+    return {"count": len(batcher.engine.tokenize(request.text, add_bos=False))}
 
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "model_loaded": generator is not None}
+    stats = batcher.stats() if batcher is not None else {}
+    return {"status": "healthy", "model_loaded": batcher is not None, **stats}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -0,0 +1,434 @@
+"""
+Continuous-batching scheduler for LLaMA generation.
+
+One set of GGUF weights serves many concurrent conversations. Requests wait
+in a queue and join the running batch as soon as a sequence slot and enough
+KV cache are free, instead of waiting for the whole batch to finish. Every
+scheduler step is a single llama_decode call holding one new token for each
+generating sequence plus prompt chunks of newly admitted ones (chunked
+prefill), so long prompts never stall the sequences that are already
+streaming. Tokens are delivered to each request as they are sampled.
+Live-call requests are admitted ahead of background ones (end-of-call
+summaries), which only get the slots live traffic leaves free.
+"""
+import asyncio
+import codecs
+import itertools
+import logging
+import os
+import queue
+import threading
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_SEQUENCES = int(os.getenv("CLINICGUARD_LLM_MAX_SEQUENCES", "8"))
+# Admission priorities, lowest first
+PRIORITY_LIVE = 0
+PRIORITY_BACKGROUND = 10
+# Sampler defaults of llama-cpp-python's Llama.__call__, which the local backend uses,
+# so replies read the same whichever backend generated them
+DEFAULT_TOP_K = 40
+DEFAULT_TOP_P = 0.95
+DEFAULT_REPEAT_PENALTY = 1.1
+# Recent tokens (prompt included) the repeat penalty looks at, as in Llama(last_n_tokens_size=64)
+REPEAT_LAST_N = 64
+
+
+class _Finished:
+    __slots__ = ()
+
+
+_FINISHED = _Finished()
+
+
+class GenerationRequest:
+    """
+    One queued generation, consumed as a sync or async iterator of text pieces.
+
+    After iteration ends, finish_reason is 'stop', 'length' or 'cancelled' and
+    n_tokens is the number of generated tokens.
+    """
+
+    def __init__(self, prompt_tokens: List[int], max_tokens: int, temperature: float,
+                 stop: Sequence[str], loop: Optional[asyncio.AbstractEventLoop] = None,
+                 top_k: int = DEFAULT_TOP_K, top_p: float = DEFAULT_TOP_P,
+                 repeat_penalty: float = DEFAULT_REPEAT_PENALTY):
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.repeat_penalty = repeat_penalty
+        self.stop = [s for s in stop if s]
+        self.finish_reason: Optional[str] = None
+        self.n_tokens = 0
+        self.cancelled = threading.Event()
+        self._loop = loop
+        self._events: Any = asyncio.Queue() if loop is not None else queue.Queue()
+
+    def cancel(self):
+        """Stop generating; the slot is freed at the next scheduler step."""
+        self.cancelled.set()
+
+    def _deliver(self, event):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._events.put_nowait, event)
+            except RuntimeError:
+                # Event loop already closed, nobody is listening any more
+                self.cancelled.set()
+        else:
+            self._events.put(event)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            event = self._events.get()
+            if event is _FINISHED:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            event = await self._events.get()
+            if event is _FINISHED:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+
+class _Sequence:
+    __slots__ = ("request", "seq_id", "n_prefilled", "n_past", "next_token", "text", "emitted", "decoder", "recent")
+
+    def __init__(self, request: GenerationRequest, seq_id: int):
+        self.request = request
+        self.seq_id = seq_id
+        self.n_prefilled = 0
+        self.n_past = 0
+        self.next_token: Optional[int] = None
+        self.text = ""
+        self.emitted = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        # Last REPEAT_LAST_N tokens of prompt and output, for the repeat penalty
+        self.recent = list(request.prompt_tokens[-REPEAT_LAST_N:])
+
+    @property
+    def reserved(self) -> int:
+        return len(self.request.prompt_tokens) + self.request.max_tokens
+
+
+def sample_token(logits: np.ndarray, temperature: float, rng: np.random.Generator, top_k: int = DEFAULT_TOP_K,
+                 top_p: float = DEFAULT_TOP_P, repeat_penalty: float = DEFAULT_REPEAT_PENALTY,
+                 recent_tokens: Sequence[int] = ()) -> int:
+    """
+    Pick the next token from a row of logits.
+
+    Follows llama.cpp's sampler chain: repeat penalty, top-k, top-p, then
+    temperature.
+
+    Args:
+        logits: Unnormalized scores over the vocabulary
+        temperature: Sampling temperature; 0 or less means greedy (after the repeat penalty)
+        rng: Random generator
+        top_k: Keep only the k most likely tokens; 0 or less keeps all
+        top_p: Keep the smallest set of tokens whose probability reaches top_p
+        repeat_penalty: Divisor applied to the scores of recently seen tokens; 1 disables it
+        recent_tokens: Tokens the repeat penalty applies to
+
+    Returns:
+        Token id
+    """
+    logits = logits.astype(np.float64)
+    if repeat_penalty != 1.0 and len(recent_tokens):
+        seen = np.unique(np.asarray(recent_tokens, dtype=np.int64))
+        scores = logits[seen]
+        logits[seen] = np.where(scores > 0, scores / repeat_penalty, scores * repeat_penalty)
+    if temperature <= 0:
+        return int(np.argmax(logits))
+    candidates = np.argsort(logits)[::-1]
+    if 0 < top_k < candidates.size:
+        candidates = candidates[:top_k]
+    scaled = logits[candidates] - logits[candidates[0]]
+    probs = np.exp(scaled)
+    probs /= probs.sum()
+    if top_p < 1.0:
+        # Smallest prefix of the sorted candidates whose mass reaches top_p (at least one token)
+        keep = int(np.searchsorted(np.cumsum(probs), top_p)) + 1
+        candidates = candidates[:keep]
+        scaled = scaled[:keep]
+    probs = np.exp(scaled / temperature)
+    probs /= probs.sum()
+    return int(candidates[rng.choice(probs.size, p=probs)])
+
+
+def _stop_holdback(text: str, stops: Sequence[str]) -> int:
+    """Length of the longest suffix of text that could still grow into a stop sequence."""
+    longest = 0
+    for stop in stops:
+        for size in range(min(len(stop) - 1, len(text)), longest, -1):
+            if text.endswith(stop[:size]):
+                longest = size
+                break
+    return longest
+
+
+class LlamaBatchEngine:
+    """
+    Multi-sequence llama.cpp decoding on one context.
+
+    Sequences share the context's unified KV cache and are told apart by
+    their llama.cpp sequence id.
+
+    Uses the low-level bindings of llama-cpp-python 0.2.23 (pinned in
+    server/requirements.txt): llama_batch_init(n_tokens, embd, n_seq_max),
+    llama_decode, llama_get_logits_ith and llama_kv_cache_seq_rm. Later
+    releases rename the KV cache calls; re-run the smoke test in
+    tests/test_llm_batcher.py (CLINICGUARD_TEST_GGUF) when upgrading.
+    """
+
+    def __init__(self, model_path: str, n_ctx: int, n_batch: int, max_sequences: int):
+        import llama_cpp
+        from llama_cpp import Llama
+
+        self._llama_cpp = llama_cpp
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_batch=n_batch, verbose=False)
+        self.n_ctx = self.llm.n_ctx()
+        self.n_batch = n_batch
+        self.n_vocab = self.llm.n_vocab()
+        self.eos_token = self.llm.token_eos()
+        self._batch = llama_cpp.llama_batch_init(n_batch, 0, max_sequences)
+
+    def tokenize(self, text: str, add_bos: bool = True) -> List[int]:
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=add_bos)
+
+    def token_bytes(self, token: int) -> bytes:
+        return self.llm.detokenize([token])
+
+    def decode(self, entries: List[Tuple[int, List[int], int, bool]]) -> List[np.ndarray]:
+        """
+        Evaluate one batch.
+
+        Args:
+            entries: (seq_id, tokens, first position, want logits of the last token)
+
+        Returns:
+            One logits row per entry that asked for logits, in order
+        """
+        batch = self._batch
+        n = 0
+        rows = []
+        for seq_id, tokens, pos, want_logits in entries:
+            for i, token in enumerate(tokens):
+                batch.token[n] = token
+                batch.pos[n] = pos + i
+                batch.n_seq_id[n] = 1
+                batch.seq_id[n][0] = seq_id
+                batch.logits[n] = int(want_logits and i == len(tokens) - 1)
+                n += 1
+            if want_logits:
+                rows.append(n - 1)
+        batch.n_tokens = n
+        status = self._llama_cpp.llama_decode(self.llm.ctx, batch)
+        if status != 0:
+            raise RuntimeError(f"llama_decode failed with status {status}")
+        return [
+            np.ctypeslib.as_array(self._llama_cpp.llama_get_logits_ith(self.llm.ctx, row), shape=(self.n_vocab,)).copy()
+            for row in rows
+        ]
+
+    def release(self, seq_id: int):
+        """Drop a finished sequence from the KV cache."""
+        self._llama_cpp.llama_kv_cache_seq_rm(self.llm.ctx, seq_id, -1, -1)
+
+    def close(self):
+        self._llama_cpp.llama_batch_free(self._batch)
+
+
+class ContinuousBatcher:
+    """Schedules concurrent generation requests onto one batch engine."""
+
+    def __init__(self, engine, max_sequences: int = LLM_MAX_SEQUENCES, seed: Optional[int] = None):
+        self.engine = engine
+        self.max_sequences = max(1, max_sequences)
+        self._rng = np.random.default_rng(seed)
+        # (priority, arrival, request); arrival keeps FIFO order within a priority
+        self._waiting: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._arrivals = itertools.count()
+        self._active: List[_Sequence] = []
+        self._free_ids = list(range(self.max_sequences))
+        self._stats_lock = threading.Lock()
+        self._closing = False
+        self.steps = 0
+        self.completed = 0
+        self.generated_tokens = 0
+        self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"LLM batcher started (max_sequences={self.max_sequences}, n_ctx={engine.n_ctx}, n_batch={engine.n_batch})")
+
+    def submit(self, prompt: str, max_tokens: int, temperature: float, stop: Sequence[str] = (),
+               loop: Optional[asyncio.AbstractEventLoop] = None, priority: int = PRIORITY_LIVE,
+               top_k: int = DEFAULT_TOP_K, top_p: float = DEFAULT_TOP_P,
+               repeat_penalty: float = DEFAULT_REPEAT_PENALTY) -> GenerationRequest:
+        """
+        Queue a prompt for generation.
+
+        Args:
+            prompt: Full prompt text
+            max_tokens: Maximum number of tokens to generate
+            temperature: Sampling temperature
+            stop: Strings that end the generation (not included in the output)
+            loop: Event loop of an async consumer; omit for sync iteration
+            priority: Admission priority, lower is admitted first
+            top_k: Sample from the k most likely tokens
+            top_p: Nucleus sampling threshold
+            repeat_penalty: Penalty for tokens among the last REPEAT_LAST_N
+
+        Returns:
+            GenerationRequest yielding text pieces as they are generated
+
+        Raises:
+            ValueError: If the prompt and max_tokens cannot fit in the context
+        """
+        tokens = self.engine.tokenize(prompt)
+        if len(tokens) + max_tokens > self.engine.n_ctx:
+            raise ValueError(f"Prompt of {len(tokens)} tokens plus {max_tokens} new tokens exceeds context of {self.engine.n_ctx}")
+        request = GenerationRequest(tokens, max_tokens, temperature, stop, loop, top_k, top_p, repeat_penalty)
+        self._waiting.put((priority, next(self._arrivals), request))
+        return request
+
+    def stats(self) -> dict:
+        """Scheduler counters for monitoring."""
+        with self._stats_lock:
+            return {
+                "active": len(self._active),
+                "queued": self._waiting.qsize(),
+                "steps": self.steps,
+                "completed": self.completed,
+                "generated_tokens": self.generated_tokens,
+            }
+
+    def close(self):
+        """Stop the scheduler after the running and queued requests are done."""
+        # Sorts after every queued request, so those still run
+        self._waiting.put((float("inf"), next(self._arrivals), None))
+        self._thread.join()
+
+    def _reserved(self) -> int:
+        return sum(seq.reserved for seq in self._active)
+
+    def _admit(self):
+        """Move waiting requests into free sequence slots while the KV cache has room."""
+        while self._free_ids and not self._closing:
+            try:
+                # Block only when there is nothing else to do
+                entry = self._waiting.get(block=not self._active)
+            except queue.Empty:
+                return
+            request = entry[2]
+            if request is None:
+                self._closing = True
+                return
+            if request.cancelled.is_set():
+                request.finish_reason = "cancelled"
+                request._deliver(_FINISHED)
+                continue
+            if self._reserved() + len(request.prompt_tokens) + request.max_tokens > self.engine.n_ctx:
+                # Back in line under its original key, so a live request arriving while this
+                # one waits for KV space is still admitted first
+                self._waiting.put(entry)
+                return
+            with self._stats_lock:
+                self._active.append(_Sequence(request, self._free_ids.pop(0)))
+
+    def _run(self):
+        while True:
+            self._admit()
+            if not self._active:
+                if self._closing:
+                    return
+                continue
+            try:
+                self._step()
+            except Exception as e:
+                logger.error(f"LLM batch step failed: {e}", exc_info=True)
+                for seq in list(self._active):
+                    seq.request._deliver(e)
+                    self._retire(seq, None)
+
+    def _step(self):
+        for seq in list(self._active):
+            if seq.request.cancelled.is_set():
+                self._retire(seq, "cancelled")
+
+        # One token for every generating sequence first, then prompt chunks in the remaining space
+        plan = []
+        budget = self.engine.n_batch
+        for seq in self._active:
+            if seq.next_token is not None and budget > 0:
+                plan.append((seq, [seq.next_token], True))
+                budget -= 1
+        for seq in self._active:
+            prompt = seq.request.prompt_tokens
+            if seq.n_prefilled < len(prompt) and budget > 0:
+                chunk = prompt[seq.n_prefilled:seq.n_prefilled + budget]
+                seq.n_prefilled += len(chunk)
+                plan.append((seq, chunk, seq.n_prefilled == len(prompt)))
+                budget -= len(chunk)
+        if not plan:
+            return
+
+        logits = iter(self.engine.decode([(seq.seq_id, tokens, seq.n_past, last) for seq, tokens, last in plan]))
+        with self._stats_lock:
+            self.steps += 1
+        for seq, tokens, last in plan:
+            seq.n_past += len(tokens)
+            if last:
+                request = seq.request
+                self._accept(seq, sample_token(next(logits), request.temperature, self._rng, request.top_k,
+                                               request.top_p, request.repeat_penalty, seq.recent))
+
+    def _accept(self, seq: _Sequence, token: int):
+        """Record a sampled token, stream the text that is safe to emit and retire finished sequences."""
+        request = seq.request
+        if token == self.engine.eos_token:
+            self._flush(seq, len(seq.text))
+            self._retire(seq, "stop")
+            return
+        request.n_tokens += 1
+        seq.recent.append(token)
+        del seq.recent[:-REPEAT_LAST_N]
+        with self._stats_lock:
+            self.generated_tokens += 1
+        seq.text += seq.decoder.decode(self.engine.token_bytes(token))
+        # Text that could start a stop sequence is held back, so a stop can only begin after `emitted`
+        cuts = [i for i in (seq.text.find(stop, seq.emitted) for stop in request.stop) if i >= 0]
+        if cuts:
+            self._flush(seq, min(cuts))
+            self._retire(seq, "stop")
+            return
+        if request.n_tokens >= request.max_tokens:
+            self._flush(seq, len(seq.text))
+            self._retire(seq, "length")
+            return
+        self._flush(seq, len(seq.text) - _stop_holdback(seq.text, request.stop))
+        seq.next_token = token
+
+    def _flush(self, seq: _Sequence, end: int):
+        if end > seq.emitted:
+            seq.request._deliver(seq.text[seq.emitted:end])
+            seq.emitted = end
+
+    def _retire(self, seq: _Sequence, finish_reason: Optional[str]):
+        self.engine.release(seq.seq_id)
+        with self._stats_lock:
+            self._active.remove(seq)
+            self._free_ids.append(seq.seq_id)
+            self.completed += 1
+        if finish_reason is not None:
+            seq.request.finish_reason = finish_reason
+            seq.request._deliver(_FINISHED)
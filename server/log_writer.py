@@ -0,0 +1,157 @@
+"""
+Write-behind persistence for conversation logs.
+
+Recording a turn used to open a DB session, look the call up again, insert
+one row and commit. That is two commits (and fsyncs) per turn on the reply
+path. ConversationLogWriter queues the rows instead. A background thread
+writes them in bulk inserts once max_batch rows are waiting or flush_ms
+has passed. flush() blocks until everything queued so far is committed.
+It is called before a finished call is summarized and at shutdown.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import insert
+
+from server.db import ConversationLog, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LOG_BATCH_SIZE = int(os.getenv("CLINICGUARD_LOG_BATCH_SIZE", "64"))
+LOG_FLUSH_MS = float(os.getenv("CLINICGUARD_LOG_FLUSH_MS", "200"))
+# Delay before retrying a failed batch insert
+LOG_RETRY_SECONDS = 1.0
+
+
+class _FlushRequest:
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ConversationLogWriter:
+    """Queues ConversationLog rows and commits them in batches on a background thread."""
+
+    def __init__(self, session_factory: Callable = SessionLocal, max_batch: int = LOG_BATCH_SIZE,
+                 flush_ms: float = LOG_FLUSH_MS):
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(0.0, flush_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.rows_written = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def append(self, call_id: int, role: str, content: str):
+        """
+        Queue a conversation log row.
+
+        The timestamp is taken now, so rows keep their turn order however
+        they are batched.
+
+        Args:
+            call_id: Primary key of the call
+            role: 'User' or 'Assistant'
+            content: Message text
+        """
+        if self._closed:
+            raise RuntimeError("Conversation log writer is closed")
+        self._ensure_started()
+        self._queue.put({"call_id": call_id, "role": role, "content": content, "timestamp": datetime.utcnow()})
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every row queued before this call is committed.
+
+        Args:
+            timeout: Maximum seconds to wait
+
+        Returns:
+            True if the rows were committed in time
+        """
+        if self._thread is None:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def pending(self) -> int:
+        """Number of queued rows and flush requests not yet handled."""
+        return self._queue.qsize()
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush the remaining rows and stop the writer thread."""
+        self._closed = True
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        rows: List[dict] = []
+        waiters: List[_FlushRequest] = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                stopping = True
+            elif isinstance(item, _FlushRequest):
+                waiters.append(item)
+            elif item is not False:
+                rows.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            due = stopping or waiters or len(rows) >= self.max_batch or (deadline is not None and time.monotonic() >= deadline)
+            if not due:
+                continue
+            while rows and not self._write(rows):
+                if stopping:
+                    logger.error(f"Dropping {len(rows)} conversation log row(s) at shutdown")
+                    rows = []
+                    break
+                time.sleep(LOG_RETRY_SECONDS)
+            rows = []
+            deadline = None
+            for waiter in waiters:
+                waiter.done.set()
+            waiters = []
+
+    def _write(self, rows: List[dict]) -> bool:
+        db = self.session_factory()
+        try:
+            db.execute(insert(ConversationLog), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to write {len(rows)} conversation log row(s): {e}")
+            return False
+        finally:
+            db.close()
+        self.batches += 1
+        self.rows_written += len(rows)
+        return True
+
+
+# Global conversation log writer instance
+log_writer = ConversationLogWriter()
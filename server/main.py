@@ -1,12 +1,26 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
 
 from server.pipeline_controller import router as pipeline_router
 from server.twilio_router     import router as twilio_router
+from server.stage_executor    import stage_executor
+from server.http_client       import http_client
+from server.model_registry    import model_registry
+from server.llama_client      import llama_client
+from server.log_writer        import log_writer
+from server.job_queue         import job_queue, job_runner, job_workers, start_job_execution
+from server.db                import ensure_db_initialized
+from server.agent_services    import get_stt_engine, memory_backend, prompt_cache
+from server.idempotency       import webhook_cache
+from server.reply_audio       import reply_audio
+from server.tts_cache         import tts_cache
+from server.metrics           import MetricFamily, metrics
 
 # 1. Load .env (so TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, etc. are available)
 load_dotenv()
@@ -16,18 +30,61 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("clinicguard")
 
 # 3. Create the app
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown hooks."""
+    # Models are not loaded at import time; load them before serving traffic
+    await asyncio.to_thread(ensure_db_initialized)
+    await asyncio.to_thread(model_registry.warmup)
+    # End-of-call summaries run in low-priority worker processes with the LLaMA service
+    # (or in a separate `python -m server.job_queue` when JOB_WORKERS is 0); with a local
+    # model they always run here, on the llm stage while no live turn needs it
+    start_job_execution(job_workers, job_runner)
+    yield
+    await job_runner.stop()
+    await asyncio.to_thread(job_workers.stop)
+    await http_client.aclose()
+    llama_client.close()
+    # Commit conversation logs still waiting in the write-behind queue
+    await asyncio.to_thread(log_writer.close)
+    stage_executor.shutdown()
+    # Remove spilled reply audio
+    reply_audio.close()
+
 app = FastAPI(
     title="ClinicGuard-AI",
     description="HIPAA-compliant AI-powered call handling system",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # 4. Include routers
 app.include_router(pipeline_router, prefix="/api")  # all your AI pipeline endpoints
 app.include_router(twilio_router)  # /twilio/voice/answer, /twilio/voice, /twilio/voice/end
 
-# 5. Serve your audio files for <Play> URLs
-app.mount("/audio", StaticFiles(directory="audio_files"), name="audio")
+# 5. Serve reply audio for <Play> URLs
+@app.get("/audio/{audio_id}", tags=["audio"])
+async def get_reply_audio(audio_id: str) -> StreamingResponse:
+    """
+    Stream a reply's WAV audio from the reply audio store.
+    
+    A reply that is still being synthesized is sent with chunked encoding, and
+    each sentence goes out as soon as it is ready. A finished reply has a
+    Content-Length.
+    
+    Args:
+        audio_id: Reply ID from the <Play> URL
+        
+    Returns:
+        StreamingResponse: audio/wav body
+    """
+    reply = reply_audio.get(audio_id)
+    if reply is None or (reply.done and not reply.size):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    headers = {"Cache-Control": "no-store"}
+    if reply.done:
+        headers["Content-Length"] = str(reply.size)
+    return StreamingResponse(reply.iter_bytes(), media_type="audio/wav", headers=headers)
 
 # 6. CORS (if you have a frontend)
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -60,14 +117,105 @@ async def health() -> dict:
     Health check endpoint for monitoring and load balancers.
     
     Returns:
-        dict: Health status of the API
+        dict: Health status of the API, the queue depth of each pipeline stage, model load state, session cache size
+            and webhook idempotency cache counters
     """
     return {
         "status": "healthy",
         "service": "ClinicGuard-AI",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "stages": stage_executor.queue_depths(),
+        "models": model_registry.status(),
+        "sessions": memory_backend.stats(),
+        "webhooks": webhook_cache.stats()
     }
 
+@app.get("/jobs/status", tags=["jobs"])
+async def jobs_status() -> dict:
+    """
+    Background job queue status.
+    
+    Returns:
+        dict: Job counts by status, age of the oldest due job, recent failures and live worker count
+    """
+    stats = await asyncio.to_thread(job_queue.stats)
+    return {**stats, "workers": job_workers.alive() + job_runner.alive()}
+
+def _hit_families(caches: dict) -> list:
+    """Request counters and hit ratio per cache, from (hits, misses) pairs."""
+    requests = MetricFamily("clinicguard_cache_requests_total", "counter", "Cache lookups by result", [])
+    ratio = MetricFamily("clinicguard_cache_hit_ratio", "gauge", "Share of cache lookups that hit since startup", [])
+    for cache, (hits, misses) in caches.items():
+        requests.samples.append(("", {"cache": cache, "result": "hit"}, hits))
+        requests.samples.append(("", {"cache": cache, "result": "miss"}, misses))
+        ratio.samples.append(("", {"cache": cache}, hits / (hits + misses) if hits + misses else 0.0))
+    return [requests, ratio]
+
+def collect_runtime_metrics() -> list:
+    """Queue depths, cache counters and model state, read at scrape time."""
+    stages = stage_executor.queue_depths()
+    sessions = memory_backend.stats()
+    tts = tts_cache.stats()
+    prefix = prompt_cache.stats()
+    webhooks = webhook_cache.stats()
+    replies = reply_audio.stats()
+    jobs = job_queue.stats()
+    families = [
+        MetricFamily("clinicguard_stage_workers", "gauge", "Worker threads per pipeline stage",
+                     [("", {"stage": stage}, depth["workers"]) for stage, depth in stages.items()]),
+        MetricFamily("clinicguard_stage_jobs", "gauge", "Jobs running or waiting per pipeline stage",
+                     [("", {"stage": stage, "state": state}, depth[state])
+                      for stage, depth in stages.items() for state in ("active", "queued")]),
+        MetricFamily("clinicguard_model_loaded", "gauge", "Whether a model is loaded and available",
+                     [("", {"model": name}, int(status["available"])) for name, status in model_registry.status().items()]),
+        MetricFamily("clinicguard_sessions", "gauge", "Conversation histories held in memory",
+                     [("", {}, sessions["sessions"])]),
+        MetricFamily("clinicguard_session_evictions_total", "counter", "Session histories evicted from memory",
+                     [("", {"reason": "ttl"}, sessions["evicted_ttl"]), ("", {"reason": "lru"}, sessions["evicted_lru"])]),
+        MetricFamily("clinicguard_cache_bytes", "gauge", "Bytes held per cache",
+                     [("", {"cache": "sessions"}, sessions["bytes"]), ("", {"cache": "prefix"}, prefix["bytes"]),
+                      ("", {"cache": "tts_memory"}, tts["memory_bytes"]), ("", {"cache": "tts_disk"}, tts["disk_bytes"]),
+                      ("", {"cache": "reply_memory"}, replies["memory_bytes"]), ("", {"cache": "reply_disk"}, replies["disk_bytes"])]),
+        MetricFamily("clinicguard_reply_audio", "gauge", "Reply audio streams held for Twilio to fetch",
+                     [("", {"state": "streaming"}, replies["streaming"]),
+                      ("", {"state": "finished"}, replies["replies"] - replies["streaming"])]),
+        MetricFamily("clinicguard_reply_audio_spills_total", "counter", "Reply audio streams moved from memory to disk",
+                     [("", {}, replies["spills"])]),
+        MetricFamily("clinicguard_jobs", "gauge", "Background jobs by status",
+                     [("", {"status": status}, jobs[status]) for status in ("queued", "running", "done", "failed")]),
+        MetricFamily("clinicguard_jobs_oldest_due_age_seconds", "gauge", "How long the oldest due job has waited",
+                     [("", {}, jobs["oldest_due_age_s"])]),
+    ]
+    families += _hit_families({
+        "tts": (tts["memory_hits"] + tts["disk_hits"], tts["misses"]),
+        "prefix": (prefix["hits"], prefix["misses"]),
+        "webhook": (webhooks["hits"] + webhooks["joined"], webhooks["misses"]),
+    })
+    stt_engine = get_stt_engine() if model_registry.is_loaded("whisper") else None
+    if stt_engine is not None:
+        stt = stt_engine.stats()
+        families.append(MetricFamily("clinicguard_stt_queued", "gauge", "Utterances waiting for the speech-to-text engine",
+                                     [("", {"engine": stt_engine.name}, stt["queued"])]))
+        if "avg_batch_size" in stt:
+            families.append(MetricFamily("clinicguard_stt_avg_batch_size", "gauge", "Average Whisper batch size",
+                                         [("", {"engine": stt_engine.name}, stt["avg_batch_size"])]))
+    return families
+
+metrics.register_collector(collect_runtime_metrics)
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """
+    Pipeline metrics in the Prometheus text format.
+    
+    Returns:
+        PlainTextResponse: Per-stage latency histograms with recent p50/p95/p99, queue depths,
+            cache hit rates and LLM tokens per second
+    """
+    # Collectors read the job database, so render off the event loop
+    body = await asyncio.to_thread(metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
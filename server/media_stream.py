@@ -0,0 +1,161 @@
+"""
+Helpers for Twilio Media Streams.
+
+Twilio sends the caller's audio as base64 8 kHz mu-law frames over a
+WebSocket. EnergyVAD segments that audio into utterances so the pipeline
+can start as soon as the caller stops talking, and media_messages() turns
+reply audio back into outbound media frames.
+"""
+import base64
+import logging
+import os
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from server.audio_codec import TWILIO_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Twilio sends and expects 20 ms frames: 160 mu-law bytes at 8 kHz
+MEDIA_FRAME_MS = 20
+MEDIA_FRAME_BYTES = TWILIO_SAMPLE_RATE * MEDIA_FRAME_MS // 1000
+
+# VAD configuration
+VAD_SILENCE_MS = int(os.getenv("CLINICGUARD_VAD_SILENCE_MS", "700"))
+VAD_MARGIN_DB = float(os.getenv("CLINICGUARD_VAD_MARGIN_DB", "12"))
+VAD_MIN_SPEECH_DB = float(os.getenv("CLINICGUARD_VAD_MIN_SPEECH_DB", "-45"))
+VAD_START_MS = 60
+VAD_PREROLL_MS = 300
+VAD_MIN_UTTERANCE_MS = 250
+VAD_MAX_UTTERANCE_SECONDS = 30
+
+
+def frame_energy_db(frames: np.ndarray) -> np.ndarray:
+    """
+    Energy of each frame in dBFS.
+
+    Args:
+        frames: 2-D array of shape (n_frames, frame_length)
+
+    Returns:
+        1-D array with one energy value per frame
+    """
+    return 10.0 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10)
+
+
+class EnergyVAD:
+    """
+    Energy-based voice activity detector with an adaptive noise floor.
+
+    Speech starts after VAD_START_MS of frames above the threshold and an
+    utterance ends after VAD_SILENCE_MS of frames below it. The threshold
+    follows the background level measured while nobody is speaking.
+    """
+
+    def __init__(self, sample_rate: int = TWILIO_SAMPLE_RATE, frame_ms: int = MEDIA_FRAME_MS,
+                 silence_ms: int = VAD_SILENCE_MS, margin_db: float = VAD_MARGIN_DB,
+                 min_speech_db: float = VAD_MIN_SPEECH_DB):
+        self.sample_rate = sample_rate
+        self.frame_length = sample_rate * frame_ms // 1000
+        self.margin_db = margin_db
+        self.min_speech_db = min_speech_db
+        self.start_frames = max(1, VAD_START_MS // frame_ms)
+        self.end_frames = max(1, silence_ms // frame_ms)
+        self.preroll_frames = VAD_PREROLL_MS // frame_ms
+        self.min_frames = VAD_MIN_UTTERANCE_MS // frame_ms
+        self.max_frames = VAD_MAX_UTTERANCE_SECONDS * 1000 // frame_ms
+        self.noise_floor_db = min_speech_db - margin_db
+        self.triggered = False
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._frames: List[np.ndarray] = []
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._onset = 0
+
+    @property
+    def threshold_db(self) -> float:
+        """Current speech threshold in dBFS."""
+        return max(self.noise_floor_db + self.margin_db, self.min_speech_db)
+
+    def feed(self, samples: np.ndarray) -> List[np.ndarray]:
+        """
+        Add audio and return the utterances it completes.
+
+        Args:
+            samples: float32 samples at the detector's sample rate
+
+        Returns:
+            Completed utterances (usually zero or one)
+        """
+        audio = np.concatenate([self._pending, np.asarray(samples, dtype=np.float32)])
+        n_frames = audio.size // self.frame_length
+        self._pending = audio[n_frames * self.frame_length:]
+        if n_frames == 0:
+            return []
+        frames = audio[:n_frames * self.frame_length].reshape(n_frames, self.frame_length)
+        energies = frame_energy_db(frames)
+
+        utterances = []
+        for frame, energy in zip(frames, energies):
+            voiced = energy > self.threshold_db
+            self._frames.append(frame)
+            if not self.triggered:
+                if voiced:
+                    self._voiced_run += 1
+                else:
+                    self._voiced_run = 0
+                    # Track the background level only outside speech
+                    self.noise_floor_db = 0.95 * self.noise_floor_db + 0.05 * energy
+                if self._voiced_run >= self.start_frames:
+                    self.triggered = True
+                    self._silent_run = 0
+                    self._onset = len(self._frames) - self._voiced_run
+                elif len(self._frames) > self.preroll_frames:
+                    del self._frames[0]
+            else:
+                self._silent_run = 0 if voiced else self._silent_run + 1
+                if self._silent_run >= self.end_frames or len(self._frames) >= self.max_frames:
+                    utterance = self._finish()
+                    if utterance is not None:
+                        utterances.append(utterance)
+        return utterances
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Return the utterance in progress, e.g. when the stream stops."""
+        if not self.triggered:
+            return None
+        return self._finish()
+
+    def _finish(self) -> Optional[np.ndarray]:
+        kept = len(self._frames) - self._silent_run
+        frames = self._frames[:kept]
+        speech_frames = kept - self._onset
+        self.triggered = False
+        self._frames = []
+        self._voiced_run = 0
+        self._silent_run = 0
+        if speech_frames < self.min_frames:
+            logger.info("Discarded utterance shorter than the minimum length")
+            return None
+        return np.concatenate(frames)
+
+
+def media_messages(stream_sid: str, payload: bytes) -> Iterator[dict]:
+    """
+    Split mu-law audio into outbound Media Streams messages.
+
+    Args:
+        stream_sid: Twilio stream SID
+        payload: 8 kHz mu-law audio
+
+    Yields:
+        'media' messages carrying one 20 ms frame each
+    """
+    for offset in range(0, len(payload), MEDIA_FRAME_BYTES):
+        frame = payload[offset:offset + MEDIA_FRAME_BYTES]
+        yield {
+            "event": "media",
+            "streamSid": stream_sid,
+            "media": {"payload": base64.b64encode(frame).decode("ascii")},
+        }
@@ -0,0 +1,280 @@
+"""
+Latency and throughput metrics in the Prometheus text format.
+
+The only visibility into the pipeline used to be log lines. Each stage now
+records how long jobs wait for a worker and how long they run. The request
+handlers record download, transcription, reply and whole-turn latency, and
+the LLM reports generated tokens and decode speed. Histograms use fixed
+buckets, so Prometheus can aggregate them across workers. Each one also
+keeps a window of recent observations and reports their p50/p95/p99 as a
+'<name>_recent' gauge, for quick reads without a Prometheus server.
+
+Point-in-time values (queue depths, cache counters) are read from the
+owning objects by collectors when /metrics is scraped.
+"""
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Recent observations kept per label set for the quantile gauges
+METRICS_WINDOW = int(os.getenv("CLINICGUARD_METRICS_WINDOW", "2048"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 20.0, 30.0, 60.0)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 50.0, 75.0, 100.0, 200.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class MetricFamily(NamedTuple):
+    """
+    One metric as produced by a collector.
+
+    Samples are (suffix, labels, value); the suffix is '' except for the
+    '_bucket', '_sum' and '_count' series of a histogram.
+    """
+    name: str
+    type: str
+    help: str
+    samples: List[Tuple[str, Dict[str, str], float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def quantile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank quantile of already sorted values."""
+    if not sorted_values:
+        return float("nan")
+    index = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class _Series:
+    __slots__ = ("buckets", "sum", "count", "recent")
+
+    def __init__(self, size: int, window: int):
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a window of recent values per label set."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS,
+                 window: int = METRICS_WINDOW):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.window = window
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, **labels):
+        """Record one observation."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.bounds), self.window)
+            index = bisect.bisect_left(self.bounds, value)
+            if index < len(self.bounds):
+                series.buckets[index] += 1
+            series.sum += value
+            series.count += 1
+            series.recent.append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a block, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def percentiles(self, **labels) -> Dict[float, float]:
+        """p50/p95/p99 of the recent observations of one label set."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            values = sorted(series.recent) if series is not None else []
+        return {q: quantile(values, q) for q in QUANTILES}
+
+    def collect(self) -> List[MetricFamily]:
+        histogram = MetricFamily(self.name, "histogram", self.help, [])
+        recent = MetricFamily(f"{self.name}_recent", "gauge",
+                              f"{self.help} (quantiles of the last {self.window} observations)", [])
+        with self._lock:
+            snapshot = [(key, list(s.buckets), s.sum, s.count, sorted(s.recent)) for key, s in self._series.items()]
+        for key, buckets, total, count, values in snapshot:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, hits in zip(self.bounds, buckets):
+                cumulative += hits
+                histogram.samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            histogram.samples.append(("_bucket", {**labels, "le": "+Inf"}, count))
+            histogram.samples.append(("_sum", labels, total))
+            histogram.samples.append(("_count", labels, count))
+            for q in QUANTILES:
+                recent.samples.append(("", {**labels, "quantile": str(q)}, quantile(values, q)))
+        return [histogram, recent]
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Add amount to the counter."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[MetricFamily]:
+        with self._lock:
+            samples = [("", dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+        return [MetricFamily(self.name, "counter", self.help, samples)]
+
+
+class MetricsRegistry:
+    """Holds the recorded metrics and the scrape-time collectors, and renders them."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """
+        Add a callable run on every scrape.
+
+        Args:
+            collector: Returns MetricFamily objects built from current state
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        A failing collector is logged and skipped, so one broken source does
+        not take the whole endpoint down.
+
+        Returns:
+            Exposition text
+        """
+        families = []
+        for metric in self._metrics:
+            families.extend(metric.collect())
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for suffix, labels, value in family.samples:
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
+
+stage_queue_seconds = metrics.histogram(
+    "clinicguard_stage_queue_seconds", "Time a job waited for a worker of its pipeline stage", ["stage"])
+stage_run_seconds = metrics.histogram(
+    "clinicguard_stage_run_seconds", "Time a job ran on its pipeline stage worker", ["stage"])
+pipeline_seconds = metrics.histogram(
+    "clinicguard_pipeline_seconds", "Latency of each step of a voice turn", ["mode", "step"])
+llm_generated_tokens = metrics.counter(
+    "clinicguard_llm_generated_tokens_total", "Tokens generated by the LLM", ["backend"])
+llm_tokens_per_second = metrics.histogram(
+    "clinicguard_llm_tokens_per_second", "Generated tokens per second of wall time for each LLM request", ["backend"], buckets=RATE_BUCKETS)
+stt_audio_seconds = metrics.counter(
+    "clinicguard_stt_audio_seconds_total", "Seconds of audio entering the speech front-end and reaching the STT engine", ["stage"])
+stt_skipped_turns = metrics.counter(
+    "clinicguard_stt_skipped_total", "Turns not transcribed because the front-end found no speech")
+
+
+def record_generation(backend: str, tokens: int, seconds: float):
+    """
+    Record one finished LLM generation.
+
+    Args:
+        backend: 'local' or 'server'
+        tokens: Number of generated tokens
+        seconds: Wall time of the generation
+    """
+    llm_generated_tokens.inc(tokens, backend=backend)
+    if tokens and seconds > 0:
+        llm_tokens_per_second.observe(tokens / seconds, backend=backend)
+
+
+class TurnTimer:
+    """
+    Times the steps of one voice turn into pipeline_seconds.
+
+    step() measures since the previous step and starts the next one,
+    mark() measures since the previous step without starting a new one
+    (e.g. time to the first reply sentence), total() measures the turn.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.started = self._last = time.perf_counter()
+
+    def step(self, name: str):
+        now = time.perf_counter()
+        pipeline_seconds.observe(now - self._last, mode=self.mode, step=name)
+        self._last = now
+
+    def mark(self, name: str):
+        pipeline_seconds.observe(time.perf_counter() - self._last, mode=self.mode, step=name)
+
+    def total(self, name: str = "turn"):
+        pipeline_seconds.observe(time.perf_counter() - self.started, mode=self.mode, step=name)
@@ -0,0 +1,134 @@
+"""
+Lazy registry for the heavyweight models.
+
+Whisper and the LLaMA GGUF take seconds and gigabytes to load. Loading them
+at import time made every import of server.agent_services (app startup, test
+collection, worker forks) pay that cost. Models are registered here with a
+loader and are only loaded on first use, or explicitly through warmup() from
+the FastAPI lifespan hook. Loading is thread-safe: concurrent first callers
+wait for a single load.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Models loaded by the lifespan hook, comma separated; empty disables warmup
+WARMUP_MODELS = os.getenv("CLINICGUARD_WARMUP_MODELS", "whisper,llama")
+
+
+class _Entry:
+    __slots__ = ("loader", "warmup", "lock", "loaded", "value", "load_seconds", "error")
+
+    def __init__(self, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]]):
+        self.loader = loader
+        self.warmup = warmup
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.value = None
+        self.load_seconds = None
+        self.error = None
+
+
+class ModelRegistry:
+    """Named models with lazy, thread-safe loaders and optional warmup hooks."""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None):
+        """
+        Register a model loader.
+
+        Args:
+            name: Model name used with get()
+            loader: Callable returning the loaded model, or None if it is unavailable
+            warmup: Optional callable run once on the loaded model by warmup()
+        """
+        self._entries[name] = _Entry(loader, warmup)
+
+    def _entry(self, name: str) -> _Entry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise ValueError(f"Unknown model: {name}")
+
+    def get(self, name: str) -> Any:
+        """
+        Return a model, loading it on first use.
+
+        A loader that fails is logged and the model is reported as unavailable
+        (None), matching how a missing model file is handled.
+
+        Args:
+            name: Registered model name
+
+        Returns:
+            The loaded model, or None if it could not be loaded
+        """
+        entry = self._entry(name)
+        if entry.loaded:
+            return entry.value
+        with entry.lock:
+            if not entry.loaded:
+                started = time.perf_counter()
+                try:
+                    entry.value = entry.loader()
+                except Exception as e:
+                    logger.error(f"Failed to load {name} model: {e}")
+                    entry.value = None
+                    entry.error = str(e)
+                entry.load_seconds = time.perf_counter() - started
+                entry.loaded = True
+                if entry.value is not None:
+                    logger.info(f"Loaded {name} model in {entry.load_seconds:.2f}s")
+        return entry.value
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether the loader of a model has already run."""
+        return self._entry(name).loaded
+
+    def warmup(self, names: Optional[Iterable[str]] = None):
+        """
+        Load models and run their warmup hooks, so the first call is not slow.
+
+        Args:
+            names: Models to warm up; defaults to CLINICGUARD_WARMUP_MODELS
+        """
+        if names is None:
+            names = [name.strip() for name in WARMUP_MODELS.split(",") if name.strip()]
+        for name in names:
+            model = self.get(name)
+            hook = self._entry(name).warmup
+            if model is None or hook is None:
+                continue
+            started = time.perf_counter()
+            try:
+                hook(model)
+                logger.info(f"Warmed up {name} model in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                logger.error(f"Warmup of {name} model failed: {e}", exc_info=True)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report the load state of every registered model.
+
+        Returns:
+            Mapping of model name to loaded/available flags and load time
+        """
+        return {
+            name: {
+                "loaded": entry.loaded,
+                "available": entry.value is not None,
+                "load_seconds": round(entry.load_seconds, 3) if entry.load_seconds is not None else None,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+# Global model registry instance
+model_registry = ModelRegistry()
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-import tempfile
 import logging
 import os
 import uuid
 from typing import Optional, Dict, Any
 from pathlib import Path
-from server.agent_services import transcribe_audio, generate_response, text_to_speech, memory_backend
+from server.agent_services import transcribe_audio, astream_speech, memory_backend
+from server.stage_executor import stage_executor
+from server.audio_codec import decode_audio
+from server.metrics import TurnTimer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -77,51 +79,62 @@ async def process_audio(audio: UploadFile = File(...), session_id: Optional[str]
             session_id = str(uuid.uuid4())
             logger.info(f"Generated session_id: {session_id}")
         
-        # Save audio to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(audio_content)
-            tmp_path = tmp.name
-        logger.info(f"Audio saved to temporary file: {tmp_path}")
+        # Decode the upload in memory (WAV in-process, compressed formats through an ffmpeg pipe)
+        timer = TurnTimer("api")
+        try:
+            audio_samples = await stage_executor.run("download", decode_audio, audio_content)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Could not decode audio: {e}")
+        except FileNotFoundError as e:
+            # subprocess could not start the decoder; the upload itself is fine
+            logger.error(f"Audio decoder unavailable: {e}")
+            raise HTTPException(status_code=500, detail=f"Audio decoder not available: ffmpeg is not installed or not on PATH ({e})")
+        timer.step("download")
 
         # Step 1: Transcribe with Whisper
         logger.info(f"Transcribing audio with Whisper for session {session_id}...")
-        transcribed = transcribe_audio(tmp_path)
+        transcribed = await stage_executor.run("stt", transcribe_audio, audio_samples)
+        timer.step("transcribe")
         logger.info(f"Transcription received: {transcribed[:100]}..." if len(transcribed) > 100 else f"Transcription: {transcribed}")
+        if not transcribed.strip():
+            raise HTTPException(status_code=400, detail="No speech detected in audio")
 
-        # Step 2: Generate response with LLaMA (memory_backend handles history automatically)
-        logger.info(f"Generating response with LLaMA for session {session_id}...")
-        reply = generate_response(transcribed, session_id=session_id)
-        logger.info(f"LLaMA response generated: {reply[:100]}..." if len(reply) > 100 else f"LLaMA response: {reply}")
-
-        # Step 3: Convert response to speech
-        logger.info(f"Converting response to speech for session {session_id}...")
+        # Step 2 + 3: Generate response with LLaMA and synthesize each sentence as it is decoded
+        # (memory_backend handles history automatically)
+        logger.info(f"Generating and synthesizing response for session {session_id}...")
         output_dir = Path("/tmp")
         output_dir.mkdir(exist_ok=True)
-        output_path = str(output_dir / f"response_{session_id}.wav")
-        text_to_speech(reply, output_path)
+        sentences = []
+        audio_paths = []
+        async for sentence, sentence_path in astream_speech(transcribed, str(output_dir), f"response_{session_id}", session_id=session_id):
+            if not sentences:
+                timer.mark("first_audio")
+            sentences.append(sentence)
+            audio_paths.append(sentence_path)
+        reply = " ".join(sentences)
+        logger.info(f"LLaMA response generated: {reply[:100]}..." if len(reply) > 100 else f"LLaMA response: {reply}")
         
-        if not os.path.exists(output_path):
+        if not audio_paths:
             raise HTTPException(status_code=500, detail="Failed to generate audio file")
+        timer.step("reply")
+        timer.total()
         
         # Get conversation history from memory backend
-        conversation_history = memory_backend.get_session(session_id)
-        
-        # Clean up temporary file
-        try:
-            os.unlink(tmp_path)
-            logger.info(f"Cleaned up temporary file: {tmp_path}")
-        except Exception as e:
-            logger.warning(f"Failed to clean up temporary file {tmp_path}: {e}")
+        conversation_history = list(memory_backend.get_session(session_id))
         
         return {
             "transcription": transcribed,
             "reply": reply,
-            "audio_path": output_path,
+            "audio_path": audio_paths[0],
+            "audio_paths": audio_paths,
             "session_id": session_id,
             "conversation_history": conversation_history,
             "message_count": len(conversation_history) if conversation_history else 0
         }
         
+    except HTTPException:
+        # Pass through our explicit 4xx/5xx errors
+        raise
     except FileNotFoundError as e:
         logger.error(f"Audio file not found: {e}")
         raise HTTPException(status_code=404, detail=f"Audio file not found: {str(e)}")
@@ -0,0 +1,117 @@
+"""
+Per-session prompt-prefix cache for the llama.cpp model.
+
+Every turn re-sends the system preamble plus the whole conversation so far.
+Instead of letting llama.cpp re-evaluate all of those tokens, the evaluated
+model state at the end of each turn is kept per session. Restoring it before
+the next turn leaves only the new user line to be processed, because
+llama-cpp-python skips the longest common token prefix of the loaded state.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def state_size_bytes(state: Any) -> int:
+    """
+    Approximate the memory held by a llama-cpp-python LlamaState.
+
+    Args:
+        state: Object returned by Llama.save_state()
+
+    Returns:
+        Size in bytes of the KV data plus the saved token ids and logits
+    """
+    size = int(getattr(state, "llama_state_size", 0) or 0)
+    for array_name in ("input_ids", "scores"):
+        size += int(getattr(getattr(state, array_name, None), "nbytes", 0) or 0)
+    return size
+
+
+class PromptPrefixCache:
+    """LRU cache of evaluated llama.cpp states keyed by session, bounded by memory."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._preamble = None
+        self._preamble_size = 0
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def preamble(self) -> Optional[Any]:
+        """State holding only the evaluated system preamble, shared by new sessions."""
+        return self._preamble
+
+    def set_preamble(self, state: Any):
+        """Store the evaluated system preamble state."""
+        with self._lock:
+            self._total_bytes -= self._preamble_size
+            self._preamble = state
+            self._preamble_size = state_size_bytes(state)
+            self._total_bytes += self._preamble_size
+            self._evict_locked()
+
+    def lookup(self, session_id: str) -> Optional[Any]:
+        """Return the cached state for a session and mark it most recently used."""
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                self.misses += 1
+                return None
+            self._states.move_to_end(session_id)
+            self.hits += 1
+            return state
+
+    def store(self, session_id: str, state: Any):
+        """Cache the state at the end of a turn, evicting least recently used sessions."""
+        size = state_size_bytes(state)
+        with self._lock:
+            self._discard_locked(session_id)
+            if size + self._preamble_size > self.max_bytes:
+                logger.warning(f"Prefix state for session {session_id} ({size} bytes) exceeds the cache limit, not cached")
+                return
+            self._states[session_id] = state
+            self._sizes[session_id] = size
+            self._total_bytes += size
+            self._evict_locked()
+
+    def discard(self, session_id: str):
+        """Drop the cached state of a session."""
+        with self._lock:
+            if self._discard_locked(session_id):
+                logger.info(f"Dropped prefix cache for session {session_id}")
+
+    def stats(self) -> dict:
+        """Cache counters for monitoring."""
+        with self._lock:
+            return {
+                "sessions": len(self._states),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _discard_locked(self, session_id: str) -> bool:
+        if session_id not in self._states:
+            return False
+        del self._states[session_id]
+        self._total_bytes -= self._sizes.pop(session_id)
+        return True
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and self._states:
+            session_id, _ = self._states.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(session_id)
+            self.evictions += 1
+            logger.info(f"Evicted prefix cache for session {session_id}")
@@ -0,0 +1,337 @@
+"""
+Reply audio served to Twilio.
+
+A <Record> turn used to write every synthesized sentence into audio_files/,
+return TwiML pointing at those files, and let Twilio read them back through
+a static mount. Each reply cost a disk write, a disk read and a file that
+had to be cleaned up when the call ended.
+
+ReplyAudioStore instead keeps each reply as one growing WAV stream in
+memory. The pipeline appends sentences as they are synthesized, and
+GET /audio/{id} streams whatever exists so far, then waits for more until
+the reply is finished. Twilio can therefore start playing the first sentence
+while the rest is still being generated.
+
+A reply is written to disk only when it grows past spill_bytes, or when the
+memory held by all replies passes max_memory_bytes (the oldest replies go
+first). Replies expire ttl_seconds after they are created. They are also
+dropped when their call ends.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+from server.audio_codec import TWILIO_SAMPLE_RATE, pcm16_encode, read_wav, resample, wav_header
+
+logger = logging.getLogger(__name__)
+
+REPLY_AUDIO_DIR = os.getenv("CLINICGUARD_REPLY_AUDIO_DIR", "audio_files")
+REPLY_AUDIO_MEMORY_MB = int(os.getenv("CLINICGUARD_REPLY_AUDIO_MEMORY_MB", "64"))
+REPLY_AUDIO_SPILL_KB = int(os.getenv("CLINICGUARD_REPLY_AUDIO_SPILL_KB", "1024"))
+REPLY_AUDIO_TTL_SECONDS = float(os.getenv("CLINICGUARD_REPLY_AUDIO_TTL_SECONDS", "600"))
+# Bytes per chunk sent to the client
+REPLY_AUDIO_CHUNK_BYTES = 32 * 1024
+
+_HEADER_BYTES = 44
+
+
+def wav_to_pcm16(data: bytes, sample_rate: int = TWILIO_SAMPLE_RATE) -> bytes:
+    """
+    Convert a synthesized WAV file to the raw PCM16 frames of a reply stream.
+
+    Args:
+        data: WAV file bytes in any format read_wav() understands
+        sample_rate: Sample rate of the reply stream
+
+    Returns:
+        Little-endian 16-bit mono PCM at sample_rate
+    """
+    audio, source_rate = read_wav(data)
+    return pcm16_encode(resample(audio, source_rate, sample_rate))
+
+
+class ReplyAudio:
+    """
+    One reply: a WAV stream that the pipeline appends to and clients read.
+
+    All methods run on the event loop. Only disk I/O is sent to a thread.
+    """
+
+    def __init__(self, store: "ReplyAudioStore", audio_id: str, owner: Optional[str]):
+        self.id = audio_id
+        self.owner = owner
+        self.created = store.clock()
+        self.size = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self.discarded = False
+        self._store = store
+        self._buffer = bytearray()
+        self._path: Optional[Path] = None
+        self._io_lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+
+    @property
+    def spilled(self) -> bool:
+        return self._path is not None
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._buffer)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def write(self, data: bytes):
+        """Append bytes to the reply and wake up its readers."""
+        if self.discarded:
+            # The call ended or the reply expired while it was being synthesized
+            return
+        if self.done:
+            raise RuntimeError(f"Reply audio {self.id} is already finished")
+        if not data:
+            return
+        async with self._io_lock:
+            if self._path is not None:
+                await asyncio.to_thread(self._append_file, data)
+                if self.discarded:
+                    self._path.unlink(missing_ok=True)
+                    return
+            else:
+                self._buffer += data
+                self._store._add_memory(len(data))
+            self.size += len(data)
+        self._notify()
+        if self._path is None and self.size > self._store.spill_bytes:
+            await self.spill()
+        await self._store._enforce_memory_limit()
+
+    async def write_sentence(self, wav: bytes):
+        """Append one synthesized sentence, writing the stream header before the first one."""
+        pcm = await asyncio.to_thread(wav_to_pcm16, wav, self._store.sample_rate)
+        if self.size == 0:
+            # Size fields are filled in by finish()
+            await self.write(wav_header(self._store.sample_rate) + pcm)
+        else:
+            await self.write(pcm)
+
+    async def finish(self, error: Optional[str] = None):
+        """
+        Mark the reply complete so readers stop waiting for more audio.
+
+        The WAV size fields are filled in, so clients that fetch the reply
+        after it finished get a regular file with a Content-Length.
+
+        Args:
+            error: Why the reply stopped early, if it did
+        """
+        if self.done:
+            return
+        async with self._io_lock:
+            if self.size >= _HEADER_BYTES and error is None and not self.discarded:
+                sizes = (struct.pack("<I", self.size - 8), struct.pack("<I", self.size - _HEADER_BYTES))
+                if self._path is not None:
+                    await asyncio.to_thread(self._patch_file, sizes)
+                else:
+                    self._buffer[4:8], self._buffer[40:44] = sizes
+            self.error = error
+            self.done = True
+        self._notify()
+
+    async def spill(self):
+        """Move the buffered audio to disk; later writes append to the file."""
+        async with self._io_lock:
+            if self._path is not None or self.discarded:
+                return
+            path = self._store.directory / f"{self.id}.wav"
+            data = bytes(self._buffer)
+            await asyncio.to_thread(self._write_file, path, data)
+            if self.discarded:
+                path.unlink(missing_ok=True)
+                return
+            self._path = path
+            self._buffer = bytearray()
+            self._store._add_memory(-len(data))
+            self._store.spills += 1
+            logger.info(f"Reply audio {self.id} spilled to disk ({len(data) / 1024:.1f}KB)")
+
+    async def read(self, offset: int, limit: int) -> bytes:
+        """Read up to limit bytes starting at offset from memory or disk."""
+        async with self._io_lock:
+            if self._path is not None:
+                return await asyncio.to_thread(self._read_file, offset, limit)
+            return bytes(self._buffer[offset:offset + limit])
+
+    async def iter_bytes(self, chunk_bytes: int = REPLY_AUDIO_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        """
+        Stream the reply from the start, waiting for audio that is still being synthesized.
+
+        Yields:
+            Chunks of the WAV stream until the reply is finished
+        """
+        offset = 0
+        while True:
+            if offset < self.size:
+                chunk = await self.read(offset, chunk_bytes)
+                if not chunk:
+                    # Discarded while streaming
+                    return
+                offset += len(chunk)
+                yield chunk
+            elif self.done:
+                return
+            else:
+                await self._changed.wait()
+
+    def discard(self):
+        """Drop the audio; called by the store when the reply expires or its call ends."""
+        self.discarded = True
+        self._store._add_memory(-len(self._buffer))
+        self._buffer = bytearray()
+        self.size = 0
+        self.done = True
+        if self._path is not None:
+            self._path.unlink(missing_ok=True)
+        self._notify()
+
+    def _write_file(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _append_file(self, data: bytes):
+        with open(self._path, "ab") as f:
+            f.write(data)
+
+    def _patch_file(self, sizes):
+        with open(self._path, "r+b") as f:
+            f.seek(4)
+            f.write(sizes[0])
+            f.seek(40)
+            f.write(sizes[1])
+
+    def _read_file(self, offset: int, limit: int) -> bytes:
+        try:
+            with open(self._path, "rb") as f:
+                f.seek(offset)
+                return f.read(limit)
+        except FileNotFoundError:
+            return b""
+
+
+class ReplyAudioStore:
+    """Time-limited reply audio held in memory up to a budget, spilling large or old replies to disk."""
+
+    def __init__(self, directory: str = REPLY_AUDIO_DIR, max_memory_bytes: int = REPLY_AUDIO_MEMORY_MB * 1024 * 1024,
+                 spill_bytes: int = REPLY_AUDIO_SPILL_KB * 1024, ttl_seconds: float = REPLY_AUDIO_TTL_SECONDS,
+                 sample_rate: int = TWILIO_SAMPLE_RATE, clock: Callable[[], float] = time.monotonic):
+        self.directory = Path(directory)
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_bytes = spill_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sample_rate = sample_rate
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._replies: "OrderedDict[str, ReplyAudio]" = OrderedDict()
+        self._memory_bytes = 0
+        self.spills = 0
+        self.expired = 0
+
+    def create(self, owner: Optional[str] = None) -> ReplyAudio:
+        """
+        Start a new reply.
+
+        Args:
+            owner: Call SID the reply belongs to, for discard_owner()
+
+        Returns:
+            The empty reply; its id goes into the /audio/{id} URL
+        """
+        self.prune()
+        reply = ReplyAudio(self, secrets.token_urlsafe(16), owner)
+        with self._lock:
+            self._replies[reply.id] = reply
+        return reply
+
+    def get(self, audio_id: str) -> Optional[ReplyAudio]:
+        """Return the reply with this id, unless it expired or was discarded."""
+        self.prune()
+        with self._lock:
+            return self._replies.get(audio_id)
+
+    def prune(self):
+        """Discard expired replies."""
+        now = self.clock()
+        with self._lock:
+            expired = []
+            while self._replies:
+                reply = next(iter(self._replies.values()))
+                if now - reply.created <= self.ttl_seconds:
+                    break
+                expired.append(self._replies.popitem(last=False)[1])
+            self.expired += len(expired)
+        for reply in expired:
+            reply.discard()
+
+    def discard_owner(self, owner: str) -> int:
+        """
+        Discard every reply of a call, e.g. when it ends.
+
+        Returns:
+            Number of replies discarded
+        """
+        with self._lock:
+            replies = [reply for reply in self._replies.values() if reply.owner == owner]
+            for reply in replies:
+                del self._replies[reply.id]
+        for reply in replies:
+            reply.discard()
+        return len(replies)
+
+    def stats(self) -> dict:
+        """Reply counts and bytes held in memory and on disk."""
+        with self._lock:
+            replies = list(self._replies.values())
+            return {
+                "replies": len(replies),
+                "streaming": sum(1 for reply in replies if not reply.done),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": sum(reply.size for reply in replies if reply.spilled),
+                "spills": self.spills,
+                "expired": self.expired,
+            }
+
+    def _add_memory(self, delta: int):
+        with self._lock:
+            self._memory_bytes += delta
+
+    async def _enforce_memory_limit(self):
+        """Spill the oldest in-memory replies until the memory budget holds."""
+        while True:
+            with self._lock:
+                if self._memory_bytes <= self.max_memory_bytes:
+                    return
+                oldest = next((reply for reply in self._replies.values() if not reply.spilled and reply.memory_bytes), None)
+            if oldest is None:
+                return
+            await oldest.spill()
+
+    def close(self):
+        """Discard all replies and their spill files."""
+        with self._lock:
+            replies = list(self._replies.values())
+            self._replies.clear()
+        for reply in replies:
+            reply.discard()
+
+
+# Global reply audio store
+reply_audio = ReplyAudioStore()
@@ -0,0 +1,292 @@
+"""
+Bounded in-memory store for conversation histories.
+
+The session memories used to keep every history in a plain dict until
+/voice/end arrived. Dropped calls, and the generated session ids of
+/process_audio, were never removed. SessionStore bounds that cache in two
+ways:
+
+  - an idle TTL: sessions untouched for ttl_seconds are swept (lazily, on
+    access, at most once per sweep interval)
+  - a total byte budget: past it, the least recently used sessions are
+    evicted
+
+Evicted sessions are reported to an on_evict callback so per-session state
+kept elsewhere (prompt prefixes, context windows, locks) goes with them.
+
+Turns are stored compactly. TurnHistory keeps one byte per turn for the
+role (an index into a table of interned role names) next to a list of the
+contents, instead of one tuple object per turn. It still reads like a list
+of (role, content) tuples.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sessions idle this long are dropped (a live call produces a turn every few seconds)
+SESSION_TTL_SECONDS = float(os.getenv("CLINICGUARD_SESSION_TTL_SECONDS", "1800"))
+# Budget for all cached histories together
+SESSION_MAX_MB = float(os.getenv("CLINICGUARD_SESSION_MAX_MB", "256"))
+SESSION_SWEEP_SECONDS = 30.0
+# Approximate fixed cost of one cached session (entry, history, dict slot, session id)
+_SESSION_OVERHEAD_BYTES = 400
+# Per turn on top of the content string: one role byte and one list slot
+_TURN_OVERHEAD_BYTES = 9
+
+_role_names: List[str] = ["User", "Assistant", "System"]
+_role_codes: Dict[str, int] = {name: code for code, name in enumerate(_role_names)}
+_role_lock = threading.Lock()
+
+
+def _role_code(role: str) -> int:
+    code = _role_codes.get(role)
+    if code is None:
+        with _role_lock:
+            code = _role_codes.get(role)
+            if code is None:
+                if len(_role_names) == 256:
+                    raise ValueError(f"Too many distinct roles to store {role!r}")
+                code = len(_role_names)
+                _role_names.append(sys.intern(role))
+                _role_codes[_role_names[code]] = code
+    return code
+
+
+class TurnHistory(Sequence):
+    """Append-only conversation history; items are (role, content) tuples with interned roles."""
+
+    __slots__ = ("_roles", "_contents", "nbytes")
+
+    def __init__(self, turns: Iterable[Tuple[str, str]] = ()):
+        self._roles = array("B")
+        self._contents: List[str] = []
+        self.nbytes = 0
+        for role, content in turns:
+            self.append(role, content)
+
+    def append(self, role: str, content: str) -> int:
+        """
+        Add a turn.
+
+        Returns:
+            Approximate bytes the turn added
+        """
+        self._roles.append(_role_code(role))
+        self._contents.append(content)
+        added = sys.getsizeof(content) + _TURN_OVERHEAD_BYTES
+        self.nbytes += added
+        return added
+
+    def __len__(self) -> int:
+        return len(self._contents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(_role_names[code], content) for code, content in zip(self._roles[index], self._contents[index])]
+        return _role_names[self._roles[index]], self._contents[index]
+
+    def __iter__(self):
+        for code, content in zip(self._roles, self._contents):
+            yield _role_names[code], content
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"TurnHistory({list(self)!r})"
+
+
+class _Entry:
+    __slots__ = ("history", "touched", "tag")
+
+    def __init__(self, history: TurnHistory, touched: float, tag: Any = None):
+        self.history = history
+        self.touched = touched
+        self.tag = tag
+
+
+class SessionStore:
+    """Thread-safe session id -> TurnHistory map with idle TTL and LRU eviction under a byte budget."""
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_bytes: int = int(SESSION_MAX_MB * 1024 * 1024),
+                 on_evict: Optional[Callable[[str, str], None]] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            ttl_seconds: Idle time after which a session is dropped
+            max_bytes: Budget for all histories; least recently used sessions go first
+            on_evict: Called as on_evict(session_id, reason) with reason 'ttl' or 'lru', outside the lock
+            clock: Time source (tests pass a fake one)
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Least recently used first
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._next_sweep = clock() + SESSION_SWEEP_SECONDS
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+
+    @staticmethod
+    def _cost(history: TurnHistory) -> int:
+        return history.nbytes + _SESSION_OVERHEAD_BYTES
+
+    def get(self, session_id: str) -> Optional[TurnHistory]:
+        """The history of a cached session (marking it used), or None."""
+        return self.get_with_tag(session_id)[0]
+
+    def get_with_tag(self, session_id: str) -> Tuple[Optional[TurnHistory], Any]:
+        """The history and tag of a cached session (marking it used), or (None, None)."""
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.touched = now
+                self._entries.move_to_end(session_id)
+            evicted = self._sweep(now)
+        self._notify(evicted)
+        return (entry.history, entry.tag) if entry is not None else (None, None)
+
+    def put(self, session_id: str, turns: Iterable[Tuple[str, str]] = (), tag: Any = None) -> TurnHistory:
+        """
+        Cache a session's history, replacing any cached one.
+
+        Args:
+            session_id: Session to cache
+            turns: Its (role, content) turns, oldest first
+            tag: Value kept with the history and evicted with it (e.g. the call's primary key)
+
+        Returns:
+            The stored TurnHistory
+        """
+        history = turns if isinstance(turns, TurnHistory) else TurnHistory(turns)
+        with self._lock:
+            now = self._clock()
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._bytes -= self._cost(old.history)
+            self._entries[session_id] = _Entry(history, now, tag)
+            self._bytes += self._cost(history)
+            evicted = self._sweep(now) + self._shrink(keep=session_id)
+        self._notify(evicted)
+        return history
+
+    def append(self, session_id: str, role: str, content: str, create: bool = False) -> bool:
+        """
+        Add a turn to a cached session.
+
+        Args:
+            session_id: Session to extend
+            role: 'User', 'Assistant' or 'System'
+            content: Message text
+            create: Start an empty history if the session is not cached
+
+        Returns:
+            False if the session was not cached and create is False
+        """
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(session_id)
+            if entry is None:
+                if not create:
+                    return False
+                entry = self._entries[session_id] = _Entry(TurnHistory(), now)
+                self._bytes += self._cost(entry.history)
+            self._bytes += entry.history.append(role, content)
+            entry.touched = now
+            self._entries.move_to_end(session_id)
+            evicted = self._sweep(now) + self._shrink(keep=session_id)
+        self._notify(evicted)
+        return True
+
+    def pop(self, session_id: str) -> Optional[TurnHistory]:
+        """Remove a session (not counted as an eviction)."""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                return None
+            self._bytes -= self._cost(entry.history)
+            return entry.history
+
+    def sweep(self) -> int:
+        """Drop every idle session now; returns how many were dropped."""
+        with self._lock:
+            evicted = self._sweep(self._clock(), force=True)
+        self._notify(evicted)
+        return len(evicted)
+
+    def snapshot(self) -> Dict[str, List[Tuple[str, str]]]:
+        """Copies of all cached histories (for debugging)."""
+        with self._lock:
+            return {session_id: list(entry.history) for session_id, entry in self._entries.items()}
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        """Size and eviction counters for monitoring."""
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evicted_ttl": self.evicted_ttl,
+                "evicted_lru": self.evicted_lru,
+            }
+
+    def _sweep(self, now: float, force: bool = False) -> List[Tuple[str, str]]:
+        """Drop idle sessions, oldest first. Must be called with the lock held."""
+        if not force and now < self._next_sweep:
+            return []
+        self._next_sweep = now + SESSION_SWEEP_SECONDS
+        evicted = []
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if now - entry.touched < self.ttl_seconds:
+                break
+            del self._entries[session_id]
+            self._bytes -= self._cost(entry.history)
+            self.evicted_ttl += 1
+            evicted.append((session_id, "ttl"))
+        return evicted
+
+    def _shrink(self, keep: str) -> List[Tuple[str, str]]:
+        """Evict least recently used sessions until within budget. Must be called with the lock held."""
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            session_id, entry = next(iter(self._entries.items()))
+            if session_id == keep:
+                break
+            del self._entries[session_id]
+            self._bytes -= self._cost(entry.history)
+            self.evicted_lru += 1
+            evicted.append((session_id, "lru"))
+        return evicted
+
+    def _notify(self, evicted: List[Tuple[str, str]]):
+        for session_id, reason in evicted:
+            logger.info(f"Evicted session {session_id} ({reason})")
+            if self.on_evict is not None:
+                try:
+                    self.on_evict(session_id, reason)
+                except Exception as e:
+                    logger.error(f"Session eviction callback failed for {session_id}: {e}")
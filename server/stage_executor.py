@@ -0,0 +1,191 @@
+"""
+Stage executor for the voice pipeline.
+
+The pipeline stages (recording download, Whisper transcription, LLaMA
+generation and TTS) are blocking calls. Running them directly inside the
+async webhook handlers stalls the event loop, so every other webhook and the
+/health probe wait for the slowest call. Each stage gets its own sized
+thread pool instead; the models release the GIL in native code, and keeping
+the pools separate stops a burst of downloads from starving inference.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+from server.metrics import stage_queue_seconds, stage_run_seconds
+
+logger = logging.getLogger(__name__)
+
+# Default pool sizes, overridable with CLINICGUARD_<STAGE>_WORKERS.
+# STT threads only wait on the Whisper batcher, so the pool matches the
+# batch size to let concurrent utterances land in the same batch.
+DEFAULT_STAGE_WORKERS = {
+    "download": 8,
+    "stt": 8,
+    "llm": 1,
+    "tts": 4,
+}
+
+
+def stage_workers_from_env() -> Dict[str, int]:
+    """
+    Read the pool size of every stage from the environment.
+
+    Returns:
+        Mapping of stage name to number of worker threads
+    """
+    workers = {}
+    for stage, default in DEFAULT_STAGE_WORKERS.items():
+        value = os.getenv(f"CLINICGUARD_{stage.upper()}_WORKERS")
+        workers[stage] = max(1, int(value)) if value else default
+    return workers
+
+
+class StageExecutor:
+    """Per-stage thread pools with queue-depth accounting."""
+
+    def __init__(self, workers: Dict[str, int]):
+        self._workers = dict(workers)
+        self._pools = {
+            stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"stage-{stage}")
+            for stage, count in self._workers.items()
+        }
+        self._lock = threading.Lock()
+        self._queued = {stage: 0 for stage in self._workers}
+        self._active = {stage: 0 for stage in self._workers}
+
+    def _pool(self, stage: str) -> ThreadPoolExecutor:
+        try:
+            return self._pools[stage]
+        except KeyError:
+            raise ValueError(f"Unknown pipeline stage: {stage}")
+
+    def _submit(self, stage: str, fn: Callable[..., Any], *args, **kwargs):
+        pool = self._pool(stage)
+        submitted = time.perf_counter()
+
+        def call():
+            with self._lock:
+                self._queued[stage] -= 1
+                self._active[stage] += 1
+            started = time.perf_counter()
+            stage_queue_seconds.observe(started - submitted, stage=stage)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stage_run_seconds.observe(time.perf_counter() - started, stage=stage)
+                with self._lock:
+                    self._active[stage] -= 1
+
+        def on_done(future):
+            # A job cancelled before it started never ran call()
+            if future.cancelled():
+                with self._lock:
+                    self._queued[stage] -= 1
+
+        with self._lock:
+            self._queued[stage] += 1
+        future = pool.submit(call)
+        future.add_done_callback(on_done)
+        return future
+
+    def submit(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Queue a blocking function on a stage pool without waiting for it, e.g. from a worker thread.
+
+        Returns:
+            Future of fn's return value
+        """
+        return self._submit(stage, fn, *args, **kwargs)
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking function on the pool of the given stage.
+
+        Args:
+            stage: Pipeline stage name (download, stt, llm, tts)
+            fn: Blocking callable
+            *args, **kwargs: Arguments for fn
+
+        Returns:
+            The return value of fn
+        """
+        return await asyncio.wrap_future(self._submit(stage, fn, *args, **kwargs))
+
+    async def iterate(self, stage: str, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """
+        Drain a blocking iterator on the pool of the given stage.
+
+        The iterator runs ahead on a worker thread, so the consumer can
+        process one item (e.g. synthesize a sentence) while the next one is
+        being produced. Exceptions raised by the iterator are re-raised here.
+
+        Args:
+            stage: Pipeline stage name
+            iterator: Blocking iterator or generator
+
+        Yields:
+            Items of the iterator, in order
+        """
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for item in iterator:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+                loop.call_soon_threadsafe(items.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, e)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        producer = asyncio.wrap_future(self._submit(stage, produce))
+        try:
+            while True:
+                item = await items.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            await asyncio.shield(producer)
+
+    def queue_depths(self) -> Dict[str, Dict[str, int]]:
+        """
+        Report the load of every stage pool.
+
+        Returns:
+            Mapping of stage name to workers, active and queued job counts
+        """
+        with self._lock:
+            return {
+                stage: {
+                    "workers": self._workers[stage],
+                    "active": self._active[stage],
+                    "queued": self._queued[stage],
+                }
+                for stage in self._workers
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Shut down all stage pools."""
+        for stage, pool in self._pools.items():
+            pool.shutdown(wait=wait, cancel_futures=True)
+            logger.info(f"Stopped {stage} stage pool")
+
+
+# Global stage executor instance
+stage_executor = StageExecutor(stage_workers_from_env())
@@ -0,0 +1,129 @@
+"""
+Speech-to-text engines.
+
+Every engine takes mono float32 audio at 16 kHz and returns text, so the
+pipeline, the standalone whisper_server and the benchmarks do not care which
+one runs. CLINICGUARD_STT_ENGINE selects it:
+
+  - 'whisper': openai-whisper (PyTorch) behind WhisperBatcher, which
+    micro-batches concurrent utterances. Best on a GPU.
+  - 'faster-whisper': the same Whisper weights converted for CTranslate2 and
+    quantized (int8 by default). It is several times faster on the CPU-only
+    boxes we deploy to. It has no batcher: CTranslate2 runs up to
+    num_workers transcriptions in parallel from the STT stage threads.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from server.audio_codec import WHISPER_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+STT_ENGINE = os.getenv("CLINICGUARD_STT_ENGINE", "whisper")
+WHISPER_MODEL_NAME = os.getenv("CLINICGUARD_WHISPER_MODEL", "base")
+STT_LANGUAGE = os.getenv("CLINICGUARD_WHISPER_LANGUAGE", "en")
+FASTER_WHISPER_DEVICE = os.getenv("CLINICGUARD_FASTER_WHISPER_DEVICE", "cpu")
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("CLINICGUARD_FASTER_WHISPER_COMPUTE_TYPE", "int8")
+# 0 lets CTranslate2 pick; with several workers keep workers * threads <= cores
+FASTER_WHISPER_CPU_THREADS = int(os.getenv("CLINICGUARD_FASTER_WHISPER_CPU_THREADS", "0"))
+FASTER_WHISPER_WORKERS = int(os.getenv("CLINICGUARD_FASTER_WHISPER_WORKERS", "2"))
+FASTER_WHISPER_BEAM_SIZE = int(os.getenv("CLINICGUARD_FASTER_WHISPER_BEAM_SIZE", "1"))
+
+STT_ENGINES = ("whisper", "faster-whisper")
+
+
+class FasterWhisperEngine:
+    """Whisper on CTranslate2 with quantized weights."""
+
+    name = "faster-whisper"
+
+    def __init__(self, model_name: str = WHISPER_MODEL_NAME, device: str = FASTER_WHISPER_DEVICE,
+                 compute_type: str = FASTER_WHISPER_COMPUTE_TYPE, cpu_threads: int = FASTER_WHISPER_CPU_THREADS,
+                 num_workers: int = FASTER_WHISPER_WORKERS, beam_size: int = FASTER_WHISPER_BEAM_SIZE,
+                 language: Optional[str] = STT_LANGUAGE):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type,
+                                  cpu_threads=cpu_threads, num_workers=max(1, num_workers))
+        self.beam_size = max(1, beam_size)
+        self.language = language or None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.requests = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        logger.info(f"faster-whisper model '{model_name}' loaded ({device}, {compute_type}, {max(1, num_workers)} worker(s))")
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        """
+        Transcribe one utterance.
+
+        Args:
+            audio: Mono float32 samples at 16 kHz
+
+        Returns:
+            Transcribed text
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        with self._lock:
+            self._waiting += 1
+        started = time.perf_counter()
+        try:
+            segments, _ = self.model.transcribe(audio, language=self.language, beam_size=self.beam_size,
+                                                without_timestamps=True, condition_on_previous_text=False)
+            # Segments are decoded lazily while iterating
+            return "".join(segment.text for segment in segments).strip()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.requests += 1
+                self.audio_seconds += audio.size / WHISPER_SAMPLE_RATE
+                self.busy_seconds += time.perf_counter() - started
+
+    def queue_depth(self) -> int:
+        """Utterances being transcribed or waiting for a CTranslate2 worker."""
+        with self._lock:
+            return self._waiting
+
+    def stats(self) -> dict:
+        """Request counters and real-time factor for monitoring."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "queued": self._waiting,
+                "real_time_factor": self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+            }
+
+    def close(self):
+        """Release the model."""
+        self.model = None
+
+
+def load_stt_engine(engine: str = STT_ENGINE, model_name: str = WHISPER_MODEL_NAME):
+    """
+    Load a speech-to-text engine.
+
+    Args:
+        engine: 'whisper' or 'faster-whisper'
+        model_name: Whisper model size (tiny, base, small, ...) or a local model path
+
+    Returns:
+        An engine with transcribe(audio), queue_depth(), stats() and close()
+
+    Raises:
+        ValueError: If the engine name is unknown
+    """
+    if engine == "whisper":
+        import whisper
+
+        from server.whisper_batcher import WhisperBatcher
+
+        return WhisperBatcher(whisper.load_model(model_name))
+    if engine == "faster-whisper":
+        return FasterWhisperEngine(model_name)
+    raise ValueError(f"Unknown STT engine: {engine} (expected one of {', '.join(STT_ENGINES)})")
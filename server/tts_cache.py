@@ -0,0 +1,242 @@
+"""
+Content-addressed cache for synthesized speech.
+
+Many assistant replies repeat word for word (greetings, confirmation
+questions, closing lines). Audio is cached under a hash of the normalized
+text, voice, engine and output format, in a bounded in-memory LRU tier
+backed by a size-bounded on-disk tier. Concurrent requests for the same key
+are coalesced so only one synthesis runs and everyone shares its result.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_DIR = os.getenv("CLINICGUARD_TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MEMORY_MB = int(os.getenv("CLINICGUARD_TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DISK_MB = int(os.getenv("CLINICGUARD_TTS_CACHE_DISK_MB", "1024"))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different spellings share one cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, voice_id: str, engine: str, output_format: str) -> str:
+    """
+    Build the content address of a synthesis request.
+
+    Args:
+        text: Text to be spoken
+        voice_id: Voice used by the engine
+        engine: TTS engine name
+        output_format: Audio format produced by the engine
+
+    Returns:
+        Hex SHA-256 digest identifying the audio
+    """
+    material = "\x1f".join([normalize_text(text), voice_id or "", engine, output_format])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-tier (memory LRU + disk) audio cache with in-flight request coalescing."""
+
+    def __init__(self, directory: str, max_memory_bytes: int, max_disk_bytes: int):
+        self.directory = Path(directory)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._inflight: dict = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._load_disk_index()
+
+    def _load_disk_index(self):
+        if self.max_disk_bytes <= 0:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.glob("*.audio"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        # Oldest first, so the least recently used entries are evicted first
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk_locked()
+        if entries:
+            logger.info(f"TTS cache indexed {len(self._disk)} file(s) ({self._disk_bytes} bytes) in {self.directory}")
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.audio"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Look a key up in memory, then on disk (promoting disk hits to memory)."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+            on_disk = key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+        if on_disk:
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                with self._lock:
+                    self._disk_bytes -= self._disk.pop(key, 0)
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._put_memory_locked(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        """Store audio in both tiers."""
+        with self._lock:
+            self._put_memory_locked(key, data)
+        if self.max_disk_bytes <= 0 or len(data) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write TTS cache file {path}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            self._evict_disk_locked()
+
+    def get_or_create(self, text: str, voice_id: str, engine: str, output_format: str,
+                      synthesize: Callable[[], bytes]) -> bytes:
+        """
+        Return cached audio or synthesize it once, sharing the result with concurrent callers.
+
+        Args:
+            text: Text to be spoken
+            voice_id: Voice used by the engine
+            engine: TTS engine name
+            output_format: Audio format produced by the engine
+            synthesize: Blocking callable producing the audio bytes on a miss
+
+        Returns:
+            Audio bytes
+        """
+        key = cache_key(text, voice_id, engine, output_format)
+        data = self.get(key)
+        if data is not None:
+            return data
+        future, leader = self._join_inflight(key)
+        if not leader:
+            return future.result()
+        try:
+            data = synthesize()
+            self.put(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave_inflight(key)
+
+    async def aget_or_create(self, text: str, voice_id: str, engine: str, output_format: str,
+                             synthesize: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Async variant of get_or_create for coroutine-based engines."""
+        key = cache_key(text, voice_id, engine, output_format)
+        data = await asyncio.to_thread(self.get, key)
+        if data is not None:
+            return data
+        future, leader = self._join_inflight(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            data = await synthesize()
+            await asyncio.to_thread(self.put, key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave_inflight(key)
+
+    def stats(self) -> dict:
+        """Cache counters for monitoring."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _join_inflight(self, key: str):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _leave_inflight(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _put_memory_locked(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        self._memory_bytes -= len(self._memory.pop(key, b""))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk_locked(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                self._path(key).unlink()
+            except OSError as e:
+                logger.warning(f"Could not evict TTS cache file for {key}: {e}")
+
+
+# Global TTS cache instance
+tts_cache = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MEMORY_MB * 1024 * 1024, TTS_CACHE_DISK_MB * 1024 * 1024)
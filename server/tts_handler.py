@@ -1,12 +1,16 @@
 import os
 from dotenv import load_dotenv
-import requests
+import asyncio
 import logging
-from typing import Optional, BinaryIO
-import io
 import time
-import math
-import pyttsx3
+import weakref
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional, BinaryIO
+import io
+
+from server.http_client import SharedHTTPClient, http_client
+from server.tts_cache import tts_cache
+from server.utils import split_sentences
 
 # Load environment variables from .env
 load_dotenv()
@@ -15,11 +19,61 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ELEVENLABS_BASE_URL = os.getenv('ELEVENLABS_BASE_URL', "https://api.elevenlabs.io/v1")
+ELEVENLABS_MODEL_ID = "eleven_monolingual_v1"
+ELEVENLABS_OUTPUT_FORMAT = "mp3"
+ELEVENLABS_MAX_CHUNK_CHARS = 2000
+ELEVENLABS_MAX_CONCURRENCY = int(os.getenv('ELEVENLABS_MAX_CONCURRENCY', "3"))
+ELEVENLABS_MAX_RETRIES = 3
+
+# Client of a synchronous call's event loop; None means the process-wide http_client
+_loop_http_client: ContextVar[Optional[SharedHTTPClient]] = ContextVar("tts_loop_http_client", default=None)
+
+def _http() -> SharedHTTPClient:
+    return _loop_http_client.get() or http_client
+
+def _run_sync(coroutine):
+    """
+    Run a coroutine to completion for a synchronous caller.
+
+    The call gets its own short-lived HTTP client, so its chunks share
+    connections with each other while the process-wide client, which may be
+    in use on the API's event loop, is left alone.
+
+    Raises:
+        RuntimeError: If called from a running event loop (await the async_ variant there)
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coroutine.close()
+        raise RuntimeError("Synchronous TTS call from a running event loop; await the async_ variant instead")
+
+    async def run():
+        client = http_client.clone()
+        _loop_http_client.set(client)
+        try:
+            return await coroutine
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
 class ElevenLabsTTS:
-    def __init__(self):
+    """Text-to-speech handler using ElevenLabs API over the shared HTTP client."""
+    
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: int = ELEVENLABS_MAX_CONCURRENCY):
         self.api_key = os.getenv('ELEVENLABS_API_KEY')
         self.voice_id = os.getenv('ELEVENLABS_VOICE_ID')  
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = base_url or ELEVENLABS_BASE_URL
+        # Caps in-flight synthesis requests; a 429 pauses all of them until the cooldown ends.
+        # asyncio semaphores belong to one event loop and synchronous calls each run their own,
+        # so there is one semaphore per loop
+        self.max_concurrency = max_concurrency
+        self._concurrency: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._cooldown_until = 0.0
 
         if not self.api_key:
             raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
@@ -32,49 +86,96 @@ class ElevenLabsTTS:
             "xi-api-key": self.api_key
         }
     
-    def _generate_chunk(self, text: str, voice_id: Optional[str] = None, retry_count: int = 0) -> Optional[bytes]:
+    def _concurrency_limit(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._concurrency.get(loop)
+        if semaphore is None:
+            semaphore = self._concurrency[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _wait_for_cooldown(self):
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_after_seconds(response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return float(2 ** attempt)  # Exponential backoff: 1s, 2s, 4s
+
+    async def _generate_chunk(self, text: str, voice_id: Optional[str] = None) -> Optional[bytes]:
         try:
             voice = voice_id or self.voice_id
             payload = {
                 "text": text,
-                "model_id": "eleven_monolingual_v1",
+                "model_id": ELEVENLABS_MODEL_ID,
                 "voice_settings": {
                     "stability": 0.5,
                     "similarity_boost": 0.75
                 }
             }
-            response = requests.post(
-                f"{self.base_url}/text-to-speech/{voice}",
-                json=payload,
-                headers=self.headers
-            )
-            
-            if response.status_code == 200:
-                return response.content
-            elif response.status_code == 429 and retry_count < 3:
-                wait_time = (2 ** retry_count) * 1  # Exponential backoff: 1s, 2s, 4s
-                logger.warning(f"Rate limited, retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                return self._generate_chunk(text, voice_id, retry_count + 1)
-            else:
-                logger.error(f"ElevenLabs API error: {response.status_code} - {response.text}")
-                return None
+            for attempt in range(ELEVENLABS_MAX_RETRIES + 1):
+                await self._wait_for_cooldown()
+                async with self._concurrency_limit():
+                    response = await _http().post(
+                        f"{self.base_url}/text-to-speech/{voice}",
+                        json=payload,
+                        headers=self.headers
+                    )
+                
+                if response.status_code == 200:
+                    return response.content
+                elif response.status_code == 429 and attempt < ELEVENLABS_MAX_RETRIES:
+                    wait_time = self._retry_after_seconds(response, attempt)
+                    self._cooldown_until = max(self._cooldown_until, time.monotonic() + wait_time)
+                    logger.warning(f"Rate limited, retrying in {wait_time} seconds...")
+                else:
+                    logger.error(f"ElevenLabs API error: {response.status_code} - {response.text}")
+                    return None
+            return None
         except Exception as e:
             logger.error(f"Error in _generate_chunk: {str(e)}")
             return None
 
+    async def generate_cached(self, text: str, voice_id: Optional[str] = None) -> bytes:
+        """
+        Synthesize a chunk through the shared TTS cache.
+        
+        Identical text for the same voice is served from cache, and concurrent
+        identical requests share a single API call.
+        
+        Raises:
+            Exception: If synthesis fails (failures are never cached)
+        """
+        voice = voice_id or self.voice_id
+        
+        async def synthesize() -> bytes:
+            audio_data = await self._generate_chunk(text, voice)
+            if audio_data is None:
+                raise Exception("ElevenLabs synthesis failed")
+            return audio_data
+        
+        return await tts_cache.aget_or_create(text, voice, f"elevenlabs:{ELEVENLABS_MODEL_ID}", ELEVENLABS_OUTPUT_FORMAT, synthesize)
+
     def text_to_speech(self, text: str, voice_id: Optional[str] = None) -> Optional[BinaryIO]:
+        """Synchronous wrapper around async_text_to_speech()."""
+        return _run_sync(self.async_text_to_speech(text, voice_id))
+
+    async def async_text_to_speech(self, text: str, voice_id: Optional[str] = None) -> Optional[BinaryIO]:
         try:
             voice = voice_id or self.voice_id
             payload = {
                 "text": text,
-                "model_id": "eleven_monolingual_v1",
+                "model_id": ELEVENLABS_MODEL_ID,
                 "voice_settings": {
                     "stability": 0.5,
                     "similarity_boost": 0.75
                 }
             }
-            response = requests.post(
+            response = await _http().post(
                 f"{self.base_url}/text-to-speech/{voice}",
                 json=payload,
                 headers=self.headers
@@ -91,8 +192,12 @@ class ElevenLabsTTS:
             return None
     
     def get_available_voices(self) -> list:
+        """Synchronous wrapper around async_get_available_voices()."""
+        return _run_sync(self.async_get_available_voices())
+
+    async def async_get_available_voices(self) -> list:
         try:
-            response = requests.get(
+            response = await _http().get(
                 f"{self.base_url}/voices",
                 headers=self.headers
             )
@@ -105,10 +210,100 @@ class ElevenLabsTTS:
             logger.error(f"Error in get_available_voices: {str(e)}")
             return []
 
+_tts_client: Optional[ElevenLabsTTS] = None
+
+def get_tts_client() -> ElevenLabsTTS:
+    """Return the process-wide ElevenLabs client, creating it on first use."""
+    global _tts_client
+    if _tts_client is None:
+        _tts_client = ElevenLabsTTS()
+    return _tts_client
+
+def chunk_text(text: str, max_chars: int = ELEVENLABS_MAX_CHUNK_CHARS) -> List[str]:
+    """
+    Split text into synthesis chunks on sentence boundaries.
+    
+    Sentences are packed together up to max_chars; a single sentence longer
+    than that is split between words, never inside one.
+    
+    Args:
+        text (str): Text to split
+        max_chars (int): Maximum characters per chunk
+        
+    Returns:
+        List[str]: Chunks in speaking order
+    """
+    chunks = []
+    current = ""
+    for sentence in split_sentences(text):
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            pieces = []
+            piece = ""
+            for word in sentence.split():
+                if piece and len(piece) + 1 + len(word) > max_chars:
+                    pieces.append(piece)
+                    piece = ""
+                piece = f"{piece} {word}" if piece else word
+            if piece:
+                pieces.append(piece)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def stream_text_to_speech(text: str) -> AsyncIterator[bytes]:
+    """
+    Synthesize sentence-aligned chunks concurrently and yield their audio in order.
+    
+    All chunks are requested at once under the client's concurrency cap, so the
+    first chunk can be played while later ones are still being synthesized.
+    
+    Args:
+        text (str): Text to convert to speech
+        
+    Yields:
+        bytes: Audio of each chunk, in speaking order
+    """
+    tts = get_tts_client()
+    chunks = chunk_text(text)
+    logger.info(f"Split text into {len(chunks)} chunks")
+    tasks = [asyncio.create_task(tts.generate_cached(chunk)) for chunk in chunks]
+    try:
+        for i, task in enumerate(tasks):
+            try:
+                audio_data = await task
+            except Exception as e:
+                raise Exception(f"Failed to generate audio for chunk {i+1}") from e
+            logger.info(f"Chunk {i+1}/{len(chunks)} ready")
+            yield audio_data
+    finally:
+        for task in tasks:
+            task.cancel()
+
 def text_to_speech(text: str) -> bytes:
     """
     Convert text to speech using ElevenLabs API with chunking and retry logic.
     
+    Synchronous wrapper around async_text_to_speech() for scripts and other
+    callers without an event loop.
+    
+    Args:
+        text (str): Text to convert to speech
+        
+    Returns:
+        bytes: Concatenated audio bytes ready for streaming
+    """
+    return _run_sync(async_text_to_speech(text))
+
+async def async_text_to_speech(text: str) -> bytes:
+    """
+    Convert text to speech using ElevenLabs API with chunking and retry logic.
+    
     Args:
         text (str): Text to convert to speech
         
@@ -117,25 +312,9 @@ def text_to_speech(text: str) -> bytes:
     """
     try:
         logger.info(f"Converting text to speech: {text[:50]}...")
-        tts = ElevenLabsTTS()
-        
-        # Split text into chunks of max 2000 characters
-        chunk_size = 2000
-        chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-        logger.info(f"Split text into {len(chunks)} chunks")
-        
-        # Generate audio for each chunk
-        audio_chunks = []
-        for i, chunk in enumerate(chunks):
-            logger.info(f"Processing chunk {i+1}/{len(chunks)}")
-            audio_data = tts._generate_chunk(chunk)
-            if audio_data:
-                audio_chunks.append(audio_data)
-            else:
-                raise Exception(f"Failed to generate audio for chunk {i+1}")
         
         # Concatenate all audio chunks
-        final_audio = b''.join(audio_chunks)
+        final_audio = b''.join([audio_data async for audio_data in stream_text_to_speech(text)])
         logger.info("Successfully generated complete audio")
         return final_audio
         
@@ -154,6 +333,8 @@ def text_to_speech_pyttsx3(text: str, output_path="/tmp/response.wav"):
     Returns:
         str: Path to the generated WAV file
     """
+    import pyttsx3
+    
     try:
         logger.info(f"Converting text to speech: {text[:50]}...")
         engine = pyttsx3.init()
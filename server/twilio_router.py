@@ -1,21 +1,36 @@
-from fastapi import APIRouter, Request, Response, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import PlainTextResponse
 import os
+import asyncio
+import base64
+import json
 import logging
-import requests
-from requests.auth import HTTPBasicAuth
-import aiofiles
-from pathlib import Path
 from typing import Optional
 import re
 
 from server.agent_services import (
     transcribe_audio,
-    generate_response,
-    text_to_speech,
+    astream_reply_audio,
+    warm_up_call,
     memory_backend,
     MEMORY_BACKEND
 )
+from server.stage_executor import stage_executor
+from server.http_client import http_client
+from server.job_queue import job_queue
+from server.idempotency import webhook_cache
+from server.reply_audio import reply_audio
+from server.metrics import TurnTimer
+from server.audio_codec import (
+    TWILIO_SAMPLE_RATE,
+    AudioTooLargeError,
+    StreamingAudioDecoder,
+    mulaw_decode,
+    mulaw_encode,
+    read_wav,
+    resample
+)
+from server.media_stream import EnergyVAD, media_messages
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,15 +38,15 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/twilio", tags=["twilio"])
 
-# Ensure this folder exists
-AUDIO_DIR = Path("audio_files")
-AUDIO_DIR.mkdir(exist_ok=True)
-
 # Configuration constants
 RECORDING_TIMEOUT_SECONDS = 30
 MAX_RECORDING_LENGTH_SECONDS = 60
 MAX_AUDIO_FILE_SIZE_MB = 10
 MAX_AUDIO_FILE_SIZE_BYTES = MAX_AUDIO_FILE_SIZE_MB * 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("CLINICGUARD_DOWNLOAD_CHUNK_KB", "64")) * 1024
+
+# 'record' uses <Record> webhooks per turn, 'stream' connects a real-time Media Stream
+TWILIO_VOICE_MODE = os.getenv("TWILIO_VOICE_MODE", "record")
 
 # Load your Twilio creds from the environment
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
@@ -84,12 +99,61 @@ def validate_phone_number(phone_number: Optional[str]) -> Optional[str]:
     
     return normalized
 
+# Warmups in flight, referenced so they are not garbage collected before they finish
+_warmup_tasks = set()
+# Replies still being synthesized after their webhook answered
+_reply_tasks = set()
+
+
+async def _warm_up_call(call_sid: str, phone_number: Optional[str]):
+    try:
+        if MEMORY_BACKEND != "persistent":
+            phone_number = None
+        # Runs on the 'llm' stage in order with the call's turns, which then find the prefix ready
+        await stage_executor.run("llm", warm_up_call, call_sid, phone_number)
+    except Exception as e:
+        # The first turn simply does the work itself
+        logger.warning(f"Warmup failed for CallSid={call_sid}: {e}")
+
+
+def _start_call_warmup(call_sid: Optional[str], phone_number: Optional[str]):
+    """Start preparing the call's session and prompt prefix without delaying the TwiML response."""
+    try:
+        call_sid = validate_call_sid(call_sid)
+    except HTTPException:
+        logger.warning("Answer webhook without a valid CallSid, skipping warmup")
+        return
+    task = asyncio.create_task(_warm_up_call(call_sid, phone_number))
+    _warmup_tasks.add(task)
+    task.add_done_callback(_warmup_tasks.discard)
+
+
 @router.post("/voice/answer")
-async def answer_call() -> PlainTextResponse:
+async def answer_call(request: Request) -> PlainTextResponse:
     """
     Initial webhook when the call starts.
-    Returns TwiML that tells Twilio to record and then POST to /twilio/voice.
+    Returns TwiML that tells Twilio to record and then POST to /twilio/voice,
+    or, in 'stream' mode, to connect the call to the /twilio/stream WebSocket.
+    Meanwhile the caller's context is warmed up in the background.
     """
+    form_data = await request.form()
+    phone_number = validate_phone_number(form_data.get("From"))
+    _start_call_warmup(form_data.get("CallSid"), phone_number)
+
+    if TWILIO_VOICE_MODE == "stream":
+        phone_number = phone_number or ""
+        public_url = os.getenv("PUBLIC_URL", "http://localhost:8000")
+        stream_url = public_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/twilio/stream"
+        twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Connect>
+        <Stream url="{stream_url}">
+            <Parameter name="From" value="{phone_number}"/>
+        </Stream>
+    </Connect>
+</Response>"""
+        return PlainTextResponse(content=twiml_response, media_type="application/xml")
+
     twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
     <Say>Welcome to ClinicGuard AI. Please leave your message after the beep.</Say>
@@ -122,100 +186,306 @@ async def handle_voice(request: Request) -> Response:
             recording_url = recording_url.replace("http://", "https://", 1)
             logger.info(f"RecordingUrl forced to HTTPS: {recording_url}")
 
-        # Download with HTTP Basic Auth
-        auth = HTTPBasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        resp = requests.get(
-            recording_url,
-            auth=auth,
-            timeout=RECORDING_TIMEOUT_SECONDS
-        )
-        logger.info(f"Download status: {resp.status_code} {resp.reason}")
+        # Twilio retries slow webhooks with the same RecordingSid: join or replay the first run
+        request_key = form_data.get("RecordingSid") or f"{call_sid}:{recording_url}"
+        twiml = await webhook_cache.run(request_key, lambda: _answer_recording(form_data, call_sid, recording_url))
+        return Response(content=twiml, media_type="application/xml")
+
+    except HTTPException:
+        # Pass through our explicit 4xx/5xx errors
+        raise
+    except Exception as e:
+        logger.error(f"Voice handler error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _answer_recording(form_data, call_sid: str, recording_url: str) -> str:
+    """
+    Run one recorded turn through the pipeline.
+
+    Args:
+        form_data: Twilio webhook form
+        call_sid: Validated call SID
+        recording_url: HTTPS recording URL
+
+    Returns:
+        TwiML playing the reply
+    """
+    timer = TurnTimer("record")
+    # Stream the recording with HTTP Basic Auth over the shared keep-alive connection pool,
+    # decoding as it arrives so the size cap holds before the body is buffered
+    audio = await download_recording(recording_url)
+    timer.step("download")
+
+    # Extract and validate phone number from Twilio form data
+    phone_number = validate_phone_number(form_data.get("From"))
+    if phone_number:
+        logger.info(f"Call from: {phone_number}")
+    else:
+        logger.warning("No valid phone number provided in Twilio form data")
+
+    # 1. Transcribe
+    transcription = await stage_executor.run("stt", transcribe_audio, audio)
+    timer.step("transcribe")
+    logger.info(f"Transcribed text: {transcription}")
+    if not transcription.strip():
+        # Nothing was said (or nothing audible): ask again instead of prompting the LLM with nothing
+        logger.info(f"No speech in the recording for CallSid={call_sid}, reprompting")
+        return REPROMPT_TWIML
+
+    # 2. Generate the LLM response and synthesize it sentence by sentence into one reply stream.
+    # Answer as soon as the first sentence is ready; Twilio plays it while the rest is synthesized.
+    if MEMORY_BACKEND != "persistent":
+        phone_number = None
+    reply = reply_audio.create(owner=call_sid)
+    first_sentence = asyncio.get_running_loop().create_future()
+    task = asyncio.ensure_future(_synthesize_reply(reply, transcription, call_sid, phone_number, timer, first_sentence))
+    _reply_tasks.add(task)
+    task.add_done_callback(_reply_tasks.discard)
+    await first_sentence
+
+    # 3. Return TwiML to play the reply stream
+    public_url = os.getenv("PUBLIC_URL", "http://localhost:8000")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Play>{public_url}/audio/{reply.id}</Play>
+</Response>"""
+
+
+async def _synthesize_reply(reply, transcription: str, call_sid: str, phone_number: Optional[str], timer: TurnTimer, first_sentence: asyncio.Future):
+    """
+    Generate and synthesize a reply into its audio stream.
+
+    Args:
+        reply: ReplyAudio served at /audio/{id}
+        transcription: Caller's words
+        call_sid: Call SID, used as the session ID
+        phone_number: Caller number for persistent memory, or None
+        timer: Timer of the turn
+        first_sentence: Resolved once the first sentence is playable, or failed if none is
+    """
+    count = 0
+    try:
+        async for sentence, audio in astream_reply_audio(transcription, session_id=call_sid, phone_number=phone_number):
+            await reply.write_sentence(audio)
+            count += 1
+            logger.info(f"Synthesized sentence {count}: {sentence}")
+            if count == 1:
+                timer.mark("first_audio")
+                first_sentence.set_result(None)
+        if not count:
+            raise Exception("LLM returned an empty response")
+        await reply.finish()
+        timer.step("reply")
+        timer.total()
+    except asyncio.CancelledError:
+        await reply.finish(error="cancelled")
+        first_sentence.cancel()
+        raise
+    except Exception as e:
+        if count:
+            logger.error(f"Reply for CallSid={call_sid} stopped after {count} sentence(s): {e}", exc_info=True)
+        await reply.finish(error=str(e))
+        if not first_sentence.done():
+            first_sentence.set_exception(e)
+
+
+REPROMPT_TWIML = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say>Sorry, I didn't catch that. Please say your message after the beep.</Say>
+    <Record action="/twilio/voice" method="POST" maxLength="{MAX_RECORDING_LENGTH_SECONDS}"/>
+</Response>"""
+
+
+def _too_large_error(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"Audio file too large: {size / 1024 / 1024:.2f}MB (max: {MAX_AUDIO_FILE_SIZE_MB}MB)"
+    )
+
+
+async def download_recording(recording_url: str):
+    """
+    Download a Twilio recording and decode it while it streams in.
+
+    The body is never held in full: WAV is decoded chunk by chunk and compressed
+    formats are spooled until the transfer ends. Downloads stop as soon as they
+    pass MAX_AUDIO_FILE_SIZE_BYTES.
+
+    Args:
+        recording_url: HTTPS URL of the recording
+
+    Returns:
+        Mono float32 samples at 16 kHz
+    """
+    decoder = StreamingAudioDecoder(MAX_AUDIO_FILE_SIZE_BYTES)
+    async with http_client.stream(
+        "GET",
+        recording_url,
+        auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+        timeout=RECORDING_TIMEOUT_SECONDS
+    ) as resp:
+        logger.info(f"Download status: {resp.status_code} {resp.reason_phrase}")
         if resp.status_code != 200:
-            error_detail = resp.text[:200] if resp.text else "No error message"
+            body = b""
+            async for chunk in resp.aiter_bytes():
+                body += chunk
+                if len(body) >= 200:
+                    break
+            error_detail = body[:200].decode("utf-8", "replace") or "No error message"
             logger.error(f"Failed to download recording: {resp.status_code} - {error_detail}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to download recording from Twilio: HTTP {resp.status_code}"
             )
 
-        # Validate audio file size
-        audio_size = len(resp.content)
-        if audio_size > MAX_AUDIO_FILE_SIZE_BYTES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Audio file too large: {audio_size / 1024 / 1024:.2f}MB (max: {MAX_AUDIO_FILE_SIZE_MB}MB)"
-            )
-        
-        # Save WAV locally
-        audio_path = AUDIO_DIR / f"{call_sid}.wav"
-        async with aiofiles.open(audio_path, 'wb') as f:
-            await f.write(resp.content)
-        logger.info(f"Saved audio to {audio_path} (size: {audio_size / 1024:.2f}KB)")
-
-        # Extract and validate phone number from Twilio form data
-        phone_number = validate_phone_number(form_data.get("From"))
-        if phone_number:
-            logger.info(f"Call from: {phone_number}")
-        else:
-            logger.warning("No valid phone number provided in Twilio form data")
-
-        # 1. Transcribe
-        transcription = transcribe_audio(str(audio_path))
-        logger.info(f"Transcribed text: {transcription}")
-
-        # 2. Generate LLM response
-        if MEMORY_BACKEND == "persistent" and phone_number:
-            agent_response = generate_response(transcription, session_id=call_sid, phone_number=phone_number)
-        else:
-            agent_response = generate_response(transcription, session_id=call_sid)
-        logger.info(f"Generated response: {agent_response}")
-
-        # 3. Text-to-Speech
-        reply_filename = f"reply_{call_sid}.wav"
-        reply_path = AUDIO_DIR / reply_filename
-        text_to_speech(agent_response, str(reply_path))
-
-        # 4. Return TwiML to play the reply
-        public_url = os.getenv("PUBLIC_URL", "http://localhost:8000")
-        audio_url = f"{public_url}/audio/{reply_filename}"
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Play>{audio_url}</Play>
-</Response>"""
-        return Response(content=twiml, media_type="application/xml")
+        # Reject up front when Twilio announces the size
+        declared = resp.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > MAX_AUDIO_FILE_SIZE_BYTES:
+            raise _too_large_error(int(declared))
 
-    except HTTPException:
-        # Pass through our explicit 4xx/5xx errors
+        try:
+            async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                decoder.feed(chunk)
+        except AudioTooLargeError:
+            logger.warning(f"Recording exceeded {MAX_AUDIO_FILE_SIZE_MB}MB, download aborted")
+            raise _too_large_error(decoder.bytes_read)
+
+    audio = await stage_executor.run("download", decoder.finish)
+    logger.info(f"Decoded recording while streaming (size: {decoder.bytes_read / 1024:.2f}KB)")
+    return audio
+
+
+def _encode_reply_payload(audio: bytes) -> bytes:
+    """Convert a synthesized WAV sentence to 8 kHz mu-law for Media Streams."""
+    samples, sample_rate = read_wav(audio)
+    return mulaw_encode(resample(samples, sample_rate, TWILIO_SAMPLE_RATE))
+
+
+async def _stream_reply(websocket: WebSocket, stream_sid: str, call_sid: str, phone_number: Optional[str], utterance, turn: int,
+                        stopped: asyncio.Event):
+    """
+    Run one utterance through the pipeline and stream the reply back sentence by sentence.
+    Once the stream has stopped the rest of the reply is still generated, so the turn
+    reaches session memory, but nothing more is sent.
+    """
+    try:
+        timer = TurnTimer("stream")
+        transcription = await stage_executor.run("stt", transcribe_audio, utterance, sample_rate=TWILIO_SAMPLE_RATE)
+        timer.step("transcribe")
+        logger.info(f"[Stream {call_sid}] Transcribed text: {transcription}")
+        if not transcription:
+            return
+
+        if MEMORY_BACKEND != "persistent":
+            phone_number = None
+        index = 0
+        async for sentence, audio in astream_reply_audio(transcription, session_id=call_sid, phone_number=phone_number):
+            if stopped.is_set():
+                continue
+            payload = await stage_executor.run("tts", _encode_reply_payload, audio)
+            if index == 0:
+                timer.mark("first_audio")
+            for message in media_messages(stream_sid, payload):
+                await websocket.send_json(message)
+            # Twilio echoes the mark back once this sentence has been played
+            await websocket.send_json({"event": "mark", "streamSid": stream_sid, "mark": {"name": f"turn-{turn}-sentence-{index}"}})
+            logger.info(f"[Stream {call_sid}] Streamed sentence {index + 1}: {sentence}")
+            index += 1
+        if index:
+            timer.step("reply")
+            timer.total()
+    except asyncio.CancelledError:
         raise
     except Exception as e:
-        logger.error(f"Voice handler error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"[Stream {call_sid}] Reply error: {e}", exc_info=True)
+
+
+@router.websocket("/stream")
+async def media_stream(websocket: WebSocket):
+    """
+    Twilio Media Streams endpoint for real-time calls.
+    Receives 8 kHz mu-law frames, detects the end of each utterance with VAD,
+    runs transcribe -> generate -> synthesize and streams the reply audio back
+    over the same socket. Speech from the caller while a reply is playing
+    clears Twilio's playback buffer (barge-in).
+    """
+    await websocket.accept()
+    vad = EnergyVAD(TWILIO_SAMPLE_RATE)
+    stream_sid = None
+    call_sid = None
+    phone_number = None
+    reply_task: Optional[asyncio.Task] = None
+    stopped = asyncio.Event()
+    turn = 0
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            event = message.get("event")
+            if event == "start":
+                start = message["start"]
+                stream_sid = start["streamSid"]
+                call_sid = validate_call_sid(start.get("callSid"))
+                phone_number = validate_phone_number(start.get("customParameters", {}).get("From"))
+                logger.info(f"Media stream {stream_sid} started for CallSid={call_sid}")
+            elif event == "media" and stream_sid:
+                was_speaking = vad.triggered
+                utterances = vad.feed(mulaw_decode(base64.b64decode(message["media"]["payload"])))
+                if vad.triggered and not was_speaking and reply_task and not reply_task.done():
+                    reply_task.cancel()
+                    await websocket.send_json({"event": "clear", "streamSid": stream_sid})
+                    logger.info(f"[Stream {call_sid}] Caller barged in, reply cancelled")
+                for utterance in utterances:
+                    if reply_task and not reply_task.done():
+                        reply_task.cancel()
+                    turn += 1
+                    reply_task = asyncio.create_task(
+                        _stream_reply(websocket, stream_sid, call_sid, phone_number, utterance, turn, stopped)
+                    )
+            elif event == "stop":
+                logger.info(f"Media stream {stream_sid} stopped")
+                stopped.set()
+                # The caller may hang up mid-sentence; answer that utterance like any other
+                utterance = vad.flush()
+                if utterance is not None and stream_sid:
+                    if reply_task and not reply_task.done():
+                        reply_task.cancel()
+                    turn += 1
+                    reply_task = asyncio.create_task(
+                        _stream_reply(websocket, stream_sid, call_sid, phone_number, utterance, turn, stopped)
+                    )
+                # Let the last turn finish so it is recorded in session memory
+                if reply_task:
+                    await asyncio.wait([reply_task])
+                break
+    except WebSocketDisconnect:
+        logger.info(f"Media stream {stream_sid} disconnected")
+    except Exception as e:
+        logger.error(f"Media stream error: {e}", exc_info=True)
+    finally:
+        if reply_task and not reply_task.done():
+            reply_task.cancel()
 
 
 @router.post("/voice/end")
 async def handle_call_end(request: Request) -> Response:
     """
     Clean-up when Twilio signals the call has ended.
-    Summarize memory, clear session, delete temp files.
+    Queue the call summary, clear session, drop reply audio.
     """
     try:
         form_data = await request.form()
         call_sid = validate_call_sid(form_data.get("CallSid"))
 
         if MEMORY_BACKEND == "persistent":
-            memory_backend.summarize_and_save(call_sid)
+            # Commit the call's write-behind log rows, then leave the LLM summary to a job worker
+            await asyncio.to_thread(memory_backend.flush)
+            await asyncio.to_thread(job_queue.enqueue, "summarize_call", {"call_sid": call_sid}, f"summarize_call:{call_sid}")
         memory_backend.clear_session(call_sid)
 
-        # Clean up audio files for this call
-        deleted_count = 0
-        for file in AUDIO_DIR.glob(f"*{call_sid}*"):
-            try:
-                file.unlink()
-                deleted_count += 1
-                logger.info(f"Deleted file: {file}")
-            except Exception as e:
-                logger.error(f"Error deleting file {file}: {e}")
-        logger.info(f"Cleaned up {deleted_count} audio file(s) for call {call_sid}")
+        # Drop the call's reply audio
+        discarded = reply_audio.discard_owner(call_sid)
+        logger.info(f"Discarded {discarded} reply audio stream(s) for call {call_sid}")
 
         return Response(content="OK", media_type="text/plain")
 
@@ -110,3 +110,53 @@ def validate_environment_variables(required_vars: list[str]) -> dict[str, Option
     
     return results
 
+
+
+# Sentence terminators followed by whitespace; the lookbehind keeps the
+# punctuation attached to the sentence it ends.
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+_ABBREVIATIONS = {"dr.", "mr.", "mrs.", "ms.", "st.", "jr.", "sr.", "e.g.", "i.e.", "vs.", "a.m.", "p.m."}
+
+
+def pop_complete_sentences(buffer: str) -> Tuple[list[str], str]:
+    """
+    Split finished sentences off the front of a growing text buffer.
+    
+    Used while streaming tokens from the LLM: everything up to the last
+    sentence boundary is returned as complete sentences, the tail is kept
+    until more text arrives.
+    
+    Args:
+        buffer: Text accumulated so far
+        
+    Returns:
+        Tuple of (complete sentences, remaining partial text)
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY_RE.finditer(buffer):
+        candidate = buffer[start:match.end()].strip()
+        last_word = candidate.rsplit(None, 1)[-1].lower() if candidate else ""
+        if last_word in _ABBREVIATIONS:
+            continue
+        if candidate:
+            sentences.append(candidate)
+        start = match.end()
+    return sentences, buffer[start:]
+
+
+def split_sentences(text: str) -> list[str]:
+    """
+    Split a complete text into sentences.
+    
+    Args:
+        text: Text to split
+        
+    Returns:
+        List of non-empty sentences
+    """
+    sentences, remainder = pop_complete_sentences(text)
+    remainder = remainder.strip()
+    if remainder:
+        sentences.append(remainder)
+    return sentences
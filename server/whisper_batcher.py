@@ -0,0 +1,165 @@
+"""
+Micro-batching scheduler for Whisper.
+
+When several callers finish speaking at the same moment their utterances
+would otherwise be transcribed one after another. WhisperBatcher owns the
+Whisper model on a single scheduler thread, gathers pending utterances for
+up to max_wait_ms (or until max_batch are waiting), pads them to Whisper's
+30-second window and decodes them in one batched mel/decoder pass. Each
+caller gets its text back through its own Future.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+
+from server.audio_codec import WHISPER_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+WHISPER_BATCH_MAX = int(os.getenv("CLINICGUARD_WHISPER_BATCH_MAX", "8"))
+WHISPER_BATCH_WAIT_MS = float(os.getenv("CLINICGUARD_WHISPER_BATCH_WAIT_MS", "30"))
+WHISPER_LANGUAGE = os.getenv("CLINICGUARD_WHISPER_LANGUAGE", "en")
+
+# Whisper decodes one 30 s window per pass
+WHISPER_WINDOW_SAMPLES = 30 * WHISPER_SAMPLE_RATE
+
+
+class _Request:
+    __slots__ = ("audio", "future")
+
+    def __init__(self, audio: np.ndarray):
+        self.audio = audio
+        self.future: Future = Future()
+
+
+class WhisperBatcher:
+    """Gathers concurrent transcription requests into batched Whisper decodes."""
+
+    name = "whisper"
+
+    def __init__(self, model, max_batch: int = WHISPER_BATCH_MAX, max_wait_ms: float = WHISPER_BATCH_WAIT_MS,
+                 language: Optional[str] = WHISPER_LANGUAGE):
+        import whisper
+        
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.options = whisper.DecodingOptions(
+            language=language or None,
+            without_timestamps=True,
+            fp16=model.device.type == "cuda",
+        )
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Whisper batcher started (max_batch={self.max_batch}, max_wait={max_wait_ms}ms)")
+
+    def submit(self, audio: np.ndarray) -> Future:
+        """
+        Queue 16 kHz float32 audio for transcription.
+
+        Args:
+            audio: Mono float32 samples at 16 kHz
+
+        Returns:
+            Future resolving to the transcribed text
+        """
+        request = _Request(np.asarray(audio, dtype=np.float32))
+        self._queue.put(request)
+        return request.future
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(audio).result()
+
+    def queue_depth(self) -> int:
+        """Number of utterances waiting for the next batch."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Batching counters for monitoring."""
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "queued": self.queue_depth(),
+            }
+
+    def close(self):
+        """Stop the scheduler thread after the queued requests are done."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Put the shutdown marker back for the main loop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            # Longer audio than one window goes through transcribe()
+            short = [r for r in batch if r.audio.size <= WHISPER_WINDOW_SAMPLES]
+            long = [r for r in batch if r.audio.size > WHISPER_WINDOW_SAMPLES]
+            if short:
+                self._decode_batch(short)
+            for request in long:
+                self._transcribe_single(request)
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(batch)
+
+    def _decode_batch(self, batch: List[_Request]):
+        import torch
+        import whisper
+        
+        try:
+            started = time.perf_counter()
+            mels = [
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(r.audio), n_mels=self.model.dims.n_mels)
+                for r in batch
+            ]
+            with torch.no_grad():
+                results = whisper.decode(self.model, torch.stack(mels).to(self.model.device), self.options)
+            for request, result in zip(batch, results):
+                request.future.set_result(result.text.strip())
+            logger.info(f"Decoded Whisper batch of {len(batch)} in {time.perf_counter() - started:.3f}s")
+        except Exception as e:
+            logger.error(f"Batched Whisper decode failed: {e}", exc_info=True)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def _transcribe_single(self, request: _Request):
+        try:
+            result = self.model.transcribe(request.audio, language=self.options.language, fp16=self.options.fp16)
+            request.future.set_result(result.get("text", "").strip())
+        except Exception as e:
+            logger.error(f"Whisper transcription failed: {e}", exc_info=True)
+            request.future.set_exception(e)
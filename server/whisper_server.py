@@ -1,61 +1,76 @@
+"""
+Standalone speech-to-text service.
+
+Serves the engine selected by CLINICGUARD_STT_ENGINE (see stt_engines) over
+HTTP for deployments that keep transcription off the API boxes. The model
+is loaded once at startup. Uploads are decoded in memory, and transcription
+runs off the event loop so /health stays responsive.
+
+Usage:
+    python -m server.whisper_server
+"""
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, HTTPException
-import whisper
+import asyncio
 import logging
 import os
-import tempfile
+
+from server.audio_codec import WHISPER_SAMPLE_RATE, decode_audio
+from server.stt_engines import STT_ENGINE, WHISPER_MODEL_NAME, load_stt_engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Whisper Service")
+ALLOWED_EXTENSIONS = {".wav", ".mp3"}
 
-# Load the Whisper model
-try:
-    model = whisper.load_model("base")
-    logger.info("Whisper model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load Whisper model: {e}")
-    model = None
+engine = None
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-import whisper
-import tempfile
-import os
 
-app = FastAPI()
-
-# Load the model once
-model = whisper.load_model("base")
-
-@app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the STT engine before serving traffic."""
+    global engine
     try:
-        # ✅ Validate extension using os.path.splitext
-        ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in ['.wav', '.mp3']:
-            raise HTTPException(status_code=400, detail="Only .wav and .mp3 files are supported")
-
-        # ✅ Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
+        engine = await asyncio.to_thread(load_stt_engine)
+        logger.info(f"STT engine '{STT_ENGINE}' loaded with model '{WHISPER_MODEL_NAME}'")
+    except Exception as e:
+        logger.error(f"Failed to load STT engine '{STT_ENGINE}': {e}")
+        engine = None
+    yield
+    if engine is not None:
+        engine.close()
 
-        # ✅ Transcribe using Whisper
-        result = model.transcribe(tmp_path)
 
-        # ✅ Clean up temp file
-        os.remove(tmp_path)
+app = FastAPI(title="Whisper Service", lifespan=lifespan)
 
-        return {"transcription": result["text"]}
 
+@app.post("/transcribe")
+async def transcribe(file: UploadFile = File(...)):
+    """Transcribe an uploaded .wav or .mp3 file."""
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only .wav and .mp3 files are supported")
+    if engine is None:
+        raise HTTPException(status_code=503, detail="STT model not loaded")
+    try:
+        audio = await asyncio.to_thread(decode_audio, await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode audio: {e}")
+    try:
+        text = await asyncio.to_thread(engine.transcribe, audio)
     except Exception as e:
+        logger.error(f"Transcription failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Transcribed {audio.size / WHISPER_SAMPLE_RATE:.2f}s of audio")
+    return {"transcription": text}
+
 
 @app.get("/health")
 def health():
     """Health check endpoint"""
-    return {"status": "ok", "model_loaded": model is not None}
+    return {"status": "ok", "model_loaded": engine is not None, "engine": STT_ENGINE, "model": WHISPER_MODEL_NAME}
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,97 @@
+import os
+import sys
+import logging
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.agent_services as agent_services
+import server.pipeline_controller as pipeline_controller
+import server.twilio_router as twilio_router
+from server.audio_codec import WHISPER_SAMPLE_RATE
+from server.audio_frontend import speech_regions, trim_silence
+from server.idempotency import IdempotencyCache
+from server.metrics import stt_audio_seconds, stt_skipped_turns
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+rng = np.random.default_rng(0)
+
+def hiss(seconds: float) -> np.ndarray:
+    return rng.normal(0, 0.002, int(WHISPER_SAMPLE_RATE * seconds)).astype(np.float32)
+
+def speech(seconds: float) -> np.ndarray:
+    # Syllable-like bursts: 200 ms voiced, 100 ms pause between words
+    t = np.arange(int(WHISPER_SAMPLE_RATE * seconds)) / WHISPER_SAMPLE_RATE
+    envelope = ((t % 0.3) < 0.2).astype(np.float32)
+    return (0.3 * envelope * np.sin(2 * np.pi * 220 * t)).astype(np.float32) + hiss(seconds)
+
+def counter_value(counter, **labels) -> float:
+    samples = counter.collect()[0].samples
+    return sum(value for _, sample_labels, value in samples if sample_labels == {k: str(v) for k, v in labels.items()})
+
+class FailingEngine:
+    name = "failing"
+
+    def transcribe(self, audio):
+        raise AssertionError("silent audio must not reach the STT engine")
+
+def test_trim_removes_leading_trailing_and_long_pauses():
+    """Test that two phrases padded with silence keep their speech and lose most of the silence."""
+    audio = np.concatenate([hiss(3.0), speech(1.5), hiss(4.0), speech(1.2), hiss(5.0)])
+    regions = speech_regions(audio)
+    assert len(regions) == 2
+    result = trim_silence(audio)
+    # Both phrases survive with at most the padding around them
+    assert 2.7 <= result.speech_seconds <= 2.7 + 4 * 0.2 + 0.1
+    assert result.removed_seconds > 11.0
+    # Pauses between words do not split a phrase
+    assert len(speech_regions(speech(3.0))) == 1
+
+def test_trim_keeps_continuous_speech_and_drops_hiss():
+    """Test that audio with no pauses is kept whole and line hiss alone counts as silence."""
+    tone = (0.3 * np.sin(2 * np.pi * 220 * np.arange(WHISPER_SAMPLE_RATE) / WHISPER_SAMPLE_RATE)).astype(np.float32)
+    assert trim_silence(tone).audio.size == tone.size
+    assert trim_silence(hiss(10.0)).audio.size == 0
+    assert trim_silence(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)).audio.size == 0
+    assert trim_silence(np.zeros(0, dtype=np.float32)).audio.size == 0
+
+def test_silent_recording_is_not_transcribed(monkeypatch):
+    """Test that a silent <Record> turn skips the STT engine and the LLM and asks the caller again."""
+    async def silent_recording(recording_url):
+        return hiss(20.0)
+
+    monkeypatch.setattr(agent_services, "get_stt_engine", lambda: FailingEngine())
+    monkeypatch.setattr(twilio_router, "download_recording", silent_recording)
+    monkeypatch.setattr(twilio_router, "webhook_cache", IdempotencyCache())
+    skipped = counter_value(stt_skipped_turns)
+    received = counter_value(stt_audio_seconds, stage="input")
+    app = FastAPI()
+    app.include_router(twilio_router.router)
+    with TestClient(app) as client:
+        response = client.post("/twilio/voice", data={"CallSid": "CA" + "2" * 32, "RecordingSid": "RE" + "2" * 32,
+                                                       "RecordingUrl": "https://api.twilio.com/rec"})
+    assert response.status_code == 200
+    assert "didn't catch that" in response.text and "<Record" in response.text
+    assert counter_value(stt_skipped_turns) == skipped + 1
+    assert counter_value(stt_audio_seconds, stage="input") >= received + 20.0
+
+def test_missing_ffmpeg_is_a_server_error(monkeypatch, tmp_path):
+    """Test that a compressed upload without an ffmpeg binary returns a 500 naming the decoder, not a 404."""
+    monkeypatch.setenv("PATH", str(tmp_path))
+    app = FastAPI()
+    app.include_router(pipeline_controller.router)
+    with TestClient(app) as client:
+        response = client.post("/api/process_audio", files={"audio": ("turn.mp3", b"ID3" + bytes(1024), "audio/mpeg")})
+    assert response.status_code == 500
+    assert "ffmpeg" in response.json()["detail"]
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
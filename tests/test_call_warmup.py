@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import tempfile
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.agent_services as agent_services
+import server.twilio_router as twilio_router
+from server.db import Base, Call, Patient, Summary
+from server.context_window import ContextWindow
+from server.log_writer import ConversationLogWriter
+from server.prompt_cache import PromptPrefixCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeLlama:
+    """Byte-level stand-in for llama_cpp.Llama that records how many tokens each eval() processes."""
+
+    def __init__(self):
+        self.input_ids = np.zeros(4096, dtype=np.intc)
+        self.n_tokens = 0
+        self.evaluated = []
+
+    def tokenize(self, text, add_bos=True):
+        return ([1] if add_bos else []) + list(text)
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+        self.evaluated.append(len(tokens))
+
+    def save_state(self):
+        return (self.input_ids.copy(), self.n_tokens)
+
+    def load_state(self, state):
+        self.input_ids, self.n_tokens = state[0].copy(), state[1]
+
+def use_warmup_environment(monkeypatch, directory):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'warmup.db')}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(agent_services, "SessionLocal", factory)
+    monkeypatch.setattr(agent_services, "ensure_db_initialized", lambda: None)
+    writer = ConversationLogWriter(factory)
+    llm = FakeLlama()
+    monkeypatch.setattr(agent_services, "MEMORY_BACKEND", "persistent")
+    monkeypatch.setattr(agent_services, "LLM_BACKEND", "local")
+    monkeypatch.setattr(agent_services, "memory_backend", agent_services.PersistentSessionMemory(writer))
+    monkeypatch.setattr(agent_services, "prompt_cache", PromptPrefixCache(10**9))
+    monkeypatch.setattr(agent_services, "get_llama", lambda: llm)
+    return factory, writer, llm
+
+def test_warmup_prepares_session_and_prefix(monkeypatch):
+    """Test that warming up a call creates its rows, loads only the latest summary and caches the evaluated prefix."""
+    with tempfile.TemporaryDirectory() as tmp:
+        factory, writer, llm = use_warmup_environment(monkeypatch, tmp)
+        db = factory()
+        patient = Patient(phone_number="+15555550199")
+        db.add(patient)
+        db.commit()
+        patient_id = patient.id
+        now = datetime.utcnow()
+        db.add_all([
+            Summary(patient_id=patient_id, summary_text="Old visit", created_at=now - timedelta(days=30)),
+            Summary(patient_id=patient_id, summary_text="Prefers Monday mornings", created_at=now - timedelta(days=1)),
+        ])
+        db.commit()
+        db.close()
+
+        agent_services.warm_up_call("CA-warm", "+15555550199")
+
+        db = factory()
+        assert db.query(Call).filter_by(call_sid="CA-warm").one().patient_id == patient_id
+        db.close()
+        assert agent_services.memory_backend.get_session("CA-warm") == [("System", "Prefers Monday mornings")]
+        prefix = agent_services.SYSTEM_PREAMBLE + "System: Prefers Monday mornings\n"
+        state = agent_services.prompt_cache.lookup("CA-warm")
+        assert list(state[0][:state[1]]) == llm.tokenize(prefix.encode("utf-8"))
+        # The shared preamble once, then only the summary line on top of it
+        assert llm.evaluated == [len(llm.tokenize(agent_services.SYSTEM_PREAMBLE.encode("utf-8"))), len(b"System: Prefers Monday mornings\n")]
+
+        # The first turn's prompt extends the warmed prefix
+        full_prompt = agent_services._build_prompt("Hi, it's me again", "CA-warm", phone_number="+15555550199")
+        assert full_prompt.startswith(prefix)
+        writer.close()
+
+class SummarizedWindow(ContextWindow):
+    """Context window that reports a rolling call summary, as after a fold."""
+
+    def fit(self, session_id, history, reserve_tokens=0):
+        return "Caller wants a cleaning", super().fit(None, history, reserve_tokens)[1]
+
+def test_call_summary_follows_the_cached_prefix(monkeypatch):
+    """Test that the rolling call summary goes after the preamble and patient summary, not before them."""
+    with tempfile.TemporaryDirectory() as tmp:
+        factory, writer, llm = use_warmup_environment(monkeypatch, tmp)
+        monkeypatch.setattr(agent_services, "context_window", SummarizedWindow(
+            1400, agent_services.count_tokens, agent_services._render_turn, lambda previous, turns: previous
+        ))
+        agent_services.memory_backend.add_message("CA-fold", "System", "Prefers Monday mornings", "+15555550199")
+        agent_services.memory_backend.add_message("CA-fold", "User", "I need a cleaning", "+15555550199")
+
+        full_prompt = agent_services._build_prompt("Monday works", "CA-fold", phone_number="+15555550199")
+        assert full_prompt == (
+            agent_services.SYSTEM_PREAMBLE
+            + "System: Prefers Monday mornings\n"
+            + "System: Earlier in this call: Caller wants a cleaning\n"
+            + "User: I need a cleaning\n"
+            + "User: Monday works\nAssistant:"
+        )
+        writer.close()
+
+def test_answer_webhook_starts_warmup(monkeypatch):
+    """Test that /voice/answer returns TwiML and warms the call up in the background."""
+    warmed = []
+    monkeypatch.setattr(twilio_router, "MEMORY_BACKEND", "persistent")
+    monkeypatch.setattr(twilio_router, "warm_up_call", lambda call_sid, phone_number: warmed.append((call_sid, phone_number)))
+    app = FastAPI()
+    app.include_router(twilio_router.router)
+    with TestClient(app) as client:
+        response = client.post("/twilio/voice/answer", data={"CallSid": "CA" + "0" * 32, "From": "+15555550199"})
+        assert response.status_code == 200
+        assert "<Record" in response.text or "<Stream" in response.text
+        deadline = time.monotonic() + 5
+        while not warmed and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert warmed == [("CA" + "0" * 32, "+15555550199")]
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,114 @@
+import os
+import sys
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.context_window import ContextWindow
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def count_words(text):
+    return len(text.split())
+
+def render(turn):
+    return f"{turn[0]}: {turn[1]}\n"
+
+class RecordingSummarizer:
+    """Summarizer stand-in that reports the range of folded turns and records what each fold received."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous, turns):
+        self.calls.append((previous, list(turns)))
+        first = previous.split()[1].split("-")[0] if previous else turns[0][1].split()[1]
+        return f"turns {first}-{turns[-1][1].split()[1]}"
+
+def prompt_tokens(window, summary, turns):
+    lines = [window.render_summary(summary)] if summary else []
+    return sum(count_words(line) for line in lines + [render(t) for t in turns])
+
+def test_prompt_stays_within_budget_for_long_calls():
+    """Test that the prompt stays bounded over a 200-turn call and every turn is summarized or kept."""
+    summarizer = RecordingSummarizer()
+    window = ContextWindow(60, count_words, render, summarizer)
+    history = [("System", "returning patient prefers mornings")]
+    sizes = []
+    for i in range(200):
+        history.append(("User" if i % 2 == 0 else "Assistant", f"turn {i} with a few more words"))
+        summary, turns = window.fit("call-1", history, reserve_tokens=5)
+        window.wait_for_folds()
+        sizes.append(prompt_tokens(window, summary, turns))
+        assert turns[0] == history[0], "the patient summary must stay pinned"
+
+    assert max(sizes) <= 60
+    summary, turns = window.fit("call-1", history)
+    first, last = (int(n) for n in summary.split()[1].split("-"))
+    folded = list(range(first, last + 1))
+    kept = [int(text.split()[1]) for speaker, text in turns if speaker != "System"]
+    assert folded + kept == list(range(200))
+
+def test_folds_are_incremental_and_infrequent():
+    """Test that each fold only receives newly evicted turns and evicts to the low-water mark."""
+    summarizer = RecordingSummarizer()
+    window = ContextWindow(60, count_words, render, summarizer)
+    history = []
+    for i in range(100):
+        history.append(("User", f"turn {i} with a few more words"))
+        window.fit("call-2", history)
+        window.wait_for_folds()
+
+    previous_end = -1
+    for previous, turns in summarizer.calls:
+        numbers = [int(text.split()[1]) for _, text in turns]
+        assert numbers[0] == previous_end + 1
+        previous_end = numbers[-1]
+    # Evicting to 75% of the budget folds a batch of turns at a time instead of one per turn
+    assert len(summarizer.calls) < 100 / 2
+
+def test_stateless_history_is_truncated_without_summary():
+    """Test that explicit history without a session is only truncated."""
+    summarizer = RecordingSummarizer()
+    window = ContextWindow(20, count_words, render, summarizer)
+    history = [("User", f"turn {i} four words") for i in range(10)]
+    summary, turns = window.fit(None, history)
+    assert summary == ""
+    assert turns == history[-4:]
+    assert summarizer.calls == []
+
+def test_folds_use_the_given_executor_and_count_outside_the_lock():
+    """Test that folds run where the application submits them and tokens are counted without holding the lock."""
+    summarizer = RecordingSummarizer()
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-stage")
+    fold_threads = []
+
+    def summarize(previous, turns):
+        fold_threads.append(threading.current_thread().name)
+        return summarizer(previous, turns)
+
+    def count(text):
+        assert not window._lock.locked(), "tokens must be counted outside the window lock"
+        return count_words(text)
+
+    window = ContextWindow(60, count, render, summarize, submit=pool.submit)
+    history = []
+    try:
+        for i in range(40):
+            history.append(("User", f"turn {i} with a few more words"))
+            window.fit("call-3", history)
+            window.wait_for_folds()
+    finally:
+        pool.shutdown()
+    assert fold_threads and all(name.startswith("llm-stage") for name in fold_threads)
+
+if __name__ == "__main__":
+    test_prompt_stays_within_budget_for_long_calls()
+    test_folds_are_incremental_and_infrequent()
+    test_stateless_history_is_truncated_without_summary()
+    test_folds_use_the_given_executor_and_count_outside_the_lock()
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import logging
+
+from sqlalchemy import create_engine, inspect, text
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.db import Base, create_db_engine
+import server.db_migrate as db_migrate
+from server.db_migrate import MIGRATIONS, applied_versions, migrate
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_sqlite_engine_uses_wal():
+    """Test that file-backed SQLite connections come up in WAL mode with relaxed sync."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'wal.db')}")
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            # NORMAL
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        engine.dispose()
+
+def test_migrations_are_idempotent():
+    """Test that migrations apply once, in order, and a second run is a no-op."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'migrate.db')}")
+        all_versions = [version for version, _, _ in MIGRATIONS]
+        assert migrate(engine) == all_versions
+        assert migrate(engine) == []
+        assert applied_versions(engine) == all_versions
+        engine.dispose()
+
+def test_legacy_database_gets_indexes():
+    """Test that a database created by the old create_all() gains the composite indexes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'legacy.db')}"
+        legacy = create_engine(url)
+        with legacy.begin() as connection:
+            connection.execute(text("CREATE TABLE conversation_logs (id INTEGER PRIMARY KEY, call_id INTEGER, role VARCHAR, content TEXT, timestamp DATETIME)"))
+            connection.execute(text("CREATE TABLE summaries (id INTEGER PRIMARY KEY, patient_id INTEGER, summary_text TEXT, created_at DATETIME)"))
+        legacy.dispose()
+
+        engine = create_db_engine(url)
+        migrate(engine)
+        inspector = inspect(engine)
+        log_indexes = {index["name"]: index["column_names"] for index in inspector.get_indexes("conversation_logs")}
+        summary_indexes = {index["name"]: index["column_names"] for index in inspector.get_indexes("summaries")}
+        assert log_indexes["ix_conversation_logs_call_id_timestamp"] == ["call_id", "timestamp", "id"]
+        assert summary_indexes["ix_summaries_patient_id_created_at"] == ["patient_id", "created_at"]
+
+        with engine.connect() as connection:
+            plan = " ".join(str(row[-1]) for row in connection.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM conversation_logs WHERE call_id = 1 ORDER BY timestamp, id"
+            )))
+        assert "ix_conversation_logs_call_id_timestamp" in plan
+        assert "TEMP B-TREE" not in plan
+        engine.dispose()
+
+def test_fresh_database_matches_models_through_the_migrations():
+    """Test that the baseline lacks the composite indexes and the full chain ends at the current models."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'fresh.db')}")
+        with engine.begin() as connection:
+            MIGRATIONS[0][2](connection)
+        baseline_indexes = {index["name"] for index in inspect(engine).get_indexes("conversation_logs")}
+        assert "ix_conversation_logs_call_id_timestamp" not in baseline_indexes
+
+        migrate(engine)
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            assert {column["name"] for column in inspector.get_columns(table.name)} == set(table.columns.keys())
+            assert {index["name"] for index in inspector.get_indexes(table.name)} == {index.name for index in table.indexes}
+        engine.dispose()
+
+def test_concurrent_migrations_apply_each_step_once():
+    """Test that processes starting together wait for one another instead of running the same step twice."""
+    def slow_step(connection):
+        time.sleep(0.2)
+        connection.execute(text("CREATE TABLE slow_step (id INTEGER PRIMARY KEY)"))
+
+    db_migrate.MIGRATIONS = MIGRATIONS + [(len(MIGRATIONS) + 1, "slow step", slow_step)]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'concurrent.db')}"
+            results, errors = [], []
+
+            def run():
+                engine = create_db_engine(url)
+                try:
+                    results.append(migrate(engine))
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    engine.dispose()
+
+            threads = [threading.Thread(target=run) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+            assert errors == []
+            all_versions = [version for version, _, _ in db_migrate.MIGRATIONS]
+            assert sorted(version for applied in results for version in applied) == all_versions
+    finally:
+        db_migrate.MIGRATIONS = MIGRATIONS
+
+if __name__ == "__main__":
+    test_sqlite_engine_uses_wal()
+    test_migrations_are_idempotent()
+    test_legacy_database_gets_indexes()
+    test_fresh_database_matches_models_through_the_migrations()
+    test_concurrent_migrations_apply_each_step_once()
+    print("All tests passed!")
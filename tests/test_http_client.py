@@ -0,0 +1,236 @@
+import os
+import sys
+import asyncio
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.twilio_router as twilio_router
+from server.audio_codec import write_wav
+from server.http_client import SharedHTTPClient
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Local stand-in for Twilio/ElevenLabs that records connections and concurrency."""
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.client_ports.append(self.client_address[1])
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+        body = b"RIFF-audio"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ChunkedRecordingHandler(BaseHTTPRequestHandler):
+    """Serves a WAV recording with chunked encoding, i.e. without announcing its size."""
+    protocol_version = "HTTP/1.1"
+    body = b""
+    bytes_sent = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.bytes_sent = 0
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for start in range(0, len(cls.body), 16 * 1024):
+                piece = cls.body[start:start + 16 * 1024]
+                self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+                self.wfile.flush()
+                cls.bytes_sent += len(piece)
+                time.sleep(0.001)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(handler=StubHandler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def test_sequential_requests_reuse_one_connection():
+    """Test that keep-alive lets consecutive turns share a single TCP connection."""
+    server, base_url = start_stub_server()
+    StubHandler.client_ports = []
+    client = SharedHTTPClient(max_per_host=4)
+
+    async def run():
+        try:
+            for _ in range(5):
+                response = await client.get(f"{base_url}/recording")
+                assert response.status_code == 200
+                assert response.content == b"RIFF-audio"
+        finally:
+            await client.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert len(StubHandler.client_ports) == 5
+    assert len(set(StubHandler.client_ports)) == 1
+
+def test_per_host_limit_caps_concurrency():
+    """Test that no more than max_per_host requests reach one upstream at a time."""
+    server, base_url = start_stub_server()
+    StubHandler.max_in_flight = 0
+    client = SharedHTTPClient(max_per_host=2)
+
+    async def run():
+        try:
+            responses = await asyncio.gather(*(client.get(f"{base_url}/voice") for _ in range(8)))
+            assert all(r.status_code == 200 for r in responses)
+        finally:
+            await client.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert StubHandler.max_in_flight == 2
+
+def test_recording_download_streams_and_enforces_cap(monkeypatch):
+    """Test that recordings decode while streaming and oversized ones are cut off mid-transfer."""
+    import numpy as np
+    from fastapi import HTTPException
+
+    server, base_url = start_stub_server(ChunkedRecordingHandler)
+    client = SharedHTTPClient()
+    monkeypatch.setattr(twilio_router, "http_client", client)
+    monkeypatch.setattr(twilio_router, "TWILIO_ACCOUNT_SID", "AC-test")
+    monkeypatch.setattr(twilio_router, "TWILIO_AUTH_TOKEN", "token")
+    ChunkedRecordingHandler.body = write_wav(np.zeros(8000 * 30, dtype=np.float32), 8000)
+
+    async def run():
+        try:
+            audio = await twilio_router.download_recording(f"{base_url}/recording")
+            assert audio.size == 16000 * 30
+            monkeypatch.setattr(twilio_router, "MAX_AUDIO_FILE_SIZE_BYTES", 100 * 1024)
+            try:
+                await twilio_router.download_recording(f"{base_url}/recording")
+                raise AssertionError("expected the download to be rejected")
+            except HTTPException as e:
+                assert e.status_code == 400
+                assert "too large" in e.detail
+        finally:
+            await client.aclose()
+
+    try:
+        asyncio.run(run())
+        time.sleep(0.2)
+    finally:
+        server.shutdown()
+    # The server never got to send the whole 480KB body
+    assert ChunkedRecordingHandler.bytes_sent < len(ChunkedRecordingHandler.body)
+
+def test_redirects_are_followed():
+    """Test that requests and streams follow a recording URL's redirect to the media host."""
+    def handler(request):
+        if request.url.host == "api.twilio.com":
+            return httpx.Response(302, headers={"Location": "https://media.twiliocdn.com/RE1.wav"})
+        return httpx.Response(200, content=b"RIFF-audio")
+
+    client = SharedHTTPClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            response = await client.get("https://api.twilio.com/Recordings/RE1")
+            async with client.stream("GET", "https://api.twilio.com/Recordings/RE1") as streamed:
+                body = await streamed.aread()
+            return response, streamed, body
+        finally:
+            await client.aclose()
+
+    response, streamed, body = asyncio.run(run())
+    assert response.status_code == 200 and response.content == b"RIFF-audio"
+    assert [r.status_code for r in response.history] == [302]
+    assert streamed.url.host == "media.twiliocdn.com" and body == b"RIFF-audio"
+
+def test_elevenlabs_keeps_sync_calls_next_to_async_variants(monkeypatch, tmp_path):
+    """Test that text_to_speech stays synchronous, leaves the shared client open, and async_text_to_speech serves event-loop callers."""
+    import pytest
+    import server.tts_handler as tts_handler
+    from server.tts_cache import TTSCache
+
+    def handler(request):
+        if request.url.path.endswith("/voices"):
+            return httpx.Response(200, json={"voices": [{"voice_id": "v1"}]})
+        return httpx.Response(200, content=b"mp3:" + request.content.split(b'"')[3])
+
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "key")
+    monkeypatch.setenv("ELEVENLABS_VOICE_ID", "v1")
+    shared = SharedHTTPClient(transport=httpx.MockTransport(handler))
+    pooled = shared.client
+    monkeypatch.setattr(tts_handler, "http_client", shared)
+    monkeypatch.setattr(tts_handler, "tts_cache", TTSCache(str(tmp_path), 1024 * 1024, 1024 * 1024))
+    monkeypatch.setattr(tts_handler, "_tts_client", None)
+    tts = tts_handler.ElevenLabsTTS()
+
+    assert tts_handler.text_to_speech("Hello there.") == b"mp3:Hello there."
+    assert tts.text_to_speech("Hi.").read() == b"mp3:Hi."
+    assert tts.get_available_voices() == [{"voice_id": "v1"}]
+    # Synchronous calls use their own client; the process-wide one stays open for the API
+    assert shared.client is pooled and not pooled.is_closed
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            tts_handler.text_to_speech("Hello there.")
+        return await tts_handler.async_text_to_speech("Goodbye.")
+
+    assert asyncio.run(run()) == b"mp3:Goodbye."
+
+def test_repeated_sync_elevenlabs_calls_with_many_chunks(monkeypatch, tmp_path):
+    """Test that consecutive synchronous calls, each on its own event loop, can wait on the concurrency cap."""
+    import server.tts_handler as tts_handler
+    from server.tts_cache import TTSCache
+
+    async def handler(request):
+        # Slow enough that more chunks than the cap are in flight at once
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, content=b"mp3;")
+
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "key")
+    monkeypatch.setenv("ELEVENLABS_VOICE_ID", "v1")
+    monkeypatch.setattr(tts_handler, "http_client", SharedHTTPClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(tts_handler, "tts_cache", TTSCache(str(tmp_path), 1024 * 1024, 1024 * 1024))
+    monkeypatch.setattr(tts_handler, "_tts_client", None)
+
+    for call in range(2):
+        # Five sentences of about 1500 characters: one chunk each, more than ELEVENLABS_MAX_CONCURRENCY
+        text = " ".join(f"Call {call} sentence {i} " + "word " * 300 + "end." for i in range(5))
+        assert len(tts_handler.chunk_text(text)) == 5
+        assert tts_handler.text_to_speech(text) == b"mp3;" * 5
+
+if __name__ == "__main__":
+    test_sequential_requests_reuse_one_connection()
+    test_per_host_limit_caps_concurrency()
+    test_redirects_are_followed()
+    test_repeated_sync_elevenlabs_calls_with_many_chunks()
@@ -0,0 +1,103 @@
+import os
+import sys
+import asyncio
+import logging
+
+import httpx
+from fastapi import FastAPI
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.twilio_router as twilio_router
+from server.idempotency import IdempotencyCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_duplicates_join_and_replay():
+    """Test that concurrent duplicates share one run and later ones get the stored response until it expires."""
+    clock = FakeClock()
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=100, clock=clock)
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return f"<Response>{len(runs)}</Response>"
+
+    async def run():
+        first = await asyncio.gather(*(cache.run("RE1", compute) for _ in range(5)))
+        assert first == ["<Response>1</Response>"] * 5
+        assert await cache.run("RE1", compute) == "<Response>1</Response>"
+        clock.now += 61
+        assert await cache.run("RE1", compute) == "<Response>2</Response>"
+
+    asyncio.run(run())
+    assert len(runs) == 2
+    assert cache.stats() == {"entries": 1, "inflight": 0, "hits": 1, "joined": 4, "misses": 2}
+
+def test_failures_are_not_stored_and_size_is_bounded():
+    """Test that a failed run is retried and old responses are dropped past max_entries."""
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=3)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("LLM timed out")
+        return "ok"
+
+    async def run():
+        try:
+            await cache.run("RE-flaky", flaky)
+            raise AssertionError("expected the first run to fail")
+        except RuntimeError:
+            pass
+        assert await cache.run("RE-flaky", flaky) == "ok"
+        for i in range(5):
+            await cache.run(f"RE{i}", lambda i=i: asyncio.sleep(0, result=str(i)))
+
+    asyncio.run(run())
+    assert len(attempts) == 2
+    assert cache.stats()["entries"] == 3
+    assert cache.get("RE-flaky") is None and cache.get("RE4") == "4"
+
+def test_voice_webhook_retry_runs_pipeline_once(monkeypatch):
+    """Test that a Twilio retry of /voice while the first request is running does not run the pipeline again."""
+    calls = []
+
+    async def slow_pipeline(form_data, call_sid, recording_url):
+        calls.append(form_data.get("RecordingSid"))
+        await asyncio.sleep(0.2)
+        return "<Response><Play>reply</Play></Response>"
+
+    monkeypatch.setattr(twilio_router, "_answer_recording", slow_pipeline)
+    monkeypatch.setattr(twilio_router, "webhook_cache", IdempotencyCache())
+    app = FastAPI()
+    app.include_router(twilio_router.router)
+    form = {"CallSid": "CA" + "1" * 32, "RecordingSid": "RE" + "1" * 32, "RecordingUrl": "https://api.twilio.com/rec"}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = asyncio.create_task(client.post("/twilio/voice", data=form))
+            await asyncio.sleep(0.05)
+            retry = await client.post("/twilio/voice", data=form)
+            return await first, retry, await client.post("/twilio/voice", data=form)
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert len({r.text for r in responses}) == 1
+    assert calls == ["RE" + "1" * 32]
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
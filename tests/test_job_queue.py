@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import tempfile
+import logging
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.job_queue import InProcessJobRunner, JobQueue, JobWorkerPool, start_job_execution
+from server.stage_executor import StageExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HANDLERS = {
+    "record": "tests.test_job_queue:record_job",
+    "flaky": "tests.test_job_queue:flaky_job",
+}
+
+def record_job(payload):
+    """Append the job's message and worker pid to a file."""
+    with open(payload["path"], "a") as f:
+        f.write(f"{payload['message']} {os.getpid()}\n")
+
+def flaky_job(payload):
+    """Fail until the given number of attempts has been made."""
+    with open(payload["path"], "a") as f:
+        f.write("attempt\n")
+    with open(payload["path"]) as f:
+        if len(f.readlines()) < payload["succeed_on"]:
+            raise RuntimeError("transient failure")
+
+def test_enqueue_is_deduplicated():
+    """Test that a retried webhook does not queue the same job twice."""
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = JobQueue(os.path.join(tmp, "jobs.db"), HANDLERS)
+        out = os.path.join(tmp, "out.txt")
+        first = jobs.enqueue("record", {"path": out, "message": "a"}, dedupe_key="call:CA1")
+        second = jobs.enqueue("record", {"path": out, "message": "a"}, dedupe_key="call:CA1")
+        assert first == second
+        assert jobs.stats()["queued"] == 1
+        assert jobs.run_next("test")
+        assert not jobs.run_next("test")
+        assert jobs.stats()["done"] == 1
+
+def test_failed_jobs_retry_with_backoff():
+    """Test that failures are retried after a backoff and marked failed after max_attempts."""
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = JobQueue(os.path.join(tmp, "jobs.db"), HANDLERS, retry_seconds=0.05)
+        jobs.enqueue("flaky", {"path": os.path.join(tmp, "a.txt"), "succeed_on": 2}, max_attempts=3)
+        jobs.enqueue("flaky", {"path": os.path.join(tmp, "b.txt"), "succeed_on": 10}, max_attempts=2)
+        assert jobs.run_next("test") and jobs.run_next("test")
+        # Both are backing off now
+        assert not jobs.run_next("test")
+        time.sleep(0.2)
+        assert jobs.run_next("test") and jobs.run_next("test")
+        stats = jobs.stats()
+        assert stats["done"] == 1
+        assert stats["failed"] == 1
+        assert stats["recent_failures"][0]["attempts"] == 2
+        assert "transient failure" in stats["recent_failures"][0]["error"]
+
+def test_expired_lease_is_reclaimed():
+    """Test that a job held by a dead worker is claimed again once its lease expires."""
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = JobQueue(os.path.join(tmp, "jobs.db"), HANDLERS, lease_seconds=0.05)
+        jobs.enqueue("record", {"path": os.path.join(tmp, "out.txt"), "message": "a"})
+        assert jobs.claim("dead-worker") is not None
+        assert jobs.claim("other-worker") is None
+        time.sleep(0.1)
+        job = jobs.claim("other-worker")
+        assert job is not None and job["attempts"] == 2
+
+def test_worker_processes_run_jobs_at_lower_priority():
+    """Test that pool workers are separate, niced processes that drain the queue."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        out = os.path.join(tmp, "out.txt")
+        jobs = JobQueue(path, HANDLERS)
+        for i in range(4):
+            jobs.enqueue("record", {"path": out, "message": f"job{i}"})
+        pool = JobWorkerPool(path, processes=2, niceness=5, handlers=HANDLERS, llm_backend="server")
+        assert pool.start()
+        try:
+            deadline = time.monotonic() + 60
+            while jobs.stats()["done"] < 4 and time.monotonic() < deadline:
+                time.sleep(0.1)
+            assert pool.alive() == 2
+            niceness = [os.getpriority(os.PRIO_PROCESS, worker.pid) for worker in pool._workers]
+        finally:
+            pool.stop()
+        assert jobs.stats()["done"] == 4
+        with open(out) as f:
+            lines = f.read().split()
+        assert sorted(lines[0::2]) == [f"job{i}" for i in range(4)]
+        assert str(os.getpid()) not in lines[1::2]
+        assert all(value >= os.getpriority(os.PRIO_PROCESS, 0) + 5 or value == 19 for value in niceness)
+
+def test_local_backend_runs_jobs_in_process_when_llm_stage_is_idle():
+    """Test that no worker processes start with a local model and jobs wait for live llm work to finish."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        out = os.path.join(tmp, "out.txt")
+        pool = JobWorkerPool(path, processes=2, handlers=HANDLERS, llm_backend="local")
+        assert not pool.start() and pool.alive() == 0
+
+        jobs = JobQueue(path, HANDLERS)
+        executor = StageExecutor({"llm": 1})
+        runner = InProcessJobRunner(jobs, poll_seconds=0.02, executor=executor)
+        release = threading.Event()
+
+        async def run():
+            live_turn = asyncio.ensure_future(executor.run("llm", release.wait, 10))
+            runner.start()
+            jobs.enqueue("record", {"path": out, "message": "summary"})
+            await asyncio.sleep(0.3)
+            waited = jobs.stats()["done"] == 0
+            release.set()
+            await live_turn
+            deadline = time.monotonic() + 10
+            while jobs.stats()["done"] < 1 and time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+            alive = runner.alive()
+            await runner.stop()
+            return waited, alive
+
+        try:
+            waited, alive = asyncio.run(run())
+        finally:
+            executor.shutdown()
+        assert waited and alive == 1 and runner.alive() == 0
+        assert jobs.stats()["done"] == 1
+        with open(out) as f:
+            assert f.read().split() == ["summary", str(os.getpid())]
+
+class RecordingRunner:
+    def __init__(self):
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+def test_local_backend_runs_jobs_in_process_even_without_workers():
+    """Test that the API always runs jobs itself with a local model, and only leaves them to the CLI with the server backend."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        for processes in (0, 2):
+            runner = RecordingRunner()
+            pool = JobWorkerPool(path, processes=processes, handlers=HANDLERS, llm_backend="local")
+            assert start_job_execution(pool, runner) == "in-process"
+            assert runner.started and pool.alive() == 0
+        runner = RecordingRunner()
+        pool = JobWorkerPool(path, processes=0, handlers=HANDLERS, llm_backend="server")
+        assert start_job_execution(pool, runner) == "external"
+        assert not runner.started
+
+if __name__ == "__main__":
+    test_enqueue_is_deduplicated()
+    test_failed_jobs_retry_with_backoff()
+    test_expired_lease_is_reclaimed()
+    test_worker_processes_run_jobs_at_lower_priority()
+    test_local_backend_runs_jobs_in_process_when_llm_stage_is_idle()
+    test_local_backend_runs_jobs_in_process_even_without_workers()
+    print("All tests passed!")
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+import threading
+
+import httpx
+import numpy as np
+import pytest
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.llama_client import LlamaServerClient
+from server.llm_batcher import DEFAULT_REPEAT_PENALTY, DEFAULT_TOP_K, DEFAULT_TOP_P, PRIORITY_BACKGROUND, ContinuousBatcher, LlamaBatchEngine, sample_token
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A small GGUF file (any model) to run LlamaBatchEngine against the installed llama-cpp-python
+TEST_GGUF = os.getenv("CLINICGUARD_TEST_GGUF", "")
+
+class ScriptedEngine:
+    """Character-level stand-in for llama.cpp that replies 'Echo <prompt>.' to prompts ending in '|'."""
+
+    n_vocab = 256
+    eos_token = 0
+
+    def __init__(self, n_ctx=512, n_batch=16, step_delay=0.0):
+        self.n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.step_delay = step_delay
+        self.kv = {}
+        self.batches = []
+        self.admitted = []
+        self.lock = threading.Lock()
+
+    def tokenize(self, text):
+        return [ord(c) for c in text]
+
+    def token_bytes(self, token):
+        return bytes([token])
+
+    def decode(self, entries):
+        self.batches.append([(seq_id, len(tokens)) for seq_id, tokens, _, _ in entries])
+        rows = []
+        for seq_id, tokens, pos, want_logits in entries:
+            cache = self.kv.setdefault(seq_id, [])
+            if pos == 0:
+                self.admitted.append("".join(chr(t) for t in tokens))
+            assert pos == len(cache), "tokens must continue the sequence's KV cache"
+            cache.extend(tokens)
+            if want_logits:
+                text = "".join(chr(t) for t in cache)
+                prompt, _, generated = text.partition("|")
+                reply = f"Echo {prompt}.\nUser:"
+                logits = np.zeros(self.n_vocab)
+                logits[ord(reply[len(generated)]) if len(generated) < len(reply) else self.eos_token] = 100.0
+                rows.append(logits)
+        if self.step_delay:
+            threading.Event().wait(self.step_delay)
+        return rows
+
+    def release(self, seq_id):
+        self.kv.pop(seq_id, None)
+
+def test_stop_sequence_is_not_streamed():
+    """Test that generation ends at a stop string without emitting it."""
+    batcher = ContinuousBatcher(ScriptedEngine(), max_sequences=2, seed=0)
+    try:
+        request = batcher.submit("hi|", max_tokens=50, temperature=0, stop=["\n", "User:"])
+        assert "".join(request) == "Echo hi."
+        assert request.finish_reason == "stop"
+    finally:
+        batcher.close()
+
+def test_concurrent_requests_share_decode_steps():
+    """Test that sequences are decoded in the same batches and long prompts are prefilled in chunks."""
+    engine = ScriptedEngine(n_batch=8, step_delay=0.002)
+    batcher = ContinuousBatcher(engine, max_sequences=4, seed=0)
+    prompts = [f"caller number {i} says hello|" for i in range(6)]
+    try:
+        requests = [batcher.submit(p, max_tokens=80, temperature=0, stop=["\n"]) for p in prompts]
+        replies = ["".join(r) for r in requests]
+    finally:
+        batcher.close()
+
+    assert replies == [f"Echo {p[:-1]}." for p in prompts]
+    assert max(len(batch) for batch in engine.batches) > 1
+    assert all(sum(n for _, n in batch) <= engine.n_batch for batch in engine.batches)
+    assert batcher.stats()["completed"] == len(prompts)
+
+def test_length_limit_and_async_streaming():
+    """Test max_tokens, token-by-token async delivery and rejection of prompts larger than the context."""
+    batcher = ContinuousBatcher(ScriptedEngine(n_ctx=64), max_sequences=2, seed=0)
+
+    async def collect():
+        request = batcher.submit("abc|", max_tokens=4, temperature=0, loop=asyncio.get_running_loop())
+        return [piece async for piece in request], request
+
+    try:
+        pieces, request = asyncio.run(collect())
+        assert "".join(pieces) == "Echo"
+        assert len(pieces) == 4
+        assert request.finish_reason == "length"
+        try:
+            batcher.submit("x" * 60 + "|", max_tokens=10, temperature=0)
+            assert False, "prompt larger than the context was accepted"
+        except ValueError:
+            pass
+    finally:
+        batcher.close()
+
+def test_cancelled_request_frees_its_slot():
+    """Test that cancelling a request releases its sequence for the next one."""
+    engine = ScriptedEngine(step_delay=0.002)
+    batcher = ContinuousBatcher(engine, max_sequences=1, seed=0)
+    try:
+        first = batcher.submit("first|", max_tokens=200, temperature=0.0)
+        first.cancel()
+        second = batcher.submit("second|", max_tokens=50, temperature=0, stop=["\n"])
+        assert "".join(second) == "Echo second."
+        list(first)
+        assert first.finish_reason == "cancelled"
+    finally:
+        batcher.close()
+
+def test_live_requests_are_admitted_before_background():
+    """Test that a queued live request takes the next free slot ahead of an earlier background one."""
+    engine = ScriptedEngine(step_delay=0.002)
+    batcher = ContinuousBatcher(engine, max_sequences=1, seed=0)
+    try:
+        requests = [
+            batcher.submit("a|", max_tokens=50, temperature=0, stop=["\n"]),
+            batcher.submit("b|", max_tokens=50, temperature=0, stop=["\n"], priority=PRIORITY_BACKGROUND),
+            batcher.submit("c|", max_tokens=50, temperature=0, stop=["\n"]),
+        ]
+        replies = ["".join(r) for r in requests]
+    finally:
+        batcher.close()
+
+    assert replies == ["Echo a.", "Echo b.", "Echo c."]
+    # 'a' may already be running when the others arrive; either way 'c' goes before 'b'
+    assert engine.admitted.index("c|") < engine.admitted.index("b|")
+
+def test_request_waiting_for_kv_space_does_not_block_live_requests():
+    """Test that a background request too large for the free KV cache lets a later live request go first."""
+    engine = ScriptedEngine(n_ctx=200, step_delay=0.01)
+    batcher = ContinuousBatcher(engine, max_sequences=3, seed=0)
+    try:
+        running = batcher.submit("a|", max_tokens=150, temperature=0)
+        while not engine.admitted:
+            threading.Event().wait(0.005)
+        # 102 tokens do not fit next to the 152 reserved by 'a'; 42 do
+        background = batcher.submit("b|", max_tokens=100, temperature=0, stop=["\n"], priority=PRIORITY_BACKGROUND)
+        threading.Event().wait(0.05)
+        live = batcher.submit("c|", max_tokens=40, temperature=0, stop=["\n"])
+        replies = ["".join(r) for r in (running, background, live)]
+    finally:
+        batcher.close()
+
+    assert replies == ["Echo a.\nUser:", "Echo b.", "Echo c."]
+    assert engine.admitted == ["a|", "c|", "b|"]
+
+def test_sampler_applies_repeat_penalty_top_k_and_top_p():
+    """Test that sampling follows the local backend's chain: repeat penalty, then top-k and top-p."""
+    rng = np.random.default_rng(0)
+    logits = np.array([2.0, 1.9, 1.0, 0.5, -1.0])
+    # A recently seen token loses a close race under greedy decoding
+    assert sample_token(logits, 0, rng) == 0
+    assert sample_token(logits, 0, rng, recent_tokens=[0, 0]) == 1
+    # top_k=2 never leaves the two best tokens, even at a high temperature
+    assert {sample_token(logits, 5.0, rng, top_k=2, top_p=1.0, repeat_penalty=1.0) for _ in range(200)} == {0, 1}
+    # A dominant token alone covers top_p
+    peaked = np.array([10.0, 0.0, 0.0, 0.0])
+    assert {sample_token(peaked, 1.0, rng, top_p=0.95) for _ in range(50)} == {0}
+
+def test_client_sends_sampler_settings():
+    """Test that /generate receives the same top_k, top_p and repeat_penalty the local backend uses."""
+    payloads = []
+
+    def handler(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={"response": "Hello.", "tokens": 2})
+
+    client = LlamaServerClient(base_url="http://llama", transport=httpx.MockTransport(handler))
+    try:
+        assert client.complete("hi", 10, 0.7, ["\n"]) == "Hello."
+    finally:
+        client.close()
+    assert payloads[0]["top_k"] == DEFAULT_TOP_K == 40
+    assert payloads[0]["top_p"] == DEFAULT_TOP_P == 0.95
+    assert payloads[0]["repeat_penalty"] == DEFAULT_REPEAT_PENALTY == 1.1
+
+@pytest.mark.skipif(not os.path.isfile(TEST_GGUF), reason="set CLINICGUARD_TEST_GGUF to a GGUF file to run")
+def test_llama_batch_engine_smoke():
+    """Test the real llama.cpp bindings: concurrent sequences decode and released slots leave no KV state behind."""
+    engine = LlamaBatchEngine(TEST_GGUF, n_ctx=512, n_batch=64, max_sequences=2)
+    batcher = ContinuousBatcher(engine, max_sequences=2, seed=0)
+    prompt = "The capital of France is"
+    try:
+        alone = "".join(batcher.submit(prompt, max_tokens=8, temperature=0))
+        together = [batcher.submit(prompt, max_tokens=8, temperature=0) for _ in range(2)]
+        replies = ["".join(r) for r in together]
+        # Released sequences leave nothing behind in the KV cache for the next request
+        again = "".join(batcher.submit(prompt, max_tokens=8, temperature=0))
+    finally:
+        batcher.close()
+        engine.close()
+
+    # Batched float math may differ from a lone run, so only the two lone runs must match exactly
+    assert alone and all(replies) and again == alone
+    assert all(r.finish_reason in ("stop", "length") for r in together)
+
+if __name__ == "__main__":
+    test_stop_sequence_is_not_streamed()
+    test_concurrent_requests_share_decode_steps()
+    test_length_limit_and_async_streaming()
+    test_cancelled_request_frees_its_slot()
+    test_live_requests_are_admitted_before_background()
+    test_request_waiting_for_kv_space_does_not_block_live_requests()
+    test_sampler_applies_repeat_penalty_top_k_and_top_p()
+    test_client_sends_sampler_settings()
+    if os.path.isfile(TEST_GGUF):
+        test_llama_batch_engine_smoke()
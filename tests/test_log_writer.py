@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import tempfile
+import logging
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.db import Base, Call, ConversationLog
+from server.log_writer import ConversationLogWriter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def temp_session_factory(directory):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'logs.db')}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(Call(call_sid="CA-log"))
+    db.commit()
+    db.close()
+    return factory
+
+def read_logs(factory):
+    db = factory()
+    try:
+        rows = db.query(ConversationLog).order_by(ConversationLog.timestamp, ConversationLog.id).all()
+        return [(row.role, row.content) for row in rows]
+    finally:
+        db.close()
+
+def test_rows_are_written_in_batches_in_order():
+    """Test that rows are bulk inserted on the size trigger and keep their order."""
+    with tempfile.TemporaryDirectory() as tmp:
+        factory = temp_session_factory(tmp)
+        writer = ConversationLogWriter(factory, max_batch=10, flush_ms=10_000)
+        expected = [("User" if i % 2 == 0 else "Assistant", f"message {i}") for i in range(25)]
+        for role, content in expected:
+            writer.append(1, role, content)
+        assert writer.flush(5)
+        assert read_logs(factory) == expected
+        # Two full batches on the size trigger, the rest on the explicit flush
+        assert writer.batches == 3
+        writer.close()
+
+def test_time_trigger_and_close_flush_pending_rows():
+    """Test that a lone row is committed after the flush interval and close() commits the rest."""
+    with tempfile.TemporaryDirectory() as tmp:
+        factory = temp_session_factory(tmp)
+        writer = ConversationLogWriter(factory, max_batch=100, flush_ms=50)
+        writer.append(1, "User", "first")
+        deadline = time.monotonic() + 5
+        while not read_logs(factory) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert read_logs(factory) == [("User", "first")]
+
+        writer.append(1, "Assistant", "second")
+        writer.close(5)
+        assert read_logs(factory) == [("User", "first"), ("Assistant", "second")]
+
+if __name__ == "__main__":
+    test_rows_are_written_in_batches_in_order()
+    test_time_trigger_and_close_flush_pending_rows()
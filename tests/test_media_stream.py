@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import logging
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.audio_codec import TWILIO_SAMPLE_RATE, WHISPER_SAMPLE_RATE, AudioTooLargeError, StreamingAudioDecoder, decode_audio, mulaw_decode, mulaw_encode, read_wav, write_wav
+from server.media_stream import EnergyVAD, MEDIA_FRAME_BYTES, media_messages
+import server.twilio_router as twilio_router
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+rng = np.random.default_rng(0)
+
+def noise(seconds: float) -> np.ndarray:
+    return rng.normal(0, 0.002, int(TWILIO_SAMPLE_RATE * seconds)).astype(np.float32)
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(TWILIO_SAMPLE_RATE * seconds)) / TWILIO_SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 300 * t)).astype(np.float32) + noise(seconds)
+
+def test_mulaw_round_trip():
+    """Test that mu-law encoding keeps the signal within companding error."""
+    audio = tone(0.5)
+    decoded = mulaw_decode(mulaw_encode(audio))
+    assert decoded.shape == audio.shape
+    assert np.max(np.abs(decoded - audio)) < 0.02
+
+def test_wav_round_trip():
+    """Test in-memory WAV writing and parsing."""
+    audio = tone(0.25)
+    decoded, sample_rate = read_wav(write_wav(audio, TWILIO_SAMPLE_RATE))
+    assert sample_rate == TWILIO_SAMPLE_RATE
+    assert np.max(np.abs(decoded - audio)) < 1e-3
+
+def test_decode_audio_to_whisper_input():
+    """Test that WAV bytes, raw mu-law and NumPy buffers all become 16 kHz float32 in memory."""
+    audio = tone(0.5)
+    from_wav = decode_audio(write_wav(audio, TWILIO_SAMPLE_RATE))
+    from_mulaw = decode_audio(mulaw_encode(audio), sample_rate=TWILIO_SAMPLE_RATE, encoding="mulaw")
+    from_array = decode_audio(audio, sample_rate=TWILIO_SAMPLE_RATE)
+    for decoded in (from_wav, from_mulaw, from_array):
+        assert decoded.dtype == np.float32
+        assert decoded.size == audio.size * WHISPER_SAMPLE_RATE // TWILIO_SAMPLE_RATE
+
+def test_streaming_decoder_matches_decode_audio():
+    """Test that decoding a WAV in odd-sized chunks gives the same samples as decoding it whole."""
+    audio = tone(1.0)
+    for sample_rate in (TWILIO_SAMPLE_RATE, 22050):
+        wav = write_wav(audio, sample_rate)
+        expected = decode_audio(wav)
+        for chunk_size in (1, 37, 4096):
+            decoder = StreamingAudioDecoder(len(wav))
+            for start in range(0, len(wav), chunk_size):
+                decoder.feed(wav[start:start + chunk_size])
+            decoded = decoder.finish()
+            assert decoded.shape == expected.shape
+            assert np.max(np.abs(decoded - expected)) < 1e-5
+
+def test_streaming_decoder_enforces_size_cap():
+    """Test that input past the cap is refused while it is still arriving."""
+    wav = write_wav(tone(1.0), TWILIO_SAMPLE_RATE)
+    decoder = StreamingAudioDecoder(len(wav) // 2)
+    try:
+        for start in range(0, len(wav), 1024):
+            decoder.feed(wav[start:start + 1024])
+        raise AssertionError("expected AudioTooLargeError")
+    except AudioTooLargeError:
+        assert decoder.bytes_read <= len(wav) // 2 + 1024
+
+def test_vad_finds_end_of_utterance():
+    """Test that the VAD emits one utterance per spoken segment and ignores short clicks."""
+    signal = np.concatenate([noise(1.0), tone(1.2), noise(1.5), tone(0.1), noise(1.0), tone(0.8)])
+    frames = mulaw_decode(mulaw_encode(signal))
+    vad = EnergyVAD()
+    utterances = []
+    for offset in range(0, frames.size, MEDIA_FRAME_BYTES):
+        utterances.extend(vad.feed(frames[offset:offset + MEDIA_FRAME_BYTES]))
+
+    assert len(utterances) == 1
+    assert 1.2 <= utterances[0].size / TWILIO_SAMPLE_RATE <= 1.6
+    # The last segment is still open until the stream stops
+    assert vad.triggered
+    assert vad.flush() is not None
+
+def test_media_messages_use_20ms_frames():
+    """Test that reply audio is split into Twilio-sized media frames."""
+    payload = bytes(range(256)) * 2
+    messages = list(media_messages("MZ123", payload))
+    assert len(messages) == 4
+    assert all(m["event"] == "media" and m["streamSid"] == "MZ123" for m in messages)
+    assert b"".join(base64.b64decode(m["media"]["payload"]) for m in messages) == payload
+
+def test_stream_stop_answers_and_remembers_the_last_utterance(monkeypatch):
+    """Test that a hangup mid-utterance still runs that turn to the end instead of dropping it."""
+    remembered = []
+
+    async def reply_audio(prompt, session_id=None, phone_number=None):
+        yield "Goodbye.", b"audio"
+        await asyncio.sleep(0.2)
+        yield "Take care.", b"audio"
+        remembered.append((session_id, prompt))
+
+    monkeypatch.setattr(twilio_router, "transcribe_audio", lambda audio, sample_rate: "Cancel my visit")
+    monkeypatch.setattr(twilio_router, "astream_reply_audio", reply_audio)
+    monkeypatch.setattr(twilio_router, "_encode_reply_payload", lambda audio: audio)
+    app = FastAPI()
+    app.include_router(twilio_router.router)
+    call_sid = "CA" + "0" * 32
+    payload = mulaw_encode(np.concatenate([noise(0.5), tone(1.0)]))
+    with TestClient(app) as client:
+        with client.websocket_connect("/twilio/stream") as websocket:
+            websocket.send_text(json.dumps({"event": "start", "start": {"streamSid": "MZ123", "callSid": call_sid}}))
+            for offset in range(0, len(payload), MEDIA_FRAME_BYTES):
+                frame = base64.b64encode(payload[offset:offset + MEDIA_FRAME_BYTES]).decode()
+                websocket.send_text(json.dumps({"event": "media", "media": {"payload": frame}}))
+            # The caller hangs up while still talking
+            websocket.send_text(json.dumps({"event": "stop"}))
+            deadline = time.monotonic() + 5
+            while not remembered and time.monotonic() < deadline:
+                time.sleep(0.05)
+    assert remembered == [(call_sid, "Cancel my visit")]
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
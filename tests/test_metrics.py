@@ -0,0 +1,79 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import logging
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.metrics import MetricFamily, MetricsRegistry, stage_queue_seconds, stage_run_seconds
+from server.stage_executor import StageExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+def test_histogram_renders_buckets_and_recent_percentiles():
+    """Test that a histogram exposes cumulative buckets, sum, count and p50/p95/p99 in Prometheus format."""
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_latency_seconds", "Test latency", ["stage"], buckets=(0.1, 1.0))
+    for value in [0.05] * 90 + [0.5] * 9 + [5.0]:
+        latency.observe(value, stage="stt")
+    registry.register_collector(lambda: [MetricFamily("test_depth", "gauge", "Test depth", [("", {"stage": 'a"b'}, 3)])])
+
+    text = registry.render()
+    assert "# TYPE test_latency_seconds histogram" in text
+    samples = parse_samples(text)
+    assert samples['test_latency_seconds_bucket{stage="stt",le="0.1"}'] == 90
+    assert samples['test_latency_seconds_bucket{stage="stt",le="1"}'] == 99
+    assert samples['test_latency_seconds_bucket{stage="stt",le="+Inf"}'] == 100
+    assert samples['test_latency_seconds_count{stage="stt"}'] == 100
+    assert abs(samples['test_latency_seconds_sum{stage="stt"}'] - 14.0) < 1e-9
+    assert samples['test_latency_seconds_recent{stage="stt",quantile="0.5"}'] == 0.05
+    assert samples['test_latency_seconds_recent{stage="stt",quantile="0.95"}'] == 0.5
+    assert samples['test_latency_seconds_recent{stage="stt",quantile="0.99"}'] == 0.5
+    assert samples['test_depth{stage="a\\"b"}'] == 3
+
+def test_broken_collector_does_not_break_scrape():
+    """Test that a failing collector is skipped and the rest is still rendered."""
+    registry = MetricsRegistry()
+    registry.counter("test_total", "Test counter").inc(2)
+
+    def broken():
+        raise RuntimeError("database is locked")
+
+    registry.register_collector(broken)
+    assert parse_samples(registry.render()) == {"test_total": 2}
+
+def test_stage_executor_records_queue_and_run_time():
+    """Test that jobs waiting behind a busy stage worker show up as queue time."""
+    executor = StageExecutor({"metrics_test": 1})
+    before = stage_run_seconds.percentiles(stage="metrics_test")
+
+    async def run():
+        await asyncio.gather(*(executor.run("metrics_test", time.sleep, 0.05) for _ in range(3)))
+
+    try:
+        asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert math.isnan(before[0.5])
+    assert stage_run_seconds.percentiles(stage="metrics_test")[0.5] >= 0.05
+    # The third job waited for both others on the single worker
+    assert stage_queue_seconds.percentiles(stage="metrics_test")[0.99] >= 0.09
+
+if __name__ == "__main__":
+    test_histogram_renders_buckets_and_recent_percentiles()
+    test_broken_collector_does_not_break_scrape()
+    test_stage_executor_records_queue_and_run_time()
+    print("All tests passed!")
@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import asyncio
+import logging
+import tempfile
+
+import httpx
+import numpy as np
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.main as main
+import server.twilio_router as twilio_router
+from server.audio_codec import TWILIO_SAMPLE_RATE, read_wav, write_wav
+from server.idempotency import IdempotencyCache
+from server.reply_audio import ReplyAudioStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def sentence_wav(seconds: float, frequency: float = 220.0) -> bytes:
+    """A synthesized sentence as the TTS engine returns it: 22.05 kHz WAV."""
+    t = np.arange(int(22050 * seconds)) / 22050
+    return write_wav((0.3 * np.sin(2 * np.pi * frequency * t)).astype(np.float32), 22050)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_readers_get_each_sentence_as_it_is_written():
+    """Test that a reader receives the first sentence before the second exists and stops when the reply finishes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReplyAudioStore(directory=tmp)
+
+        async def run():
+            reply = store.create()
+            received = []
+
+            async def read():
+                async for chunk in reply.iter_bytes():
+                    received.append(chunk)
+
+            reader = asyncio.create_task(read())
+            await reply.write_sentence(sentence_wav(0.5))
+            await asyncio.sleep(0.05)
+            first = sum(map(len, received))
+            await reply.write_sentence(sentence_wav(0.25, 330.0))
+            await reply.finish()
+            await asyncio.wait_for(reader, 5)
+            return first, b"".join(received)
+
+        first, streamed = asyncio.run(run())
+        # 16-bit PCM at 8 kHz after the 44-byte header
+        assert first == 44 + int(0.5 * TWILIO_SAMPLE_RATE) * 2
+        assert len(streamed) == 44 + int(0.75 * TWILIO_SAMPLE_RATE) * 2
+
+def test_audio_route_serves_replies(monkeypatch):
+    """Test that /audio/{id} streams a reply in progress to its end and serves finished ones with a length."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReplyAudioStore(directory=tmp)
+        monkeypatch.setattr(main, "reply_audio", store)
+
+        async def run():
+            reply = store.create(owner="CA-stream")
+            await reply.write_sentence(sentence_wav(0.5))
+
+            async def finish_later():
+                await asyncio.sleep(0.1)
+                await reply.write_sentence(sentence_wav(0.25, 330.0))
+                await reply.finish()
+
+            writer = asyncio.create_task(finish_later())
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                streaming = await client.get(f"/audio/{reply.id}")
+                await writer
+                finished = await client.get(f"/audio/{reply.id}")
+                missing = await client.get("/audio/unknown")
+            return streaming, finished, missing
+
+        streaming, finished, missing = asyncio.run(run())
+        assert streaming.status_code == 200 and streaming.headers["content-type"] == "audio/wav"
+        assert "content-length" not in streaming.headers
+        assert len(streaming.content) == 44 + int(0.75 * TWILIO_SAMPLE_RATE) * 2
+        assert finished.headers["content-length"] == str(len(streaming.content))
+        audio, sample_rate = read_wav(finished.content)
+        assert sample_rate == TWILIO_SAMPLE_RATE and audio.size == int(0.75 * TWILIO_SAMPLE_RATE)
+        assert missing.status_code == 404
+
+def test_record_webhook_answers_after_the_first_sentence(monkeypatch):
+    """Test that /twilio/voice returns one <Play> as soon as the first sentence is synthesized."""
+    async def recording(recording_url):
+        return np.zeros(16000, dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReplyAudioStore(directory=tmp)
+        monkeypatch.setattr(main, "reply_audio", store)
+        monkeypatch.setattr(twilio_router, "reply_audio", store)
+        monkeypatch.setattr(twilio_router, "webhook_cache", IdempotencyCache())
+        monkeypatch.setattr(twilio_router, "download_recording", recording)
+        monkeypatch.setattr(twilio_router, "transcribe_audio", lambda audio: "I'd like to book an appointment")
+
+        async def run():
+            second_sentence = asyncio.Event()
+
+            async def reply_audio(prompt, session_id=None, phone_number=None):
+                yield "Sure.", sentence_wav(0.3)
+                await second_sentence.wait()
+                yield "What day suits you?", sentence_wav(0.5)
+
+            monkeypatch.setattr(twilio_router, "astream_reply_audio", reply_audio)
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                response = await client.post("/twilio/voice", data={"CallSid": "CA" + "3" * 32, "RecordingSid": "RE" + "3" * 32,
+                                                                    "RecordingUrl": "https://api.twilio.com/rec"})
+                reply = next(iter(store._replies.values()))
+                answered_while_streaming = not reply.done
+                second_sentence.set()
+                audio = await client.get(re.search(r"/audio/[^<]+", response.text).group(0))
+                await client.post("/twilio/voice/end", data={"CallSid": "CA" + "3" * 32})
+            return response, answered_while_streaming, audio
+
+        response, answered_while_streaming, audio = asyncio.run(run())
+        assert response.status_code == 200 and response.text.count("<Play>") == 1
+        assert answered_while_streaming
+        assert read_wav(audio.content)[0].size == int(0.8 * TWILIO_SAMPLE_RATE)
+        assert store.stats()["replies"] == 0
+
+def test_large_replies_spill_to_disk_and_are_dropped_with_their_call():
+    """Test that replies past the spill size or the memory budget move to disk and call end removes them."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReplyAudioStore(directory=tmp, max_memory_bytes=15_000, spill_bytes=12_000)
+
+        async def run():
+            large = store.create(owner="CA-1")
+            await large.write_sentence(sentence_wav(1.0))
+            older = store.create(owner="CA-1")
+            await older.write_sentence(sentence_wav(0.6))
+            newer = store.create(owner="CA-2")
+            await newer.write_sentence(sentence_wav(0.6))
+            for reply in (large, older, newer):
+                await reply.finish()
+            large_bytes = b"".join([chunk async for chunk in large.iter_bytes()])
+            return large, older, newer, large_bytes
+
+        large, older, newer, large_bytes = asyncio.run(run())
+        assert large.spilled and len(large_bytes) == large.size == 44 + TWILIO_SAMPLE_RATE * 2
+        assert read_wav(large_bytes)[0].size == TWILIO_SAMPLE_RATE
+        # The two 9.6 KB replies do not both fit in 15 KB, so the older one spilled
+        assert older.spilled and not newer.spilled
+        assert store.stats()["memory_bytes"] == newer.size
+        assert len(os.listdir(tmp)) == 2
+        assert store.discard_owner("CA-1") == 2
+        assert os.listdir(tmp) == [] and store.get(large.id) is None
+        assert store.get(newer.id) is newer
+
+def test_replies_expire_after_ttl():
+    """Test that replies are dropped, and their memory released, after the TTL."""
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReplyAudioStore(directory=tmp, ttl_seconds=60, clock=clock)
+
+        async def run():
+            reply = store.create()
+            await reply.write_sentence(sentence_wav(0.2))
+            await reply.finish()
+            return reply
+
+        reply = asyncio.run(run())
+        clock.now = 59
+        assert store.get(reply.id) is reply
+        clock.now = 61
+        assert store.get(reply.id) is None
+        stats = store.stats()
+        assert stats["replies"] == 0 and stats["memory_bytes"] == 0 and stats["expired"] == 1
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import logging
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.agent_services as agent_services
+from server.db import Base
+from server.log_writer import ConversationLogWriter
+from server.session_store import SessionStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def use_temp_database(monkeypatch, directory):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'locking.db')}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(agent_services, "SessionLocal", factory)
+    monkeypatch.setattr(agent_services, "ensure_db_initialized", lambda: None)
+    return factory
+
+def test_add_message_loads_and_records_session(monkeypatch):
+    """Test that add_message on a new call loads the session without deadlocking and persists the turn."""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ConversationLogWriter(use_temp_database(monkeypatch, tmp))
+        memory = agent_services.PersistentSessionMemory(writer)
+        memory.add_message("CA-new", "User", "Hello", phone_number="+15555550100")
+        memory.add_message("CA-new", "Assistant", "Hi, how can I help?", phone_number="+15555550100")
+        memory.flush()
+
+        reloaded = agent_services.PersistentSessionMemory(writer)
+        assert reloaded.get_session("CA-new") == [("User", "Hello"), ("Assistant", "Hi, how can I help?")]
+        writer.close()
+
+def test_summarizing_one_call_does_not_block_others(monkeypatch):
+    """Test that other calls keep writing while a call is being summarized."""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ConversationLogWriter(use_temp_database(monkeypatch, tmp))
+        memory = agent_services.PersistentSessionMemory(writer)
+        memory.add_message("CA-ending", "User", "Book me for Monday", phone_number="+15555550101")
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_summary(history):
+            started.set()
+            release.wait(5)
+            return "Prefers Mondays"
+
+        monkeypatch.setattr(agent_services, "summarize_conversation", slow_summary)
+        summarizer = threading.Thread(target=memory.summarize_and_save, args=("CA-ending",))
+        summarizer.start()
+        try:
+            assert started.wait(5)
+            began = time.perf_counter()
+            memory.add_message("CA-active", "User", "Is Tuesday free?", phone_number="+15555550102")
+            memory.get_session("CA-active")
+            assert time.perf_counter() - began < 1.0
+            assert summarizer.is_alive()
+        finally:
+            release.set()
+            summarizer.join()
+        assert agent_services.get_patient_summaries(1) == ["Prefers Mondays"]
+        writer.close()
+
+def test_evicted_session_reloads_queued_turns(monkeypatch):
+    """Test that a session evicted from the cache comes back with every turn, including unflushed ones."""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ConversationLogWriter(use_temp_database(monkeypatch, tmp), flush_ms=10_000)
+        # Room for about one session, so each new call evicts the previous one
+        memory = agent_services.PersistentSessionMemory(writer, SessionStore(max_bytes=600))
+        memory.add_message("CA-first", "User", "Hello", phone_number="+15555550103")
+        memory.add_message("CA-first", "Assistant", "Hi!", phone_number="+15555550103")
+        memory.add_message("CA-second", "User", "Hello", phone_number="+15555550104")
+        assert memory.stats()["evicted_lru"] >= 1
+        assert memory.get_session("CA-first") == [("User", "Hello"), ("Assistant", "Hi!")]
+        writer.close()
+
+def test_clearing_a_session_keeps_its_lock_while_held():
+    """Test that a session cleared while its lock is held still serializes later writers, and the lock is dropped after."""
+    memory = agent_services.PersistentSessionMemory(ConversationLogWriter(lambda: None))
+    held = threading.Event()
+    release = threading.Event()
+    entered = threading.Event()
+
+    def holder():
+        with memory._session_lock("CA-busy"):
+            held.set()
+            release.wait(5)
+
+    def writer():
+        with memory._session_lock("CA-busy"):
+            entered.set()
+
+    first = threading.Thread(target=holder)
+    first.start()
+    assert held.wait(5)
+    memory.clear_session("CA-busy")
+    second = threading.Thread(target=writer)
+    second.start()
+    # The second thread must wait for the same lock, not get a fresh one
+    assert not entered.wait(0.2)
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert entered.is_set()
+    assert memory._session_locks == {}
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,77 @@
+import os
+import sys
+import logging
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.session_store import SESSION_SWEEP_SECONDS, SessionStore, TurnHistory
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_turn_history_reads_like_tuples():
+    """Test that a TurnHistory behaves like the list of (role, content) tuples it replaces."""
+    turns = [("System", "prefers mornings"), ("User", "Hi"), ("Assistant", "Hello!")]
+    history = TurnHistory(turns)
+    history.append("".join(["Us", "er"]), "Book Monday")
+    turns.append(("User", "Book Monday"))
+
+    assert history == turns
+    assert list(history) == turns
+    assert history[1:] == turns[1:]
+    assert history[-1] == ("User", "Book Monday")
+    role, content = history[0]
+    assert (role, content) == ("System", "prefers mornings")
+    # Roles built at runtime (e.g. read from the database) share one interned string
+    assert history[-1][0] is history[1][0]
+
+def test_idle_sessions_expire():
+    """Test that sessions untouched for the TTL are swept and reported."""
+    clock = FakeClock()
+    evicted = []
+    store = SessionStore(ttl_seconds=60, max_bytes=10**9, on_evict=lambda sid, reason: evicted.append((sid, reason)), clock=clock)
+    store.append("dropped-call", "User", "Hello", create=True)
+    store.append("live-call", "User", "Hello", create=True)
+    for _ in range(4):
+        clock.now += SESSION_SWEEP_SECONDS
+        store.append("live-call", "User", "Still here")
+
+    assert "dropped-call" not in store
+    assert len(store.get("live-call")) == 5
+    assert evicted == [("dropped-call", "ttl")]
+    assert store.stats()["evicted_ttl"] == 1
+
+def test_size_cap_evicts_least_recently_used():
+    """Test that going over the byte budget evicts the least recently used sessions first."""
+    evicted = []
+    store = SessionStore(ttl_seconds=3600, max_bytes=4000, on_evict=lambda sid, reason: evicted.append((sid, reason)))
+    for i in range(4):
+        store.put(f"call-{i}", [("User", "x" * 300)])
+    # Touch call-0 so call-1 is the least recently used
+    store.get("call-0")
+    for i in range(4, 8):
+        store.put(f"call-{i}", [("User", "x" * 300)])
+
+    stats = store.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert evicted[0] == ("call-1", "lru")
+    assert "call-0" in store and "call-7" in store
+    assert stats["evicted_lru"] == len(evicted)
+    # Explicit removal is not an eviction
+    store.pop("call-7")
+    assert store.stats()["evicted_lru"] == len(evicted)
+
+if __name__ == "__main__":
+    test_turn_history_reads_like_tuples()
+    test_idle_sessions_expire()
+    test_size_cap_evicts_least_recently_used()
+    print("All tests passed!")
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+import subprocess
+import logging
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.model_registry import ModelRegistry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["torch", "whisper", "llama_cpp", "transformers", "pyttsx3"]
+
+def test_importing_agent_services_loads_no_models():
+    """Test that importing server.agent_services loads no model library and creates no database."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "startup.db")
+        env = dict(os.environ, CLINICGUARD_DB_PATH=f"sqlite:///{db_file}")
+        code = (
+            "import sys, json, server.agent_services as a; "
+            f"print(json.dumps({{'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules], "
+            "'models': a.model_registry.status()}))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        assert report["heavy"] == []
+        assert not any(model["loaded"] for model in report["models"].values())
+        assert not os.path.exists(db_file)
+
+def test_registry_loads_once_under_concurrency():
+    """Test that concurrent first callers share a single load."""
+    registry = ModelRegistry()
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    registry.register("model", loader)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(registry.get("model"))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert registry.status()["model"]["available"]
+
+def test_failed_load_reports_unavailable_model():
+    """Test that a failing loader is reported instead of raising, and warmup skips it."""
+    registry = ModelRegistry()
+    warmed = []
+
+    def loader():
+        raise RuntimeError("no GPU")
+
+    registry.register("broken", loader, warmup=warmed.append)
+    registry.warmup(["broken"])
+
+    assert registry.get("broken") is None
+    assert warmed == []
+    assert registry.status()["broken"]["error"] == "no GPU"
+
+if __name__ == "__main__":
+    test_importing_agent_services_loads_no_models()
+    test_registry_loads_once_under_concurrency()
+    test_failed_load_reports_unavailable_model()
@@ -0,0 +1,110 @@
+import os
+import sys
+import asyncio
+import logging
+import tempfile
+import threading
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.utils import pop_complete_sentences, split_sentences
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_sentences_are_released_as_tokens_arrive():
+    """Test that finished sentences are split off while the tail is kept for more tokens."""
+    buffer = ""
+    released = []
+    for token in ["Sure", ", I can", " help.", " Is Dr.", " Mehta", " okay?", " We", " open at 9"]:
+        buffer += token
+        complete, buffer = pop_complete_sentences(buffer)
+        released.extend(complete)
+    
+    assert released == ["Sure, I can help.", "Is Dr. Mehta okay?"]
+    assert buffer.strip() == "We open at 9"
+
+def test_split_sentences_keeps_trailing_fragment():
+    """Test splitting a complete reply, including text without a final terminator."""
+    assert split_sentences("Your visit is at 5 p.m. tomorrow. See you then") == [
+        "Your visit is at 5 p.m. tomorrow.",
+        "See you then",
+    ]
+    assert split_sentences("   ") == []
+
+def test_tts_chunks_follow_sentence_boundaries():
+    """Test that TTS chunks never cut a sentence unless it alone exceeds the limit."""
+    from server.tts_handler import chunk_text
+    
+    assert chunk_text("One two. Three four five! Six.", max_chars=20) == ["One two.", "Three four five!", "Six."]
+    assert chunk_text("One two. Six.", max_chars=20) == ["One two. Six."]
+    long_sentence = chunk_text("word " * 10, max_chars=20)
+    assert all(len(chunk) <= 20 for chunk in long_sentence)
+    assert " ".join(long_sentence) == " ".join(["word"] * 10)
+
+class GatedLlama:
+    """Fake local model that streams one sentence, then waits for the test before streaming the rest."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.finished = threading.Event()
+
+    def tokenize(self, data, add_bos=False):
+        return data.split()
+
+    def __call__(self, prompt, max_tokens, temperature, stop, stream=False):
+        def tokens():
+            for piece in ["Sure", ", I can", " help.", " What"]:
+                yield {"choices": [{"text": piece}]}
+            assert self.release.wait(5), "generation was not released"
+            for piece in [" day", " suits", " you?"]:
+                yield {"choices": [{"text": piece}]}
+            self.finished.set()
+        return tokens()
+
+def _install_fake_llama(monkeypatch):
+    import server.agent_services as agent_services
+
+    llm = GatedLlama()
+    monkeypatch.setattr(agent_services, "LLM_BACKEND", "local")
+    monkeypatch.setattr(agent_services, "get_llama", lambda: llm)
+    monkeypatch.setattr(agent_services, "_restore_prefix_state", lambda llm, session_id=None: None)
+    return agent_services, llm
+
+def test_first_sentence_is_yielded_before_generation_finishes(monkeypatch):
+    """Test that generate_response_stream hands over the first sentence while later tokens are still pending."""
+    agent_services, llm = _install_fake_llama(monkeypatch)
+    stream = agent_services.generate_response_stream("Can I book a visit?")
+    assert next(stream) == "Sure, I can help."
+    assert not llm.finished.is_set()
+    llm.release.set()
+    assert list(stream) == ["What day suits you?"]
+    assert llm.finished.is_set()
+
+def test_first_sentence_is_synthesized_before_generation_finishes(monkeypatch):
+    """Test that astream_speech writes the first sentence's audio while the model is still generating."""
+    agent_services, llm = _install_fake_llama(monkeypatch)
+
+    def fake_tts(text, output_path):
+        with open(output_path, "w") as f:
+            f.write(text)
+
+    monkeypatch.setattr(agent_services, "text_to_speech", fake_tts)
+
+    async def run(output_dir):
+        received = []
+        async for sentence, path in agent_services.astream_speech("Can I book a visit?", output_dir, "reply"):
+            received.append((sentence, os.path.exists(path), llm.finished.is_set()))
+            llm.release.set()
+        return received
+
+    with tempfile.TemporaryDirectory() as tmp:
+        received = asyncio.run(run(tmp))
+    assert received[0] == ("Sure, I can help.", True, False)
+    assert [sentence for sentence, _, _ in received] == ["Sure, I can help.", "What day suits you?"]
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,82 @@
+import os
+import sys
+import types
+import tempfile
+import logging
+
+import numpy as np
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server.agent_services as agent_services
+from server.audio_codec import TWILIO_SAMPLE_RATE, WHISPER_SAMPLE_RATE, write_wav
+from server.stt_engines import FasterWhisperEngine, load_stt_engine
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeWhisperModel:
+    """Stand-in for faster_whisper.WhisperModel that yields two segments lazily."""
+    created = []
+
+    def __init__(self, model_name, **options):
+        self.options = options
+        type(self).created.append((model_name, options))
+
+    def transcribe(self, audio, **options):
+        assert audio.dtype == np.float32
+        segments = (types.SimpleNamespace(text=text) for text in [" Hi, I'd like to book", " an appointment."])
+        return segments, types.SimpleNamespace(language=options.get("language"))
+
+class RecordingEngine:
+    name = "recording"
+
+    def __init__(self):
+        self.inputs = []
+
+    def transcribe(self, audio):
+        self.inputs.append(audio)
+        return "hello"
+
+def test_unknown_engine_is_rejected():
+    """Test that a typo in CLINICGUARD_STT_ENGINE fails loudly instead of loading a default."""
+    try:
+        load_stt_engine("whisper-turbo")
+        raise AssertionError("expected ValueError")
+    except ValueError as e:
+        assert "faster-whisper" in str(e)
+
+def test_faster_whisper_engine_transcribes_with_int8(monkeypatch):
+    """Test that the CTranslate2 engine loads int8 weights and joins its segments."""
+    monkeypatch.setitem(sys.modules, "faster_whisper", types.SimpleNamespace(WhisperModel=FakeWhisperModel))
+    FakeWhisperModel.created = []
+    engine = FasterWhisperEngine("base", num_workers=2)
+
+    text = engine.transcribe(np.zeros(2 * WHISPER_SAMPLE_RATE, dtype=np.float64))
+    assert text == "Hi, I'd like to book an appointment."
+    model_name, options = FakeWhisperModel.created[0]
+    assert model_name == "base"
+    assert options["compute_type"] == "int8" and options["device"] == "cpu" and options["num_workers"] == 2
+    stats = engine.stats()
+    assert stats["requests"] == 1 and stats["queued"] == 0
+    assert stats["real_time_factor"] >= 0.0
+
+def test_transcribe_audio_decodes_files_without_openai_whisper(monkeypatch):
+    """Test that file input is decoded in process and handed to whichever engine is loaded."""
+    engine = RecordingEngine()
+    monkeypatch.setattr(agent_services, "get_stt_engine", lambda: engine)
+    monkeypatch.setitem(sys.modules, "whisper", None)
+    tone = (0.3 * np.sin(2 * np.pi * 220 * np.arange(TWILIO_SAMPLE_RATE) / TWILIO_SAMPLE_RATE)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "turn.wav")
+        with open(path, "wb") as f:
+            f.write(write_wav(tone, TWILIO_SAMPLE_RATE))
+        assert agent_services.transcribe_audio(path) == "hello"
+    assert engine.inputs[0].dtype == np.float32
+    assert engine.inputs[0].size == WHISPER_SAMPLE_RATE
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+# Add project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.tts_cache import TTSCache, cache_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_key_normalizes_whitespace_and_separates_voices():
+    """Test that the cache key ignores whitespace noise but not voice, engine or format."""
+    base = cache_key("Could you confirm your date of birth?", "v1", "say", "wav")
+    assert cache_key("  Could you confirm   your date of birth? ", "v1", "say", "wav") == base
+    assert cache_key("Could you confirm your date of birth?", "v2", "say", "wav") != base
+    assert cache_key("Could you confirm your date of birth?", "v1", "elevenlabs", "wav") != base
+    assert cache_key("Could you confirm your date of birth?", "v1", "say", "mp3") != base
+
+def test_memory_and_disk_tiers(tmp_path):
+    """Test LRU eviction in memory and that evicted entries are still served from disk."""
+    cache = TTSCache(str(tmp_path), max_memory_bytes=10, max_disk_bytes=1000)
+    calls = []
+
+    def synth(data):
+        def run():
+            calls.append(data)
+            return data
+        return run
+
+    assert cache.get_or_create("hello", "v", "say", "wav", synth(b"aaaaaa")) == b"aaaaaa"
+    assert cache.get_or_create("bye", "v", "say", "wav", synth(b"bbbbbb")) == b"bbbbbb"
+    # 'hello' fell out of the 10-byte memory tier but is on disk
+    assert cache.get_or_create("hello", "v", "say", "wav", synth(b"xxxxxx")) == b"aaaaaa"
+    assert calls == [b"aaaaaa", b"bbbbbb"]
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1 and stats["misses"] == 2
+
+    # A fresh instance indexes the existing files
+    reopened = TTSCache(str(tmp_path), max_memory_bytes=10, max_disk_bytes=1000)
+    assert reopened.stats()["disk_entries"] == 2
+
+def test_disk_tier_is_size_bounded(tmp_path):
+    """Test that the least recently used files are deleted above the disk budget."""
+    cache = TTSCache(str(tmp_path), max_memory_bytes=0, max_disk_bytes=10)
+    for text in ["one", "two", "three"]:
+        cache.get_or_create(text, "v", "say", "wav", lambda: b"12345")
+    assert cache.stats()["disk_bytes"] <= 10
+    assert len(list(tmp_path.glob("*.audio"))) == 2
+
+def test_concurrent_identical_requests_share_one_synthesis(tmp_path):
+    """Test in-flight coalescing of identical requests."""
+    cache = TTSCache(str(tmp_path), max_memory_bytes=1000, max_disk_bytes=1000)
+    calls = []
+
+    def synthesize():
+        calls.append(1)
+        time.sleep(0.1)
+        return b"audio"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_create("Goodbye!", "v", "say", "wav", synthesize)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [b"audio"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4